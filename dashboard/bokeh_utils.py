@@ -1,14 +1,16 @@
 import datetime
 import logging
-from math import pi
+from math import pi, log2
 from bokeh.plotting import figure, show
 from bokeh.embed import components
-from bokeh.models import DatetimeTickFormatter, ColumnDataSource, Arc, Plot, Range1d
+from bokeh.models import DatetimeTickFormatter, ColumnDataSource, Arc, Plot, Range1d, HoverTool
+
+from .mqtt import geo
 
 
 class GaugeMixin:
     def value_to_gauge_angle(self, value, max_value):
-        ratio = value/max_value
+        ratio = min(max(value/max_value, 0), 1)
         raw_angle = ratio * pi
         return pi - raw_angle
 
@@ -33,7 +35,8 @@ class BokehPlot(GaugeMixin):
             # context_which="start"
         )
 
-    def create_figure(self, title=None, x_label=None, y_label=None, x_axis_type="linear", y_axis_type="linear"):
+    def create_figure(self, title=None, x_label=None, y_label=None, x_axis_type="linear", y_axis_type="linear",
+                      height=360):
         self.figure = figure(
             title=title,
             x_axis_label=x_label,
@@ -41,7 +44,7 @@ class BokehPlot(GaugeMixin):
             x_axis_type=x_axis_type,
             y_axis_type=y_axis_type,
             sizing_mode="stretch_width",
-            height=360
+            height=height
         )
 
     def scatter_plot(self, title=None, x_label=None, y_label=None, x_axis_type="linear", y_axis_type="linear"):
@@ -56,12 +59,12 @@ class BokehPlot(GaugeMixin):
             self.figure.circle(x="x_values", y="y_values", source=self.data_source, fill_color="gray",
                                size=5)
 
-    def gauge_plot(self, value, max_value):
-        x_range = Range1d(-pi, pi)
+    def gauge_plot(self, value, max_value, height=200):
         current_angle = self.value_to_gauge_angle(value, max_value)
         self.create_figure(
             x_axis_type=None,
-            y_axis_type=None
+            y_axis_type=None,
+            height=height
         )
         self.figure.x_range = Range1d(-100, 100)
         self.figure.y_range = Range1d(-50, 100)
@@ -95,9 +98,34 @@ class BokehPlot(GaugeMixin):
             text_align="center",
             text_font_style="bold",
             text_color="black",
-            text=[f"{value}/{max_value}"]
+            text=[f"{value:g}/{max_value:g}"]
         )
 
+    def map_plot(self, clusters, title=None, tile_provider="OpenStreetMap Mapnik"):
+        """
+        Clusters (see geo.cluster_pipeline) as circles sized by point count over web mercator tiles
+        """
+        if not clusters:
+            return
+
+        x_values, y_values = zip(*(geo.web_mercator(cluster["lon"], cluster["lat"]) for cluster in clusters))
+        source = ColumnDataSource({
+            "x": x_values,
+            "y": y_values,
+            "count": [cluster["count"] for cluster in clusters],
+            "size": [8 + 4 * log2(cluster["count"]) for cluster in clusters],
+            "label": [str(cluster["count"]) if cluster["count"] > 1 else "" for cluster in clusters],
+            "device": [cluster.get("device") or "" for cluster in clusters],
+        })
+        self.create_figure(title, x_axis_type="mercator", y_axis_type="mercator")
+        self.figure.match_aspect = True
+        self.figure.add_tile(tile_provider)
+        self.figure.circle(x="x", y="y", size="size", source=source, fill_color="#1e87f0", fill_alpha=0.6,
+                           line_color="white")
+        self.figure.text(x="x", y="y", text="label", source=source, text_align="center", text_baseline="middle",
+                         text_font_size="9pt", text_color="white")
+        self.figure.add_tools(HoverTool(tooltips=[("Count", "@count"), ("Device", "@device")]))
+
     def get_components(self):
         if self.figure:
             return components(self.figure)
@@ -0,0 +1,221 @@
+import csv
+import json
+import logging
+
+from .models import DataObject
+from . import utils
+
+
+class ChunkSink:
+    """
+    Write-only file object collecting bytes written by pyarrow writers, drained between batches
+    """
+    def __init__(self):
+        self.chunks = list()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class BaseExporter:
+    """
+    Export rows of (timestamp, value1, value2, ...) incrementally.
+    Columns are (name, data_type) tuples, data_type being one of DataObject.DATA_TYPE_*
+    """
+    content_type = None
+    extension = None
+    compressible = True
+    batch_size = 500
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def iter_batches(self, rows):
+        batch = list()
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = list()
+
+        if batch:
+            yield batch
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+
+class CSVExporter(BaseExporter):
+    content_type = "text/csv"
+    extension = "csv"
+
+    def stream(self, rows):
+        csv_writer = csv.writer(utils.CSVFileRowEcho())
+        yield csv_writer.writerow(["timestamp"] + [name for name, _ in self.columns])
+        for batch in self.iter_batches(rows):
+            yield "".join(
+                csv_writer.writerow([f"{row[0]}"] + ["" if val is None else f"{val}" for val in row[1:]])
+                for row in batch
+            )
+
+
+class NDJSONExporter(BaseExporter):
+    content_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def stream(self, rows):
+        names = [name for name, _ in self.columns]
+        encoder = json.JSONEncoder(separators=(",", ":"), default=str)
+        for batch in self.iter_batches(rows):
+            lines = list()
+            for row in batch:
+                line = {"timestamp": row[0].isoformat()}
+                for name, val in zip(names, row[1:]):
+                    if val is not None:
+                        line[name] = val
+                lines.append(encoder.encode(line))
+
+            yield "\n".join(lines) + "\n"
+
+
+class ArrowExporter(BaseExporter):
+    content_type = "application/vnd.apache.arrow.stream"
+    extension = "arrow"
+    compressible = False
+    batch_size = 65536
+
+    def __init__(self, columns):
+        super().__init__(columns)
+        # Values left out (null) because they do not convert to their column type
+        self.dropped = 0
+
+    @classmethod
+    def is_available(cls):
+        return utils.is_installed("pyarrow")
+
+    def get_arrow_type(self, data_type):
+        import pyarrow
+
+        if data_type == DataObject.DATA_TYPE_NUMBER:
+            return pyarrow.float64()
+        elif data_type == DataObject.DATA_TYPE_BOOLEAN:
+            return pyarrow.bool_()
+
+        return pyarrow.string()
+
+    def get_schema(self):
+        import pyarrow
+
+        fields = [pyarrow.field("timestamp", pyarrow.timestamp("us"))]
+        for name, data_type in self.columns:
+            fields.append(pyarrow.field(name, self.get_arrow_type(data_type)))
+
+        return pyarrow.schema(fields)
+
+    def to_record_batch(self, schema, batch):
+        import pyarrow
+
+        arrays = list()
+        for i, field in enumerate(schema):
+            column = [row[i] for row in batch]
+            if pyarrow.types.is_string(field.type):
+                column = [None if val is None else str(val) for val in column]
+
+            try:
+                arrays.append(pyarrow.array(column, type=field.type))
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                arrays.append(self.to_array_by_value(field, column))
+
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def to_array_by_value(self, field, column):
+        """
+        Convert a column value by value, values that do not fit the column type become null
+        """
+        import pyarrow
+
+        values = list()
+        dropped = 0
+        for val in column:
+            try:
+                values.append(pyarrow.scalar(val, type=field.type))
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, TypeError, ValueError):
+                values.append(pyarrow.scalar(None, type=field.type))
+                dropped += 1
+
+        self.dropped += dropped
+        logging.debug(f"Column {field.name}: {dropped} of {len(column)} values do not convert to {field.type}")
+        return pyarrow.array(values, type=field.type)
+
+    def get_writer(self, sink, schema):
+        import pyarrow.ipc
+
+        options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+        return pyarrow.ipc.new_stream(sink, schema, options=options)
+
+    def stream(self, rows):
+        schema = self.get_schema()
+        sink = ChunkSink()
+        writer = self.get_writer(sink, schema)
+        for batch in self.iter_batches(rows):
+            writer.write_batch(self.to_record_batch(schema, batch))
+            yield sink.drain()
+
+        writer.close()
+        if self.dropped:
+            logging.warning(f"Export left out {self.dropped} values not matching their column type")
+        yield sink.drain()
+
+
+class ParquetExporter(ArrowExporter):
+    content_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def get_writer(self, sink, schema):
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+
+
+EXPORTERS = {
+    "csv": CSVExporter,
+    "ndjson": NDJSONExporter,
+    "arrow": ArrowExporter,
+    "parquet": ParquetExporter,
+}
+
+
+def get_exporter_class(export_format):
+    """
+    Get exporter class for format
+    @param export_format: one of EXPORTERS keys
+    @return: exporter class or None if unknown/unavailable
+    """
+    exporter_class = EXPORTERS.get(str(export_format).lower(), None)
+    if exporter_class is None or not exporter_class.is_available():
+        return None
+
+    return exporter_class
@@ -1,6 +1,10 @@
+import struct
+
 from django import forms
 
-from .models import Topic, DataObject
+from .models import Topic, DataObject, AlertRule
+from .mqtt.payload import compile_key_path
+from .mqtt.expressions import parse_expression, check_name, ExpressionError, MAX_EXPRESSION_LENGTH
 
 
 class NewProjectForm(forms.Form):
@@ -18,6 +22,18 @@ class NewTopicForm(forms.Form):
     path = forms.CharField(label="path", max_length=64)
     sub = forms.CharField(max_length=5, label="sub")
     qos = forms.ChoiceField(choices=Topic.QOS_CHOICES, label="qos")
+    dedup_window = forms.FloatField(label="dedup_window", min_value=0, required=False)
+    dedup_key = forms.CharField(label="dedup_key", max_length=128, required=False)
+
+    def clean_dedup_key(self):
+        dedup_key = self.cleaned_data["dedup_key"]
+        if dedup_key:
+            try:
+                compile_key_path(dedup_key)
+            except ValueError as e:
+                raise forms.ValidationError(str(e))
+
+        return dedup_key
 
 
 class NewDataObjectForm(forms.Form):
@@ -26,6 +42,99 @@ class NewDataObjectForm(forms.Form):
     data_type = forms.ChoiceField(label="data_type", choices=DataObject.DATA_TYPE_CHOICES)
     path = forms.CharField(label="path", max_length=64, required=False)
     format = forms.ChoiceField(label="format", choices=DataObject.FORMAT_CHOICES)
-    key = forms.CharField(label="key", max_length=32, required=False)
+    key = forms.CharField(label="key", max_length=128, required=False)
+    struct_format = forms.CharField(label="struct_format", max_length=32, required=False)
+    struct_offset = forms.IntegerField(label="struct_offset", min_value=0, required=False)
+    deadband = forms.FloatField(label="deadband", min_value=0, required=False)
+    deadband_type = forms.ChoiceField(label="deadband_type", choices=DataObject.DEADBAND_TYPE_CHOICES, required=False)
+    min_interval = forms.FloatField(label="min_interval", min_value=0, required=False)
+    heartbeat = forms.FloatField(label="heartbeat", min_value=0, required=False)
+    gauge_max = forms.FloatField(label="gauge_max", min_value=0, required=False)
+    source = forms.IntegerField(label="source", required=False)
+    operator = forms.ChoiceField(label="operator", choices=DataObject.OPERATOR_CHOICES, required=False)
+    operator_param = forms.FloatField(label="operator_param", required=False)
+    expression = forms.CharField(label="expression", max_length=MAX_EXPRESSION_LENGTH, required=False)
     widget_type = forms.ChoiceField(label="widget_type", choices=DataObject.WIDGET_TYPE_CHOICES)
 
+    def __init__(self, *args, current_name=None, **kwargs):
+        """
+        @param current_name: name of the edited data object, kept even if it predates the naming rules
+        """
+        super().__init__(*args, **kwargs)
+        self.current_name = current_name
+
+    def clean_name(self):
+        name = self.cleaned_data["name"]
+        if name != self.current_name:
+            try:
+                check_name(name)
+            except ExpressionError as e:
+                raise forms.ValidationError(str(e))
+
+        return name
+
+    def clean_key(self):
+        key = self.cleaned_data["key"]
+        if key:
+            try:
+                compile_key_path(key)
+            except ValueError:
+                raise forms.ValidationError("Invalid key path")
+
+        return key
+
+    def clean_expression(self):
+        expression = self.cleaned_data["expression"]
+        if expression:
+            try:
+                parse_expression(expression)
+            except ExpressionError as e:
+                raise forms.ValidationError(str(e))
+
+        return expression
+
+    def clean_struct_format(self):
+        struct_format = self.cleaned_data["struct_format"]
+        if struct_format:
+            try:
+                struct.calcsize(struct_format)
+            except struct.error:
+                raise forms.ValidationError("Invalid struct format")
+
+        return struct_format
+
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("format") != DataObject.FORMAT_CHOICE_DERIVED:
+            return cleaned_data
+
+        operator = cleaned_data.get("operator")
+        param = cleaned_data.get("operator_param")
+        if not cleaned_data.get("source") or not operator:
+            raise forms.ValidationError("Source and operator required for derived types")
+        if operator in DataObject.WINDOW_OPERATORS and (param is None or param < 1 or param != int(param)):
+            self.add_error("operator_param", "Window size (whole number of samples) required")
+        if operator == DataObject.OPERATOR_EWMA and (param is None or not 0 < param <= 1):
+            self.add_error("operator_param", "Alpha between 0 and 1 required")
+
+        return cleaned_data
+
+
+class NewAlertRuleForm(forms.Form):
+    name = forms.CharField(label="name", max_length=32)
+    desc = forms.CharField(label="desc", max_length=256, required=False)
+    rule_type = forms.ChoiceField(label="rule_type", choices=AlertRule.RULE_CHOICES)
+    threshold = forms.FloatField(label="threshold", required=False)
+    hysteresis = forms.FloatField(label="hysteresis", min_value=0, required=False)
+    timeout = forms.FloatField(label="timeout", min_value=0, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("rule_type") == AlertRule.RULE_NO_DATA:
+            if not cleaned_data.get("timeout"):
+                self.add_error("timeout", "Timeout required for no data rules")
+        elif cleaned_data.get("rule_type") and cleaned_data.get("threshold") is None:
+            self.add_error("threshold", "Threshold required")
+
+        return cleaned_data
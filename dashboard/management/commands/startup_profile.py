@@ -0,0 +1,101 @@
+import json
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+DEFAULT_MODULES = [
+    "dashboard.views",
+    "dashboard.urls",
+    "dashboard.mongodb.db_utils",
+    "dashboard.mongodb.async_db_utils",
+    "dashboard.mqtt.client",
+    "dashboard.bokeh_utils",
+    "dashboard.exporters",
+    "dashboard.timeseries",
+    "pymongo",
+    "motor.motor_asyncio",
+    "paho.mqtt.client",
+    "bokeh.plotting",
+    "numpy",
+    "pyarrow",
+    "channels.layers",
+]
+
+# Runs in a fresh interpreter so every measurement is a cold import
+IMPORT_SCRIPT = """
+import importlib, json, os, sys, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", {settings!r})
+import django
+django.setup()
+before = set(sys.modules)
+start = time.perf_counter()
+try:
+    importlib.import_module({module!r})
+    error = None
+except Exception as e:
+    error = repr(e)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "modules": len(set(sys.modules) - before), "error": error}}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Report cold import and initialisation time of the modules loaded at startup"
+
+    def add_arguments(self, parser):
+        parser.add_argument("modules", nargs="*", help="Modules to profile (default: dashboard startup set)")
+        parser.add_argument("--init", action="store_true",
+                            help="Also time client initialisation (mongodb client, MQTT manager, plots)")
+
+    def profile_import(self, module):
+        from django.conf import settings
+
+        script = IMPORT_SCRIPT.format(settings=settings.SETTINGS_MODULE, module=module)
+        res = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+        try:
+            return json.loads(res.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            return {"elapsed": 0.0, "modules": 0, "error": res.stderr.strip().splitlines()[-1:]}
+
+    def time_call(self, name, func):
+        start = time.perf_counter()
+        try:
+            func()
+            error = ""
+        except Exception as e:
+            error = repr(e)
+
+        self.stdout.write(f"{name:<40} {(time.perf_counter() - start) * 1000:>10.1f} ms {error}")
+
+    def profile_init(self):
+        from dashboard import mongodb
+        from dashboard.mqtt import mqtt_client_manager
+
+        def create_plot():
+            from dashboard.bokeh_utils import BokehPlot
+            plot = BokehPlot(x_list=[0, 1], y_list=[0, 1])
+            plot.line_plot()
+            plot.get_components()
+
+        self.stdout.write(f"\n{'Initialisation':<40} {'time':>13}")
+        self.time_call("mongodb client", mongodb.get_mongodb_client)
+        self.time_call("mqtt client manager", lambda: mqtt_client_manager.get_client_count())
+        self.time_call("bokeh plot", create_plot)
+
+    def handle(self, *args, **options):
+        modules = options["modules"] or DEFAULT_MODULES
+        self.stdout.write(f"{'Module (cold import)':<40} {'time':>13} {'new modules':>12}")
+        total = 0.0
+        for module in modules:
+            res = self.profile_import(module)
+            total += res["elapsed"]
+            line = f"{module:<40} {res['elapsed'] * 1000:>10.1f} ms {res['modules']:>12}"
+            if res["error"]:
+                line += f"  ({res['error']})"
+            self.stdout.write(line)
+
+        self.stdout.write(f"{'sum':<40} {total * 1000:>10.1f} ms")
+        if options["init"]:
+            self.profile_init()
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:07
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_alter_dataobject_widget_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataobject',
+            name='struct_format',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataobject',
+            name='struct_offset',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dataobject',
+            name='data_type',
+            field=models.CharField(choices=[('NUM', 'Number'), ('STR', 'String'), ('LOC', 'Location(Disabled)'), ('BOOL', 'Boolean')], max_length=5),
+        ),
+        migrations.AlterField(
+            model_name='dataobject',
+            name='format',
+            field=models.CharField(choices=[('JSON', 'JSON'), ('SINGL', 'Single Variable'), ('CBOR', 'CBOR'), ('MSGPK', 'MessagePack'), ('STRCT', 'Packed Struct')], max_length=5),
+        ),
+        migrations.AlterField(
+            model_name='dataobject',
+            name='widget_type',
+            field=models.CharField(choices=[('SCATTER', 'Scatter Plot'), ('LINE', 'Line plot'), ('STATUS', 'Status Indicator(Disabled)'), ('MAP', 'Map(Disabled)')], default='LINE', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 7, 19, 237444)),
+        ),
+    ]
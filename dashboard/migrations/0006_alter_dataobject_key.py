@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:08
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_dataobject_binary_formats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataobject',
+            name='key',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 8, 26, 917915)),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:09
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_alter_dataobject_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataobject',
+            name='deadband',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataobject',
+            name='deadband_type',
+            field=models.CharField(choices=[('ABS', 'Absolute'), ('REL', 'Relative (%)')], default='ABS', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='dataobject',
+            name='heartbeat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataobject',
+            name='min_interval',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 9, 28, 869057)),
+        ),
+    ]
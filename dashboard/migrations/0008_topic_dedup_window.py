@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:10
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_dataobject_ingest_filters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='dedup_window',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 10, 6, 332073)),
+        ),
+    ]
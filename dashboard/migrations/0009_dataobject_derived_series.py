@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:11
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_topic_dedup_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataobject',
+            name='operator',
+            field=models.CharField(blank=True, choices=[('MA', 'Moving Average (window)'), ('EWMA', 'EWMA (alpha)'), ('DERIV', 'Derivative (per second)'), ('RATE', 'Counter Rate (per second)'), ('MIN', 'Rolling Min (window)'), ('MAX', 'Rolling Max (window)')], max_length=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataobject',
+            name='operator_param',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataobject',
+            name='source',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='derived', to='dashboard.dataobject'),
+        ),
+        migrations.AlterField(
+            model_name='dataobject',
+            name='format',
+            field=models.CharField(choices=[('JSON', 'JSON'), ('SINGL', 'Single Variable'), ('CBOR', 'CBOR'), ('MSGPK', 'MessagePack'), ('STRCT', 'Packed Struct'), ('DERIV', 'Derived')], max_length=5),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 11, 8, 828330)),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:12
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_dataobject_derived_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataobject',
+            name='expression',
+            field=models.CharField(blank=True, max_length=256, null=True),
+        ),
+        migrations.AlterField(
+            model_name='dataobject',
+            name='format',
+            field=models.CharField(choices=[('JSON', 'JSON'), ('SINGL', 'Single Variable'), ('CBOR', 'CBOR'), ('MSGPK', 'MessagePack'), ('STRCT', 'Packed Struct'), ('DERIV', 'Derived'), ('EXPR', 'Expression')], max_length=5),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 12, 33, 642460)),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:13
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_dataobject_expression'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 13, 29, 128086)),
+        ),
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32)),
+                ('description', models.TextField(max_length=256)),
+                ('rule_type', models.CharField(choices=[('ABOVE', 'Above threshold'), ('BELOW', 'Below threshold'), ('RATE', 'Rate of change above threshold (per second)'), ('NODAT', 'No data for timeout seconds')], max_length=5)),
+                ('threshold', models.FloatField(blank=True, null=True)),
+                ('hysteresis', models.FloatField(default=0)),
+                ('timeout', models.FloatField(blank=True, null=True)),
+                ('enabled', models.BooleanField(default=True)),
+                ('data_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='dashboard.dataobject')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
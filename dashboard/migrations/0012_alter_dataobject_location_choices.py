@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:18
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_alertrule'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataobject',
+            name='data_type',
+            field=models.CharField(choices=[('NUM', 'Number'), ('STR', 'String'), ('LOC', 'Location'), ('BOOL', 'Boolean')], max_length=5),
+        ),
+        migrations.AlterField(
+            model_name='dataobject',
+            name='widget_type',
+            field=models.CharField(choices=[('SCATTER', 'Scatter Plot'), ('LINE', 'Line plot'), ('STATUS', 'Status Indicator(Disabled)'), ('MAP', 'Map')], default='LINE', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 18, 18, 292058)),
+        ),
+    ]
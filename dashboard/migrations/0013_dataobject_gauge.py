@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:21
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_alter_dataobject_location_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataobject',
+            name='gauge_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='dataobject',
+            name='widget_type',
+            field=models.CharField(choices=[('SCATTER', 'Scatter Plot'), ('LINE', 'Line plot'), ('STATUS', 'Status Indicator'), ('MAP', 'Map'), ('GAUGE', 'Gauge')], default='LINE', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 21, 4, 183827)),
+        ),
+    ]
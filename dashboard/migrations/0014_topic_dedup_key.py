@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-19 04:53
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0013_dataobject_gauge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='dedup_key',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='created_date',
+            field=models.DateTimeField(default=datetime.datetime(2026, 10, 19, 4, 53, 27, 514225)),
+        ),
+    ]
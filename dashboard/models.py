@@ -44,15 +44,29 @@ class Topic(BaseModel):
     sub = models.BooleanField(default=True)
     pub = models.BooleanField(default=False)
     qos = models.IntegerField(default=0, choices=QOS_CHOICES)
+    # Seconds a QoS 1/2 message (topic and payload) is remembered to drop broker redeliveries, 0 disables
+    dedup_window = models.FloatField(default=0)
+    # Key path of a device timestamp or sequence number identifying a message instead of its payload
+    dedup_key = models.CharField(max_length=128, blank=True, default="")
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
 
 
 class DataObject(BaseModel):
     FORMAT_CHOICE_JSON = "JSON"
     FORMAT_CHOICE_SINGLE_VARIABLE = "SINGL"
+    FORMAT_CHOICE_CBOR = "CBOR"
+    FORMAT_CHOICE_MSGPACK = "MSGPK"
+    FORMAT_CHOICE_STRUCT = "STRCT"
+    FORMAT_CHOICE_DERIVED = "DERIV"
+    FORMAT_CHOICE_EXPRESSION = "EXPR"
     FORMAT_CHOICES = [
         (FORMAT_CHOICE_JSON, "JSON"),
         (FORMAT_CHOICE_SINGLE_VARIABLE, "Single Variable"),
+        (FORMAT_CHOICE_CBOR, "CBOR"),
+        (FORMAT_CHOICE_MSGPACK, "MessagePack"),
+        (FORMAT_CHOICE_STRUCT, "Packed Struct"),
+        (FORMAT_CHOICE_DERIVED, "Derived"),
+        (FORMAT_CHOICE_EXPRESSION, "Expression"),
     ]
 
     DATA_TYPE_NUMBER = "NUM"
@@ -62,24 +76,96 @@ class DataObject(BaseModel):
     DATA_TYPE_CHOICES = [
         (DATA_TYPE_NUMBER, "Number"),
         (DATA_TYPE_STRING, "String"),
-        (DATA_TYPE_LOCATION, "Location(Disabled)"),
+        (DATA_TYPE_LOCATION, "Location"),
         (DATA_TYPE_BOOLEAN, "Boolean"),
     ]
 
+    DEADBAND_ABSOLUTE = "ABS"
+    DEADBAND_RELATIVE = "REL"
+    DEADBAND_TYPE_CHOICES = [
+        (DEADBAND_ABSOLUTE, "Absolute"),
+        (DEADBAND_RELATIVE, "Relative (%)"),
+    ]
+
+    OPERATOR_MOVING_AVERAGE = "MA"
+    OPERATOR_EWMA = "EWMA"
+    OPERATOR_DERIVATIVE = "DERIV"
+    OPERATOR_RATE = "RATE"
+    OPERATOR_MIN = "MIN"
+    OPERATOR_MAX = "MAX"
+    OPERATOR_CHOICES = [
+        (OPERATOR_MOVING_AVERAGE, "Moving Average (window)"),
+        (OPERATOR_EWMA, "EWMA (alpha)"),
+        (OPERATOR_DERIVATIVE, "Derivative (per second)"),
+        (OPERATOR_RATE, "Counter Rate (per second)"),
+        (OPERATOR_MIN, "Rolling Min (window)"),
+        (OPERATOR_MAX, "Rolling Max (window)"),
+    ]
+    WINDOW_OPERATORS = (OPERATOR_MOVING_AVERAGE, OPERATOR_MIN, OPERATOR_MAX)
+
     WIDGET_TYPE_SCATTER = "SCATTER"
     WIDGET_TYPE_LINE = "LINE"
     WIDGET_TYPE_STATUS = "STATUS"
     WIDGET_TYPE_MAP = "MAP"
+    WIDGET_TYPE_GAUGE = "GAUGE"
     WIDGET_TYPE_CHOICES = [
         (WIDGET_TYPE_SCATTER, "Scatter Plot"),
         (WIDGET_TYPE_LINE, "Line plot"),
-        (WIDGET_TYPE_STATUS, "Status Indicator(Disabled)"),
-        (WIDGET_TYPE_MAP, "Map(Disabled)")
+        (WIDGET_TYPE_STATUS, "Status Indicator"),
+        (WIDGET_TYPE_MAP, "Map"),
+        (WIDGET_TYPE_GAUGE, "Gauge"),
     ]
+    # Latest value widgets, rendered from the latest value index instead of the time series
+    LATEST_VALUE_WIDGETS = (WIDGET_TYPE_STATUS, WIDGET_TYPE_GAUGE)
 
     format = models.CharField(max_length=5, choices=FORMAT_CHOICES)
     data_type = models.CharField(max_length=5, choices=DATA_TYPE_CHOICES)
     widget_type = models.CharField(max_length=10, choices=WIDGET_TYPE_CHOICES, default=WIDGET_TYPE_LINE)
     path = models.CharField(max_length=64, null=True, blank=True)
-    key = models.CharField(max_length=32, null=True, blank=True)
+    # Top level key or nested path, e.g. "sensors[0].value"
+    key = models.CharField(max_length=128, null=True, blank=True)
+    # Packed struct layout: python struct format (e.g. "<f") of the field at struct_offset bytes
+    struct_format = models.CharField(max_length=32, null=True, blank=True)
+    struct_offset = models.PositiveIntegerField(default=0)
+    # Ingest filters: store a sample only if it moved more than the deadband since the last stored one,
+    # at most every min_interval seconds, but at least every heartbeat seconds while messages arrive
+    deadband = models.FloatField(null=True, blank=True)
+    deadband_type = models.CharField(max_length=3, choices=DEADBAND_TYPE_CHOICES, default=DEADBAND_ABSOLUTE)
+    min_interval = models.FloatField(null=True, blank=True)
+    heartbeat = models.FloatField(null=True, blank=True)
+    # Derived series: operator applied to the samples of source (same topic), window size or alpha as parameter
+    source = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="derived")
+    operator = models.CharField(max_length=5, choices=OPERATOR_CHOICES, null=True, blank=True)
+    operator_param = models.FloatField(null=True, blank=True)
+    # Computed from other data objects of the same message, referenced by name, e.g. "voltage * current"
+    expression = models.CharField(max_length=256, null=True, blank=True)
+    # Full scale of the gauge widget
+    gauge_max = models.FloatField(null=True, blank=True)
     topic = models.ForeignKey(Topic, on_delete=models.CASCADE)
+
+    def is_derived(self):
+        return self.format == self.FORMAT_CHOICE_DERIVED
+
+    def is_expression(self):
+        return self.format == self.FORMAT_CHOICE_EXPRESSION
+
+
+class AlertRule(BaseModel):
+    RULE_ABOVE = "ABOVE"
+    RULE_BELOW = "BELOW"
+    RULE_RATE = "RATE"
+    RULE_NO_DATA = "NODAT"
+    RULE_CHOICES = [
+        (RULE_ABOVE, "Above threshold"),
+        (RULE_BELOW, "Below threshold"),
+        (RULE_RATE, "Rate of change above threshold (per second)"),
+        (RULE_NO_DATA, "No data for timeout seconds"),
+    ]
+
+    rule_type = models.CharField(max_length=5, choices=RULE_CHOICES)
+    threshold = models.FloatField(null=True, blank=True)
+    # Distance back across the threshold before a fired alert resolves
+    hysteresis = models.FloatField(default=0)
+    timeout = models.FloatField(null=True, blank=True)
+    enabled = models.BooleanField(default=True)
+    data_object = models.ForeignKey(DataObject, on_delete=models.CASCADE, related_name="alert_rules")
@@ -1,10 +1,125 @@
+import os
+import asyncio
+import logging
+import threading
 
-from pymongo import MongoClient
 from django.conf import settings
 
-mongodb_client = MongoClient(settings.MONGODB_CONNECTION_URI)
+_lock = threading.Lock()
+_mongodb_client = None
+# Motor clients are bound to the event loop they are used on: one client (and its handles) per running loop
+_async_clients = dict()
+_client_pid = None
+_handles = dict()
+
+
+def get_client_options():
+    return dict(getattr(settings, "MONGODB_CLIENT_OPTIONS", dict()))
+
+
+def reset_clients():
+    """
+    Drop clients and cached handles, used after fork so each process opens its own pool
+    """
+    global _mongodb_client, _client_pid
+    _mongodb_client = None
+    _client_pid = None
+    _handles.clear()
+    _async_clients.clear()
+
+
+def _check_pid():
+    if _client_pid is not None and _client_pid != os.getpid():
+        reset_clients()
+
+
+def get_mongodb_client():
+    """
+    Get the process wide MongoClient, created on first use
+    """
+    global _mongodb_client, _client_pid
+    _check_pid()
+    if _mongodb_client is None:
+        with _lock:
+            if _mongodb_client is None:
+                from pymongo import MongoClient
+                logging.debug("Create mongodb client")
+                _mongodb_client = MongoClient(settings.MONGODB_CONNECTION_URI, **get_client_options())
+                _client_pid = os.getpid()
+
+    return _mongodb_client
+
+
+def _close_stale_async_clients():
+    # Loops of finished async_to_sync/asyncio.run calls are closed, their clients can't be used anymore
+    for loop_id, (loop, client, _) in list(_async_clients.items()):
+        if loop.is_closed():
+            del _async_clients[loop_id]
+            client.close()
+
+
+def _get_async_entry():
+    global _client_pid
+    _check_pid()
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(id(loop), None)
+    if entry is None or entry[0] is not loop:
+        with _lock:
+            _close_stale_async_clients()
+            entry = _async_clients.get(id(loop), None)
+            if entry is None or entry[0] is not loop:
+                from motor.motor_asyncio import AsyncIOMotorClient
+                logging.debug("Create async mongodb client")
+                client = AsyncIOMotorClient(
+                    settings.MONGODB_CONNECTION_URI, io_loop=loop, **get_client_options()
+                )
+                entry = (loop, client, dict())
+                _async_clients[id(loop)] = entry
+                _client_pid = os.getpid()
+
+    return entry
+
+
+def get_async_client():
+    """
+    Get the Motor client of the running event loop, created on first use.
+    Under ASGI there is one long lived loop, under WSGI/runserver each async view runs in its own loop.
+    @raise RuntimeError: no running event loop
+    """
+    return _get_async_entry()[1]
+
+
+def get_async_cached_handle(key, factory):
+    """
+    get_cached_handle() for Motor handles, cached per event loop like the client
+    """
+    handles = _get_async_entry()[2]
+    handle = handles.get(key, None)
+    if handle is None:
+        handle = factory()
+        handles[key] = handle
+
+    return handle
+
+
+def get_cached_handle(key, factory):
+    """
+    Get a cached database/collection handle
+    @param key: hashable cache key
+    @param factory: called to create the handle on a cache miss
+    """
+    _check_pid()
+    handle = _handles.get(key, None)
+    if handle is None:
+        handle = factory()
+        _handles[key] = handle
+
+    return handle
 
 
 def get_db_name(user):
     return f"{user.username}_{user.id}_db"
 
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_clients)
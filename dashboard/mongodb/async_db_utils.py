@@ -0,0 +1,278 @@
+import logging
+import datetime
+import heapq
+
+import pymongo
+
+from . import get_async_client, get_async_cached_handle
+from ..mqtt import geo
+from .db_utils import get_project_collection_name, get_events_collection_name, get_locations_collection_name, \
+    get_positions_collection_name, get_latest_collection_name, get_sample_query, get_document_samples
+
+_indexed_collections = set()
+
+
+def get_database(db_name):
+    return get_async_cached_handle(("async_db", str(db_name)), lambda: get_async_client()[str(db_name)])
+
+
+def get_project_collection(project):
+    collection_name = get_project_collection_name(project)
+    return get_async_cached_handle(
+        ("async_collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+def get_events_collection(project):
+    collection_name = get_events_collection_name(project)
+    return get_async_cached_handle(
+        ("async_collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+async def get_events(project, dataobjects=None, limit=100):
+    """
+    Latest alert events of a project
+    @param dataobjects: restrict to these data object pks (None for all)
+    @return: event dicts, newest first
+    """
+    doc_filter = dict()
+    if dataobjects is not None:
+        doc_filter["dataobject"] = {"$in": list(dataobjects)}
+
+    cursor = get_events_collection(project).find(doc_filter, {"_id": 0}).sort("timestamp", pymongo.DESCENDING)
+    return await cursor.to_list(length=limit)
+
+
+def get_locations_collection(project):
+    collection_name = get_locations_collection_name(project)
+    return get_async_cached_handle(
+        ("async_collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+def get_positions_collection(project):
+    collection_name = get_positions_collection_name(project)
+    return get_async_cached_handle(
+        ("async_collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+def get_location_filter(dataobject, geo_filter=None, start=None, end=None):
+    doc_filter = {"dataobject": dataobject.pk}
+    doc_filter.update(geo_filter or dict())
+    time_filter = dict()
+    if start is not None:
+        time_filter["$gte"] = start.timestamp()
+    if end is not None:
+        time_filter["$lt"] = end.timestamp()
+    if time_filter:
+        doc_filter["timestamp"] = time_filter
+
+    return doc_filter
+
+
+async def get_locations(project, dataobject, geo_filter=None, start=None, end=None, limit=1000):
+    """
+    Location samples of a data object, served by the 2dsphere index
+    @param geo_filter: geo.within_filter()/geo.radius_filter() on "location" (None for no area)
+    @param start: naive UTC datetime, inclusive (None for no lower bound)
+    @param end: naive UTC datetime, exclusive (None for no upper bound)
+    @return: location dicts, newest first
+    """
+    doc_filter = get_location_filter(dataobject, geo_filter, start, end)
+    cursor = get_locations_collection(project).find(doc_filter, {"_id": 0, "dataobject": 0})
+    return await cursor.sort("timestamp", pymongo.DESCENDING).to_list(length=limit)
+
+
+async def get_positions(project, dataobject, geo_filter=None, limit=1000):
+    """
+    Latest position of each device of a data object, one document per device
+    @param geo_filter: geo.within_filter()/geo.radius_filter() on "location" (None for no area)
+    @return: position dicts ordered by device
+    """
+    doc_filter = get_location_filter(dataobject, geo_filter)
+    cursor = get_positions_collection(project).find(doc_filter, {"_id": 0, "dataobject": 0})
+    return await cursor.sort("device", pymongo.ASCENDING).to_list(length=limit)
+
+
+def get_clustered_collection(project, history):
+    return get_locations_collection(project) if history else get_positions_collection(project)
+
+
+async def get_clusters(project, dataobject, zoom, geo_filter=None, start=None, end=None, history=False, limit=1000):
+    """
+    Grid clusters of a data object's points, aggregated by MongoDB
+    @param zoom: web mercator zoom level, sets the grid cell size
+    @param start: naive UTC datetime, history only
+    @param end: naive UTC datetime, history only
+    @param history: cluster location samples instead of the latest position per device
+    @return: cluster dicts (see geo.cluster_pipeline), largest first
+    """
+    if history:
+        doc_filter = get_location_filter(dataobject, geo_filter, start, end)
+    else:
+        doc_filter = get_location_filter(dataobject, geo_filter)
+
+    pipeline = geo.cluster_pipeline(doc_filter, zoom, limit)
+    return await get_clustered_collection(project, history).aggregate(pipeline).to_list(length=limit)
+
+
+async def get_extent(project, dataobject, geo_filter=None, start=None, end=None, history=False):
+    """
+    Bounding box of a data object's points
+    @return: {"west", "south", "east", "north"}, None without points
+    """
+    if history:
+        doc_filter = get_location_filter(dataobject, geo_filter, start, end)
+    else:
+        doc_filter = get_location_filter(dataobject, geo_filter)
+
+    pipeline = geo.extent_pipeline(doc_filter)
+    async for extent in get_clustered_collection(project, history).aggregate(pipeline):
+        return extent
+
+    return None
+
+
+def get_latest_collection(project):
+    collection_name = get_latest_collection_name(project)
+    return get_async_cached_handle(
+        ("async_collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+async def get_latest_value(project, dataobject, tail_size=50):
+    """
+    Most recent sample of a data object: one indexed document read from the latest value index,
+    falling back to the ends of today's day document for data stored before the index existed
+    @param tail_size: samples taken from each end of the day document in the fallback
+    @return: {"timestamp": ..., "value": ...}, None if there is no recent sample
+    """
+    key = f"{dataobject.pk}"
+    topic_pk = dataobject.topic_id
+    doc = await get_latest_collection(project).find_one({"topic": topic_pk}, {"_id": 0, f"latest.{key}": 1})
+    if doc and key in doc.get("latest", dict()):
+        return doc["latest"][key]
+
+    # get_data_objects() sorts the array newest first and later samples are appended: check both ends
+    aggregation = [
+        {"$match": {"topic": topic_pk, "date": datetime.datetime.utcnow().toordinal()}},
+        {"$project": {"_id": 0, "values": {"$concatArrays": [
+            {"$slice": ["$values", tail_size]}, {"$slice": ["$values", -tail_size]}
+        ]}}},
+    ]
+    latest = None
+    async for doc in get_project_collection(project).aggregate(aggregation):
+        for sample in doc.get("values", []):
+            value = sample.get("value", dict()).get(key, None)
+            if value is not None and (latest is None or sample["timestamp"] > latest["timestamp"]):
+                latest = {"timestamp": sample["timestamp"], "value": value}
+
+    return latest
+
+
+async def ensure_project_indexes(collection):
+    if collection.full_name in _indexed_collections:
+        return
+
+    await collection.create_index([("topic", pymongo.ASCENDING), ("date", pymongo.ASCENDING)])
+    _indexed_collections.add(collection.full_name)
+
+
+async def get_data_objects(project, topic, limit=100):
+    """
+    Async version of db_utils.get_data_objects
+    @param project: project
+    @param topic: topic
+    @return: values list
+    """
+    logging.debug(f"Get data objects {project.name}, {topic.name}")
+    project_col = get_project_collection(project)
+    today = datetime.datetime.utcnow().toordinal()
+    doc_filter = {
+        "topic": topic.pk,
+        "date": today,
+    }
+    aggregation = [
+        {"$match": {
+            "$and": [{"topic": topic.pk}, {"date": today}]
+        }},
+        {"$sort": {"values.timestamp": pymongo.DESCENDING}},
+        {"$limit": limit},
+    ]
+
+    # Sort array
+    await project_col.update_one(doc_filter,
+                                 {"$push": {"values": {
+                                     "$each": [],
+                                     "$sort": {"timestamp": pymongo.DESCENDING}
+                                 }}})
+
+    async for c_obj in project_col.aggregate(aggregation):
+        values_array = c_obj.get("values", [])
+        # excpecting only one
+        return values_array
+
+
+async def iter_topic_samples(collection, topic, start=None, end=None, dataobjects=None, batch_size=8):
+    doc_filter, projection, sort = get_sample_query(topic, start, end, dataobjects)
+    async for doc in collection.find(doc_filter, projection, batch_size=batch_size).sort(sort):
+        for sample in get_document_samples(doc, start, end):
+            yield sample
+
+
+async def merge_samples(iterators):
+    """
+    heapq.merge of time ordered async sample iterators
+    """
+    heap = list()
+    for i, iterator in enumerate(iterators):
+        sample = await anext(iterator, None)
+        if sample is not None:
+            heap.append((sample[1], i, sample))
+    heapq.heapify(heap)
+
+    while heap:
+        _, i, sample = heap[0]
+        yield sample
+        following = await anext(iterators[i], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (following[1], i, following))
+
+
+async def iter_samples(project, topics, start=None, end=None, dataobjects=None, batch_size=8):
+    """
+    Async version of db_utils.iter_samples
+    @return: async generator of (topic_pk, timestamp, values dict)
+    """
+    project_col = get_project_collection(project)
+    await ensure_project_indexes(project_col)
+
+    iterators = [iter_topic_samples(project_col, topic, start, end, dataobjects, batch_size) for topic in topics]
+    async for sample in merge_samples(iterators):
+        yield sample
+
+
+async def iter_sample_chunks(project, topics, start=None, end=None, dataobjects=None, chunk_size=1000):
+    """
+    Samples of iter_samples in lists of about chunk_size, samples sharing a timestamp stay in one list
+    @return: async generator of [(topic_pk, timestamp, values dict), ...]
+    """
+    chunk = list()
+    async for sample in iter_samples(project, topics, start, end, dataobjects):
+        if len(chunk) >= chunk_size and sample[1] != chunk[-1][1]:
+            yield chunk
+            chunk = list()
+
+        chunk.append(sample)
+
+    if chunk:
+        yield chunk
@@ -1,17 +1,182 @@
 import logging
 import datetime
+import functools
+import heapq
 
 import pymongo
 
-from . import mongodb_client
+from . import get_mongodb_client, get_cached_handle
+
+_indexed_collections = set()
 
 
 def get_database(db_name):
-    return mongodb_client[str(db_name)]
+    return get_cached_handle(("db", str(db_name)), lambda: get_mongodb_client()[str(db_name)])
+
+
+@functools.lru_cache(maxsize=1024)
+def _collection_name(name, project_id):
+    return "{}_{}".format(str(name).replace(" ", "_"), project_id)
 
 
 def get_project_collection_name(project):
-    return "{}_{}".format(str(project.name).replace(" ", "_"), project.id)
+    return _collection_name(project.name, project.id)
+
+
+def get_project_collection(project):
+    collection_name = get_project_collection_name(project)
+    return get_cached_handle(
+        ("collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+def get_events_collection_name(project):
+    return f"{get_project_collection_name(project)}_events"
+
+
+def get_events_collection(project):
+    collection_name = get_events_collection_name(project)
+    return get_cached_handle(
+        ("collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+def add_events(project, events):
+    """
+    Store alert events
+    @param events: event dicts (see mqtt.alerts.AlertEngine)
+    """
+    collection = get_events_collection(project)
+    if collection.full_name not in _indexed_collections:
+        collection.create_index([("dataobject", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)])
+        collection.create_index([("timestamp", pymongo.DESCENDING)])
+        _indexed_collections.add(collection.full_name)
+
+    return collection.insert_many(events)
+
+
+def get_locations_collection_name(project):
+    return f"{get_project_collection_name(project)}_locations"
+
+
+def get_positions_collection_name(project):
+    return f"{get_project_collection_name(project)}_positions"
+
+
+def get_locations_collection(project):
+    collection_name = get_locations_collection_name(project)
+    return get_cached_handle(
+        ("collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+def get_positions_collection(project):
+    collection_name = get_positions_collection_name(project)
+    return get_cached_handle(
+        ("collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+def ensure_location_indexes(locations_col, positions_col):
+    if locations_col.full_name not in _indexed_collections:
+        locations_col.create_index([
+            ("dataobject", pymongo.ASCENDING), ("location", pymongo.GEOSPHERE), ("timestamp", pymongo.ASCENDING)
+        ])
+        locations_col.create_index([("dataobject", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)])
+        _indexed_collections.add(locations_col.full_name)
+
+    if positions_col.full_name not in _indexed_collections:
+        positions_col.create_index([("dataobject", pymongo.ASCENDING), ("device", pymongo.ASCENDING)], unique=True)
+        positions_col.create_index([("dataobject", pymongo.ASCENDING), ("location", pymongo.GEOSPHERE)])
+        _indexed_collections.add(positions_col.full_name)
+
+
+def add_locations(project, topic, device, timestamp, locations):
+    """
+    Store location samples as GeoJSON points and update the latest position of the device
+    @param device: device identifier (MQTT topic path of the message)
+    @param timestamp: sample time in seconds
+    @param locations: {dataobject_pk: GeoJSON point}
+    """
+    write_locations(
+        get_locations_collection(project),
+        get_positions_collection(project),
+        [(topic.pk, device, timestamp, locations)]
+    )
+
+
+def add_spooled_locations(db_name, collection_name, entries):
+    """
+    Store location samples replayed from the spool
+    @param collection_name: project collection name
+    @param entries: (topic_pk, device, timestamp, {dataobject_pk: GeoJSON point}) tuples in arrival order
+    """
+    # Same naming as get_locations_collection_name() and get_positions_collection_name()
+    database = get_database(db_name)
+    write_locations(database[f"{collection_name}_locations"], database[f"{collection_name}_positions"], entries)
+
+
+def write_locations(locations_col, positions_col, entries):
+    ensure_location_indexes(locations_col, positions_col)
+
+    locations_col.insert_many([
+        {"topic": topic_pk, "dataobject": int(pk), "device": device, "timestamp": timestamp, "location": point}
+        for topic_pk, device, timestamp, locations in entries
+        for pk, point in locations.items()
+    ])
+    # Latest position per data object and device, entries are in arrival order
+    positions = dict()
+    for topic_pk, device, timestamp, locations in entries:
+        for pk, point in locations.items():
+            positions[(int(pk), device)] = {"topic": topic_pk, "timestamp": timestamp, "location": point}
+
+    positions_col.bulk_write([
+        pymongo.UpdateOne({"dataobject": pk, "device": device}, {"$set": position}, upsert=True)
+        for (pk, device), position in positions.items()
+    ], ordered=False)
+
+
+def get_latest_collection_name(project):
+    return f"{get_project_collection_name(project)}_latest"
+
+
+def get_latest_collection(project):
+    collection_name = get_latest_collection_name(project)
+    return get_cached_handle(
+        ("collection", str(project.db_name), collection_name),
+        lambda: get_database(project.db_name)[collection_name]
+    )
+
+
+def get_latest_update(topic_pk, sample):
+    """
+    Latest value index update of a sample: one document per topic, {"latest": {dataobject_pk: sample}}
+    """
+    latest = {
+        f"latest.{key}": {"timestamp": sample["timestamp"], "value": value}
+        for key, value in sample["value"].items()
+    }
+    return pymongo.UpdateOne({"topic": topic_pk}, {"$set": latest}, upsert=True)
+
+
+def update_latest(collection, operations):
+    """
+    Apply latest value index updates. Failures are only logged: the samples are already stored,
+    raising would make the caller spool or replay them twice.
+    """
+    try:
+        if collection.full_name not in _indexed_collections:
+            collection.create_index([("topic", pymongo.ASCENDING)], unique=True)
+            _indexed_collections.add(collection.full_name)
+
+        if operations:
+            collection.bulk_write(operations, ordered=True)
+    except Exception as e:
+        logging.error(f"Latest value update failed: {e}")
 
 
 def add_document(collection, document):
@@ -30,8 +195,7 @@ def get_document(collection, topic):
 
 def add_data_obj(project, topic, data):
     logging.debug("Add data object")
-    db = get_database(project.db_name)
-    project_col = db[get_project_collection_name(project)]
+    project_col = get_project_collection(project)
     data_object = {
         "timestamp": data["time"].timestamp(),
         "value": data["values"],
@@ -48,6 +212,32 @@ def add_data_obj(project, topic, data):
 
     res = project_col.update_one(doc_filters, data_query, upsert=True)
     logging.debug(f"Add data res: {res.acknowledged}")
+    update_latest(get_latest_collection(project), [get_latest_update(topic.pk, data_object)])
+    return res
+
+
+def add_samples(db_name, collection_name, samples):
+    """
+    Push samples with one ordered bulk write, one update per topic day
+    @param db_name: database name
+    @param collection_name: project collection name
+    @param samples: (topic_pk, date ordinal, {"timestamp": ..., "value": ...}) tuples in arrival order
+    @return: bulk write result
+    """
+    days = dict()
+    for topic_pk, date, sample in samples:
+        days.setdefault((topic_pk, date), list()).append(sample)
+
+    operations = [
+        pymongo.UpdateOne({"topic": topic_pk, "date": date}, {"$push": {"values": {"$each": day_samples}}}, upsert=True)
+        for (topic_pk, date), day_samples in days.items()
+    ]
+    res = get_database(db_name)[collection_name].bulk_write(operations, ordered=True)
+    # Same naming as get_latest_collection_name(), samples are in arrival order so the last one wins
+    update_latest(
+        get_database(db_name)[f"{collection_name}_latest"],
+        [get_latest_update(topic_pk, sample) for topic_pk, _, sample in samples]
+    )
     return res
 
 
@@ -59,8 +249,7 @@ def get_data_objects(project, topic, limit=100):
     @return: values list
     """
     logging.debug(f"Get data objects {project.name}, {topic.name}")
-    db = get_database(project.db_name)
-    project_col = db[get_project_collection_name(project)]
+    project_col = get_project_collection(project)
     doc_filter = {
         "topic": topic.pk,
         "date": datetime.datetime.utcnow().toordinal(),
@@ -87,18 +276,109 @@ def get_data_objects(project, topic, limit=100):
         return values_array
 
 
+def ensure_project_indexes(collection):
+    if collection.full_name in _indexed_collections:
+        return
+
+    collection.create_index([("topic", pymongo.ASCENDING), ("date", pymongo.ASCENDING)])
+    _indexed_collections.add(collection.full_name)
+
+
+def get_sample_query(topic, start=None, end=None, dataobjects=None):
+    """
+    Build the find() filter, projection and sort of a topic's sample range query
+    @return: (filter, projection, sort)
+    """
+    doc_filter = {"topic": topic.pk}
+    date_filter = dict()
+    if start is not None:
+        date_filter["$gte"] = start.toordinal()
+    if end is not None:
+        date_filter["$lte"] = end.toordinal()
+    if date_filter:
+        doc_filter["date"] = date_filter
+
+    projection = {"_id": 0, "topic": 1, "date": 1, "values.timestamp": 1}
+    if dataobjects is None:
+        projection["values.value"] = 1
+    else:
+        for dataobject in dataobjects:
+            projection[f"values.value.{dataobject.pk}"] = 1
+
+    sort = [("date", pymongo.ASCENDING)]
+    return doc_filter, projection, sort
+
+
+def get_sample_timestamp(sample):
+    return sample[1]
+
+
+def get_document_samples(doc, start=None, end=None):
+    """
+    Samples of a day document in time order
+    @param start: naive UTC datetime, inclusive (None for no lower bound)
+    @param end: naive UTC datetime, exclusive (None for no upper bound)
+    @return: [(topic_pk, timestamp, values dict), ...]
+    """
+    start_ts = start.timestamp() if start is not None else None
+    end_ts = end.timestamp() if end is not None else None
+    samples = list()
+    for elem in doc.get("values", []):
+        timestamp = elem["timestamp"]
+        if start_ts is not None and timestamp < start_ts:
+            continue
+        if end_ts is not None and timestamp >= end_ts:
+            continue
+
+        samples.append((doc["topic"], timestamp, elem.get("value", {})))
+
+    # Arrays are appended to but may have been re-sorted by get_data_objects
+    samples.sort(key=get_sample_timestamp)
+    return samples
+
+
+def iter_topic_samples(collection, topic, start=None, end=None, dataobjects=None, batch_size=8):
+    doc_filter, projection, sort = get_sample_query(topic, start, end, dataobjects)
+    for doc in collection.find(doc_filter, projection, batch_size=batch_size).sort(sort):
+        yield from get_document_samples(doc, start, end)
+
+
+def iter_samples(project, topics, start=None, end=None, dataobjects=None, batch_size=8):
+    """
+    Iterate stored samples of one or more topics in time order, straight from the cursors.
+    Every topic has its own cursor over its day documents and the cursors are merged on timestamp,
+    so one day document per topic is held at a time
+    @param project: project
+    @param topics: topics list
+    @param start: naive UTC datetime, inclusive (None for no lower bound)
+    @param end: naive UTC datetime, exclusive (None for no upper bound)
+    @param dataobjects: restrict values to these data objects (None for all)
+    @param batch_size: day documents fetched per round trip and topic
+    @return: generator of (topic_pk, timestamp, values dict)
+    """
+    project_col = get_project_collection(project)
+    ensure_project_indexes(project_col)
+
+    yield from heapq.merge(
+        *[iter_topic_samples(project_col, topic, start, end, dataobjects, batch_size) for topic in topics],
+        key=get_sample_timestamp
+    )
+
+
 def get_data_objects_by_aggregation(project, aggregation):
-    db = get_database(project.db_name)
-    project_col = db[get_project_collection_name(project)]
+    project_col = get_project_collection(project)
     res = project_col.aggregate(aggregation)
     return res
 
 
 def delete_project_collection(project):
-    db = get_database(project.db_name)
-    collection = db[get_project_collection_name(project)]
+    collection = get_project_collection(project)
     try:
         collection.drop()
+        get_events_collection(project).drop()
+        get_locations_collection(project).drop()
+        get_positions_collection(project).drop()
+        get_latest_collection(project).drop()
         return True
     except Exception as e:
         logging.debug("Drop collection exception {}".format(e))
@@ -106,13 +386,15 @@ def delete_project_collection(project):
 
 
 def delete_topic_documents(project, topic):
-    db = get_database(project.db_name)
-    collection = db[get_project_collection_name(project)]
+    collection = get_project_collection(project)
     doc_filter = {
         "topic": topic.pk,
     }
     try:
         res = collection.delete_many(filter=doc_filter)
+        get_locations_collection(project).delete_many(filter=doc_filter)
+        get_positions_collection(project).delete_many(filter=doc_filter)
+        get_latest_collection(project).delete_many(filter=doc_filter)
         return res.acknowledged
     except Exception as e:
         logging.debug(e)
@@ -120,8 +402,7 @@ def delete_topic_documents(project, topic):
 
 
 def delete_dataobject(project, topic, dataobject):
-    db = get_database(project.db_name)
-    collection = db[get_project_collection_name(project)]
+    collection = get_project_collection(project)
     doc_filter = {
         "topic": topic.pk,
     }
@@ -130,6 +411,9 @@ def delete_dataobject(project, topic, dataobject):
     }
     try:
         res = collection.update_many(doc_filter, query)
+        get_locations_collection(project).delete_many({"dataobject": dataobject.pk})
+        get_positions_collection(project).delete_many({"dataobject": dataobject.pk})
+        get_latest_collection(project).update_one(doc_filter, {"$unset": {f"latest.{dataobject.pk}": ""}})
         return res.acknowledged
     except Exception as e:
         logging.debug("Update dataobject exception {}".format(e))
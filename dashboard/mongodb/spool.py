@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import pymongo
+from django.conf import settings
+
+from . import db_utils
+from .. import utils
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_NEVER = "never"
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CHECKPOINT_NAME = "checkpoint.json"
+LOCK_NAME = "spool.lock"
+
+_spool = None
+_spool_unavailable = False
+_spool_lock = threading.Lock()
+
+
+class SpoolLockedError(RuntimeError):
+    pass
+
+
+class Spool:
+    """
+    Append-only local write-ahead log of samples (and their locations) that could not be written to MongoDB.
+    Records are JSON lines in numbered segment files, a segment is deleted once fully replayed.
+    While the spool holds records new samples are appended too, so per topic ordering is kept.
+    Replay is at-least-once: a crash between a bulk write and its checkpoint replays that batch again.
+    A directory is owned by one process at a time, guarded by an exclusive lock file.
+    """
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, fsync=FSYNC_INTERVAL, fsync_interval=1.0,
+                 replay_batch_size=1000, retry_interval=5.0, write_timeout=0.5):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"Unknown spool fsync policy {fsync}")
+
+        self.directory = str(directory)
+        self.segment_size = int(segment_size)
+        self.fsync = fsync
+        self.fsync_interval = float(fsync_interval)
+        self.replay_batch_size = int(replay_batch_size)
+        self.retry_interval = float(retry_interval)
+        # Seconds a direct MongoDB write may take (server selection included) before its sample is spooled
+        self.write_timeout = float(write_timeout)
+        self.lock = threading.Lock()
+        self.replayer = None
+        self.active = None
+        self.active_path = None
+        self.last_fsync = 0.0
+        self.appended = 0
+        self.replayed = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock_file = utils.acquire_process_lock(os.path.join(self.directory, LOCK_NAME))
+        if self.lock_file is None:
+            raise SpoolLockedError(f"Spool directory {self.directory} is used by another process")
+
+        self.segments = self.list_segments()
+        self.next_segment = self.get_segment_number(self.segments[-1]) + 1 if self.segments else 0
+
+    def list_segments(self):
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+        return sorted(os.path.join(self.directory, name) for name in names)
+
+    @staticmethod
+    def get_segment_number(path):
+        return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def has_pending(self):
+        return bool(self.segments)
+
+    def open_segment(self):
+        self.active_path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.next_segment:012d}{SEGMENT_SUFFIX}")
+        self.next_segment += 1
+        self.active = open(self.active_path, "ab")
+        self.segments.append(self.active_path)
+
+    def close_segment(self):
+        # Called with the lock held
+        if self.active is None:
+            return
+
+        self.active.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self.active.fileno())
+        self.active.close()
+        self.active = None
+        self.active_path = None
+
+    def append(self, db_name, collection_name, topic_pk, date, sample, location=None):
+        """
+        Append a sample and make sure it gets replayed
+        @param sample: {"timestamp": float, "value": {dataobject_pk: value}}, None if only the location is spooled
+        @param location: (device, timestamp, {dataobject_pk: GeoJSON point}) of the sample, if any
+        """
+        record = [db_name, collection_name, topic_pk, date, sample]
+        if location is not None:
+            record.append(list(location))
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.active is None:
+                self.open_segment()
+
+            self.active.write(line.encode())
+            self.active.flush()
+            now = time.monotonic()
+            if self.fsync == FSYNC_ALWAYS or (self.fsync == FSYNC_INTERVAL and now - self.last_fsync >= self.fsync_interval):
+                os.fsync(self.active.fileno())
+                self.last_fsync = now
+
+            self.appended += 1
+            if self.active.tell() >= self.segment_size:
+                self.close_segment()
+
+        self.start_replay()
+
+    def start_replay(self):
+        with self.lock:
+            if not self.segments or self.replayer is not None:
+                return
+
+            self.replayer = threading.Thread(target=self.run_replay, name="mongodb-spool-replay", daemon=True)
+            self.replayer.start()
+
+    def run_replay(self):
+        while True:
+            with self.lock:
+                if not self.segments:
+                    self.replayer = None
+                    return
+
+                if self.segments == [self.active_path]:
+                    # Only the active segment is left: seal it, new samples go to a fresh one.
+                    # While older segments fail to replay the active one keeps filling up
+                    self.close_segment()
+                segments = [path for path in self.segments if path != self.active_path]
+
+            try:
+                for path in segments:
+                    self.replay_segment(path)
+            except Exception as e:
+                logging.debug(f"Spool replay failed, retry in {self.retry_interval}s: {e}")
+                time.sleep(self.retry_interval)
+
+    def read_checkpoint(self, path):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_NAME)) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return 0
+
+        return checkpoint["offset"] if checkpoint.get("segment") == os.path.basename(path) else 0
+
+    def write_checkpoint(self, path, offset):
+        checkpoint_path = os.path.join(self.directory, CHECKPOINT_NAME)
+        with open(checkpoint_path + ".tmp", "w") as f:
+            json.dump({"segment": os.path.basename(path), "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    def replay_segment(self, path):
+        """
+        Write the records of a sealed segment in batches, then delete it
+        """
+        offset = self.read_checkpoint(path)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while True:
+                batches = dict()
+                locations = dict()
+                count = 0
+                while count < self.replay_batch_size:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        # End of file or record torn by a crash
+                        break
+
+                    record = json.loads(line)
+                    db_name, collection_name, topic_pk, date, sample = record[:5]
+                    if sample is not None:
+                        batches.setdefault((db_name, collection_name), list()).append((topic_pk, date, sample))
+                    if len(record) > 5:
+                        locations.setdefault((db_name, collection_name), list()).append((topic_pk, *record[5]))
+                    count += 1
+
+                if not count:
+                    break
+
+                for (db_name, collection_name), samples in batches.items():
+                    db_utils.add_samples(db_name, collection_name, samples)
+                for (db_name, collection_name), entries in locations.items():
+                    db_utils.add_spooled_locations(db_name, collection_name, entries)
+
+                self.replayed += count
+                self.write_checkpoint(path, f.tell())
+
+        with self.lock:
+            self.segments.remove(path)
+        os.remove(path)
+        logging.debug(f"Spool segment {os.path.basename(path)} replayed")
+
+    def get_metrics(self):
+        return {
+            "segments": len(self.segments),
+            "appended": self.appended,
+            "replayed": self.replayed,
+        }
+
+
+def get_spool():
+    """
+    Get the process wide spool, None if disabled in settings.MONGODB_SPOOL
+    or if its directory is locked by another process
+    """
+    global _spool, _spool_unavailable
+    options = dict(getattr(settings, "MONGODB_SPOOL", dict()))
+    if not options.pop("enabled", False) or _spool_unavailable:
+        return None
+
+    if _spool is None:
+        with _spool_lock:
+            if _spool is None and not _spool_unavailable:
+                try:
+                    _spool = Spool(**options)
+                except SpoolLockedError as e:
+                    logging.warning(f"{e}, samples are not spooled in this process")
+                    _spool_unavailable = True
+                    return None
+                # Segments left by a previous run
+                _spool.start_replay()
+
+    return _spool
+
+
+def store_sample(project, topic, data, device=None, locations=None):
+    """
+    Store a sample and its locations, spooling them to disk when MongoDB is unavailable
+    @param data: {"time": datetime, "values": {dataobject_pk: value}}
+    @param device: device of the locations (MQTT topic path of the message)
+    @param locations: {dataobject_pk: GeoJSON point} location values of the sample
+    """
+    timestamp = data["time"].timestamp()
+    spool = get_spool()
+    if spool is None:
+        db_utils.add_data_obj(project, topic, data)
+        if locations:
+            try:
+                db_utils.add_locations(project, topic, device, timestamp, locations)
+            except Exception as e:
+                # Without a spool only the geo index misses this sample
+                logging.debug(f"Add locations failed: {e}")
+        return
+
+    sample = {"timestamp": timestamp, "value": data["values"]}
+    if not spool.has_pending():
+        try:
+            # Fail fast when MongoDB is down rather than blocking ingest for the client's server selection timeout
+            with pymongo.timeout(spool.write_timeout):
+                db_utils.add_data_obj(project, topic, data)
+            sample = None
+            if locations:
+                with pymongo.timeout(spool.write_timeout):
+                    db_utils.add_locations(project, topic, device, timestamp, locations)
+            return
+        except Exception as e:
+            logging.debug(f"Add data failed, spooling {'locations' if sample is None else 'sample'}: {e}")
+
+    spool.append(
+        str(project.db_name),
+        db_utils.get_project_collection_name(project),
+        topic.pk,
+        data["time"].toordinal(),
+        sample,
+        (device, timestamp, locations) if locations else None,
+    )
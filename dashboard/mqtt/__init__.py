@@ -1,4 +1,10 @@
-from .client import MQTTClientManager
+from django.utils.functional import SimpleLazyObject
 
-mqtt_client_manager = MQTTClientManager()
 
+def _create_client_manager():
+    # paho and the client module are imported on first use of the manager
+    from .client import MQTTClientManager
+    return MQTTClientManager()
+
+
+mqtt_client_manager = SimpleLazyObject(_create_client_manager)
@@ -0,0 +1,182 @@
+import datetime
+import logging
+import threading
+
+from django.conf import settings
+
+from ..models import AlertRule
+
+STATE_FIRED = "fired"
+STATE_RESOLVED = "resolved"
+
+
+def get_alert_settings():
+    return getattr(settings, "MQTT_ALERTS", dict())
+
+
+def get_now():
+    # Same clock as sample timestamps (naive UTC datetime)
+    return datetime.datetime.utcnow().timestamp()
+
+
+class RuleState:
+    def __init__(self, definition):
+        self.definition = definition
+        self.active = False
+        self.last = None
+
+
+class AlertEngine:
+    """
+    Evaluates the alert rules of a client's data objects on every extracted value.
+    Rules come from the extraction plan, indexed by data object pk, so each value costs O(rules of its series).
+    Fired/resolved events are buffered until drained by the caller.
+    """
+    def __init__(self):
+        self.states = dict()
+        self.last_seen = dict()
+        self.events = list()
+        self.lock = threading.Lock()
+
+    def get_state(self, rule):
+        # A changed rule starts over
+        definition = (rule.rule_type, rule.threshold, rule.hysteresis, rule.timeout)
+        state = self.states.get(rule.pk, None)
+        if state is None or state.definition != definition:
+            state = RuleState(definition)
+            self.states[rule.pk] = state
+
+        return state
+
+    def add_event(self, rule, state, timestamp, value=None):
+        self.events.append({
+            "rule": rule.pk,
+            "name": rule.name,
+            "rule_type": rule.rule_type,
+            "dataobject": rule.data_object_id,
+            "state": STATE_FIRED if state.active else STATE_RESOLVED,
+            "threshold": rule.threshold,
+            "value": value,
+            "timestamp": timestamp,
+        })
+
+    def set_active(self, rule, state, active, timestamp, value=None):
+        if state.active != active:
+            state.active = active
+            self.add_event(rule, state, timestamp, value)
+
+    def evaluate(self, rules, data_object, timestamp, value):
+        """
+        Evaluate the rules of a data object on a new value
+        """
+        with self.lock:
+            self.last_seen[data_object.pk] = timestamp
+            numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+            for rule in rules:
+                state = self.get_state(rule)
+                if rule.rule_type == AlertRule.RULE_NO_DATA:
+                    self.set_active(rule, state, False, timestamp, value)
+                elif not numeric or rule.threshold is None:
+                    continue
+                elif rule.rule_type == AlertRule.RULE_ABOVE:
+                    if value > rule.threshold:
+                        self.set_active(rule, state, True, timestamp, value)
+                    elif value < rule.threshold - rule.hysteresis:
+                        self.set_active(rule, state, False, timestamp, value)
+                elif rule.rule_type == AlertRule.RULE_BELOW:
+                    if value < rule.threshold:
+                        self.set_active(rule, state, True, timestamp, value)
+                    elif value > rule.threshold + rule.hysteresis:
+                        self.set_active(rule, state, False, timestamp, value)
+                elif rule.rule_type == AlertRule.RULE_RATE:
+                    last, state.last = state.last, (timestamp, value)
+                    if last is None or timestamp <= last[0]:
+                        continue
+
+                    rate = abs(value - last[1]) / (timestamp - last[0])
+                    if rate > rule.threshold:
+                        self.set_active(rule, state, True, timestamp, value)
+                    elif rate < rule.threshold - rule.hysteresis:
+                        self.set_active(rule, state, False, timestamp, value)
+
+    def check_timeouts(self, rules, now):
+        """
+        Fire no-data rules whose data object has not been seen for the rule's timeout
+        @param rules: no-data rules of the client
+        """
+        with self.lock:
+            for rule in rules:
+                if not rule.timeout:
+                    continue
+
+                # Unseen data objects get one timeout of grace from the first check
+                last_seen = self.last_seen.setdefault(rule.data_object_id, now)
+                if now - last_seen > rule.timeout:
+                    self.set_active(rule, self.get_state(rule), True, now)
+
+    def drain(self):
+        with self.lock:
+            events, self.events = self.events, list()
+            return events
+
+
+def publish_events(project, events):
+    """
+    Store events in the project's events collection and forward them to the channel layer group, if enabled
+    """
+    from ..mongodb import db_utils
+
+    for event in events:
+        event["project"] = project.pk
+    try:
+        db_utils.add_events(project, events)
+    except Exception as e:
+        logging.error(f"Storing {len(events)} alert events failed: {e}")
+
+    alert_settings = get_alert_settings()
+    if not alert_settings.get("channel_layer", False):
+        return
+
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    group = f"{alert_settings.get('group_prefix', 'alerts')}_{project.pk}"
+    for event in events:
+        try:
+            async_to_sync(channel_layer.group_send)(group, {"type": "alert.event", "event": event})
+        except Exception as e:
+            logging.debug(f"Alert group send failed: {e}")
+
+
+class AlertMonitor:
+    """
+    Periodic no-data check of all clients of a manager
+    """
+    def __init__(self, check_interval=10.0):
+        self.check_interval = float(check_interval)
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self, manager):
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, args=(manager,), name="mqtt-alerts", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self, manager):
+        while not self.stop_event.wait(self.check_interval):
+            now = get_now()
+            for mqtt_client in manager.client_list:
+                try:
+                    mqtt_client.check_alert_timeouts(now)
+                except Exception as e:
+                    logging.debug(f"Alert check of client {mqtt_client.id} failed: {e}")
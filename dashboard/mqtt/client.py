@@ -1,72 +1,152 @@
 import asyncio
 import datetime
 import logging
-import json
 import threading
 import concurrent.futures
 
 import django.db.models
+from django.conf import settings
 from paho.mqtt import client
-from ..models import Project, Topic, DataObject
-from ..mongodb import db_utils
+from ..models import Topic, DataObject
+from ..mongodb import spool
+from .reconnect import ReconnectScheduler
+from .ingest import IngestQueue
+from .filters import SampleFilters
+from .operators import DerivedSeries
+from .alerts import AlertEngine, AlertMonitor, get_alert_settings, publish_events
+from .dedup import DuplicateFilter, message_digest
+from .payload import Payload, compile_key_path
+from .control import ClientSync, get_sync_interval
+from . import geo, plans
 from asgiref.sync import async_to_sync, sync_to_async
-from channels.layers import get_channel_layer
 
-channel_layer = get_channel_layer()
 
 class MessageParserMixin:
-    def get_topic_info_from_message(self, topic_path, project):
-        topics = Topic.objects.filter(project=project)
+    sample_filters = None
+    derived_series = None
+    alert_engine = None
+
+    def get_topic_info_from_message(self, topic_path, project_plan):
         topic_info_list = list()
-        for topic in topics:
+        for topic_plan in project_plan.topic_plans:
+            topic = topic_plan.topic
             if "#" in topic.path:
                 i = topic.path.index("#")
                 obj_path = topic_path[i:]
                 if str(topic_path).startswith(str(topic.path[:(i-1)])):
                     topic_info = {
                         "obj_path": obj_path,
-                        "topic": topic
+                        "topic": topic,
+                        "plan": topic_plan,
                     }
                     topic_info_list.append(topic_info)
 
             elif str(topic_path).startswith(str(topic.path)):
                 topic_info = {
                     "topic": topic,
+                    "plan": topic_plan,
                 }
                 topic_info_list.append(topic_info)
 
         return topic_info_list
 
-    def create_mongodb_data_object(self, topic, raw_data, obj_path=None):
-        try:
-            logging.debug(f"Raw data {raw_data}")
-            processed_data = json.loads(raw_data)
-            logging.debug(f"Json data {processed_data}")
-        except json.JSONDecodeError:
-            processed_data = raw_data.decode()
-            logging.debug(f"Decoded data {processed_data}")
-
-        data_objects = DataObject.objects.filter(topic=topic)
+    def create_mongodb_data_object(self, topic_plan, payload, obj_path=None, timestamp=None):
+        """
+        Extract data object values of a topic
+        :param topic_plan: cached data objects and key accessors of the topic
+        :param payload: Payload, decoded once and shared by all matching topics
+        :param timestamp: message time (seconds), enables ingest filters and derived series
+        """
         mongodb_data_obj = dict()
-        for data_object in data_objects:
-            value = self.get_dataobject_value_from_data(data_object, processed_data)
-            if obj_path is None:
-                if value:
-                    mongodb_data_obj[f"{data_object.pk}"] = value
-            else:
-                if data_object.path == obj_path:
-                    if value:
-                        mongodb_data_obj[f"{data_object.pk}"] = value
+        values = dict()
+        for data_object, accessor in topic_plan.extractors:
+            if obj_path is not None and data_object.path != obj_path:
+                continue
+
+            processed_data = self.get_payload_data(data_object, payload)
+            value = self.get_dataobject_value_from_data(data_object, processed_data, accessor)
+            if value is not None:
+                self.add_extracted_value(topic_plan, mongodb_data_obj, values, data_object, value, timestamp)
+
+        for data_object, expression in topic_plan.expressions:
+            if obj_path is not None and data_object.path != obj_path:
+                continue
+
+            try:
+                value = expression(values)
+            except KeyError:
+                # A referenced value is missing from this message
+                continue
+            except (ArithmeticError, ValueError, TypeError) as e:
+                logging.debug(f"Expression of {data_object.pk} failed: {e}")
+                continue
+
+            value = self.get_dataobject_value_from_data(data_object, value)
+            if value is not None:
+                self.add_extracted_value(topic_plan, mongodb_data_obj, values, data_object, value, timestamp)
 
         return mongodb_data_obj
 
-    def get_dataobject_value_from_data(self, data_object, processed_data):
+    def add_extracted_value(self, topic_plan, mongodb_data_obj, values, data_object, value, timestamp):
+        """
+        Record an extracted value, store it (subject to ingest filters) and feed its derived series
+        """
+        values[f"{data_object.pk}"] = value
+        self.evaluate_alerts(topic_plan, data_object, value, timestamp)
+        self.add_sample_value(mongodb_data_obj, data_object, value, timestamp)
+        if self.derived_series is not None and timestamp is not None:
+            # Derived series see every source sample, before the source's own filters
+            for derived in topic_plan.derived.get(data_object.pk, ()):
+                derived_value = self.derived_series.update(derived, timestamp, value)
+                if derived_value is not None:
+                    values[f"{derived.pk}"] = derived_value
+                    self.evaluate_alerts(topic_plan, derived, derived_value, timestamp)
+                    self.add_sample_value(mongodb_data_obj, derived, derived_value, timestamp)
+
+    def evaluate_alerts(self, topic_plan, data_object, value, timestamp):
+        rules = topic_plan.alert_rules.get(data_object.pk, None)
+        if rules and self.alert_engine is not None and timestamp is not None:
+            self.alert_engine.evaluate(rules, data_object, timestamp, value)
+
+    def add_sample_value(self, mongodb_data_obj, data_object, value, timestamp):
+        if self.sample_filters is not None and timestamp is not None:
+            if not self.sample_filters.accept(data_object, timestamp, value):
+                return
+
+        mongodb_data_obj[f"{data_object.pk}"] = value
+
+    def get_payload_data(self, data_object, payload):
+        """
+        Decoded payload in the data object's format
+        """
+        if data_object.format == DataObject.FORMAT_CHOICE_CBOR:
+            return payload.get_cbor()
+        elif data_object.format == DataObject.FORMAT_CHOICE_MSGPACK:
+            return payload.get_msgpack()
+        elif data_object.format == DataObject.FORMAT_CHOICE_STRUCT:
+            if not data_object.struct_format:
+                return None
+            return payload.unpack(data_object.struct_format, data_object.struct_offset)
+
+        return payload.get_json()
+
+    def get_dataobject_value_from_data(self, data_object, processed_data, accessor=None):
+        if accessor is None and data_object.key:
+            try:
+                accessor = compile_key_path(data_object.key)
+            except ValueError:
+                return None
+
         if data_object.format == DataObject.FORMAT_CHOICE_JSON:
-            if not isinstance(processed_data, dict):
+            if accessor is None:
                 return None
 
-            obj_value = processed_data.get(f"{data_object.key}", None)
-        elif data_object.format == DataObject.FORMAT_CHOICE_SINGLE_VARIABLE:
+            obj_value = accessor(processed_data)
+        elif data_object.format in (DataObject.FORMAT_CHOICE_CBOR, DataObject.FORMAT_CHOICE_MSGPACK):
+            # Binary documents: keyed like JSON, or a single value without key
+            obj_value = processed_data if accessor is None else accessor(processed_data)
+        elif data_object.format in (DataObject.FORMAT_CHOICE_SINGLE_VARIABLE, DataObject.FORMAT_CHOICE_STRUCT,
+                                    DataObject.FORMAT_CHOICE_EXPRESSION):
             obj_value = processed_data
         else:
             obj_value = None
@@ -76,13 +156,15 @@ class MessageParserMixin:
                 try:
                     ret = float(obj_value)
                     return ret
-                except TypeError:
+                except (TypeError, ValueError):
                     logging.debug(f"{obj_value} not a number")
             elif data_object.data_type == DataObject.DATA_TYPE_STRING:
+                if isinstance(obj_value, bytes):
+                    # Packed struct "s" fields, NUL padded
+                    return obj_value.rstrip(b"\x00").decode(errors="replace")
                 return str(obj_value)
             elif data_object.data_type == DataObject.DATA_TYPE_LOCATION:
-                #TODO location object
-                pass
+                return geo.to_point(obj_value)
             elif data_object.data_type == DataObject.DATA_TYPE_BOOLEAN:
                 if isinstance(obj_value, bool):
                     return obj_value
@@ -94,12 +176,22 @@ class MQTTClient(MessageParserMixin, client.Client):
     """
     MQTT Client class, new object created each time a project is created.
     """
-    def __init__(self, project_id, host, port, userdata=None):
+    def __init__(self, project_id, host, port, userdata=None, reconnect_scheduler=None, ingest_options=None):
         super().__init__(client_id=str(project_id), userdata=userdata)
         self.id = project_id
         self.host = host
         self.port = port
         self.connected = False
+        # Set when the client is disconnected on purpose, the reconnect watcher leaves it alone
+        self.stopped = False
+        self.reconnect_scheduler = reconnect_scheduler
+        self.sample_filters = SampleFilters()
+        self.derived_series = DerivedSeries()
+        self.alert_engine = AlertEngine()
+        self.duplicate_filter = DuplicateFilter(**getattr(settings, "MQTT_DEDUP", dict()))
+        # {topic path: qos} subscribed on the broker in this session
+        self.subscriptions = dict()
+        self.subscriptions_lock = threading.Lock()
 
         #callbacks
         self.on_connect = self._connected
@@ -108,8 +200,44 @@ class MQTTClient(MessageParserMixin, client.Client):
         self.on_subscribe = self._subscribed
         self.on_publish = self._published
 
-        # DB save thread pool
-        self.msg_rec_threadpool = concurrent.futures.ThreadPoolExecutor(1)
+        # Bounded DB save queue, its overflow policy sheds or throttles load when writes fall behind
+        self.ingest_queue = IngestQueue(self.__process_message, name=f"mqtt-ingest-{project_id}",
+                                        **(ingest_options or dict()))
+        # Work triggered by network callbacks that must not block paho's loop (e.g. subscriptions)
+        self.control_threadpool = concurrent.futures.ThreadPoolExecutor(1)
+
+    def is_loop_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_stopping(self):
+        return self.stopped or self._thread_terminate or self._state == client.mqtt_cs_disconnecting
+
+    def start_loop(self):
+        """
+        Start the network loop thread unless it is already running
+        :return: True if a new loop thread was started
+        """
+        if self.is_loop_running():
+            return False
+
+        # Loop thread exited on its own, paho keeps the stale handle
+        self._thread = None
+        self.stopped = False
+        self.loop_start()
+        return True
+
+    def reconnect(self):
+        if self.reconnect_scheduler is None:
+            return super().reconnect()
+
+        return self.reconnect_scheduler.attempt(self, super().reconnect)
+
+    def _reconnect_wait(self):
+        # Called by paho's network loop between reconnection attempts
+        if self.reconnect_scheduler is None:
+            return super()._reconnect_wait()
+
+        self.reconnect_scheduler.wait(self)
 
     async def connect_broker(self):
         """
@@ -160,48 +288,159 @@ class MQTTClient(MessageParserMixin, client.Client):
 
     # Connected callback
     def _connected(self, client_ptr, userdata, flags, rc):
+        if rc != client.CONNACK_ACCEPTED:
+            logging.debug("Connection refused by {}: {}".format(self.host, client.connack_string(rc)))
+            if self.reconnect_scheduler:
+                self.reconnect_scheduler.record_failure(self.id, client.connack_string(rc))
+            return
+
         logging.debug("Connected {}".format(self.host))
-        project = Project.objects.get(pk=self.id)
-        topics = Topic.objects.filter(project=project)
+        if self.reconnect_scheduler:
+            self.reconnect_scheduler.record_connected(self.id)
+
         self.connected = True
-        if len(topics) <= 0:
+        if flags.get("session present"):
+            # Broker kept our subscriptions
             return
 
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            futures = [pool.submit(
-                async_to_sync(self.subscribe_topic), topic.path, topic.qos,
-            ) for topic in topics]
+        # Runs on paho's network thread, the DB query and SUBSCRIBE packets are handed off
+        self.control_threadpool.submit(self.subscribe_project_topics)
+
+    def get_topic_subscriptions(self):
+        subscriptions = dict()
+        for path, qos in Topic.objects.filter(project_id=self.id).values_list("path", "qos"):
+            subscriptions[path] = max(int(qos), subscriptions.get(path, 0))
+
+        return subscriptions
+
+    def subscribe_project_topics(self):
+        """
+        Subscribe to all topics of the project, batching topic filters into as few SUBSCRIBE packets as allowed
+        :return: number of SUBSCRIBE packets sent
+        """
+        with self.subscriptions_lock:
+            # New session, the broker has no subscriptions
+            self.subscriptions = dict()
+
+        return self.sync_subscriptions()
+
+    def sync_subscriptions(self, wanted=None):
+        """
+        Subscribe topics added (or whose QoS changed) since the last call, unsubscribe removed ones
+        :param wanted: {topic path: qos}, read from the database if None
+        :return: number of SUBSCRIBE packets sent
+        """
+        if not self.connected:
+            # Subscribed from scratch on connect
+            return 0
+
+        if wanted is None:
+            wanted = self.get_topic_subscriptions()
+
+        with self.subscriptions_lock:
+            removed = [path for path in self.subscriptions if path not in wanted]
+            if removed:
+                res = self.unsubscribe(removed)
+                if res[0] == client.MQTT_ERR_SUCCESS:
+                    for path in removed:
+                        self.subscriptions.pop(path, None)
+
+            topic_list = [(path, qos) for path, qos in wanted.items() if self.subscriptions.get(path, None) != qos]
+            if not topic_list:
+                return 0
+
+            batch_size = getattr(settings, "MQTT_SUBSCRIBE_BATCH_SIZE", 100)
+            packets = 0
+            for i in range(0, len(topic_list), batch_size):
+                batch = topic_list[i:i + batch_size]
+                res = self.subscribe(batch)
+                if res[0] != client.MQTT_ERR_SUCCESS:
+                    logging.debug(f"Subscribe failed on {self.host}: {client.error_string(res[0])}")
+                    break
+
+                self.subscriptions.update(batch)
+                packets += 1
+
+        logging.debug(f"Subscribed {len(topic_list)} topics on {self.host} in {packets} packets")
+        return packets
 
     # Disconnected callback
     def _disconnected(self, client_ptr, userdata, rc):
         logging.debug("disconnected {}".format(self.host))
         self.connected = False
+        if self.reconnect_scheduler:
+            self.reconnect_scheduler.record_disconnected(self.id)
 
     # Message received callback
     def _message_received(self, client_ptr, userdata, message):
         logging.debug(f"msg received on {message.topic}")
-        self.msg_rec_threadpool.submit(self.__process_message, message.topic, message.payload)
+        self.ingest_queue.put(message.topic, message.payload, message.qos)
 
-    def __process_message(self, topic_path, payload):
+    def __process_message(self, topic_path, payload, qos=0):
         now = datetime.datetime.utcnow()
         try:
-            project = Project.objects.get(pk=self.id)
+            project_plan = plans.get_project_plan(self.id)
         except django.db.models.ObjectDoesNotExist:
             logging.debug("Project not found")
             return
 
-        topics_info = self.get_topic_info_from_message(topic_path, project)
+        topics_info = self.get_topic_info_from_message(topic_path, project_plan)
+        payload = Payload(payload)
         for topic_info in topics_info:
-            try:
-                topic = topic_info["topic"]
-            except Exception as e:
-                logging.debug(e)
+            if self.is_duplicate(topic_info, topic_path, payload, qos):
+                logging.debug(f"Duplicate message on {topic_path} dropped")
                 continue
 
             obj_path = topic_info.get("obj_path", None)
-            mongodb_obj = self.create_mongodb_data_object(topic, payload, obj_path)
+            mongodb_obj = self.create_mongodb_data_object(topic_info["plan"], payload, obj_path, now.timestamp())
             if mongodb_obj:
-                db_utils.add_data_obj(project, topic, {"time": now, "values": mongodb_obj})
+                spool.store_sample(
+                    project_plan.project, topic_info["topic"], {"time": now, "values": mongodb_obj},
+                    str(topic_path), self.get_locations(topic_info, mongodb_obj)
+                )
+
+        self.publish_alert_events(project_plan.project)
+
+    def is_duplicate(self, topic_info, topic_path, payload, qos):
+        """
+        Check for a redelivery of a QoS 1/2 message, keyed on the topic's dedup key value if it has one
+        """
+        topic = topic_info["topic"]
+        if not topic.dedup_window or not qos:
+            return False
+
+        key_value = None
+        accessor = topic_info["plan"].dedup_accessor
+        if accessor is not None:
+            key_value = accessor(payload.get_json())
+        return self.duplicate_filter.is_duplicate(topic, message_digest(topic_path, payload.raw, key_value), qos)
+
+    def get_locations(self, topic_info, mongodb_obj):
+        """
+        Location samples of the message, indexed by device (the MQTT topic path)
+        """
+        return {
+            key: value for key, value in mongodb_obj.items() if key in topic_info["plan"].locations
+        }
+
+    def publish_alert_events(self, project):
+        events = self.alert_engine.drain()
+        if events:
+            # Mongo insert and channel layer send stay off the ingest thread
+            self.control_threadpool.submit(publish_events, project, events)
+
+    def check_alert_timeouts(self, now):
+        """
+        Fire no-data alerts, called periodically by the manager's AlertMonitor
+        """
+        try:
+            project_plan = plans.get_project_plan(self.id)
+        except django.db.models.ObjectDoesNotExist:
+            return
+
+        if project_plan.no_data_rules:
+            self.alert_engine.check_timeouts(project_plan.no_data_rules, now)
+            self.publish_alert_events(project_plan.project)
 
     # Topic subscribed callback
     def _subscribed(self, client_ptr, userdata, mid, granted_qos):
@@ -217,17 +456,48 @@ class MQTTClientManager:
     """
     MQTT Client manager
     """
-    client_list = list()
+    clients = dict()
+
+    def __init__(self):
+        self.reconnect_scheduler = ReconnectScheduler(**getattr(settings, "MQTT_RECONNECT", dict()))
+        self.ingest_options = getattr(settings, "MQTT_INGEST", dict())
+        self.alert_monitor = AlertMonitor(get_alert_settings().get("check_interval", 10.0))
+        self.client_sync = ClientSync(get_sync_interval())
+        self.lock = threading.RLock()
+
+    @property
+    def client_list(self):
+        return list(self.clients.values())
 
     def get_client_count(self):
-        return len(self.client_list)
+        return len(self.clients)
 
     def get_client(self, client_id):
-        for temp_client in self.client_list:
-            if temp_client.id == client_id:
-                return temp_client
+        return self.clients.get(int(client_id), None)
 
-        return None
+    def get_reconnect_metrics(self, client_id):
+        if self.get_client(client_id) is None:
+            return None
+
+        return self.reconnect_scheduler.get_metrics(int(client_id)).as_dict()
+
+    def get_ingest_metrics(self, client_id):
+        _client = self.get_client(client_id)
+        if _client is None:
+            return None
+
+        metrics = _client.ingest_queue.get_metrics()
+        metrics["duplicates"] = _client.duplicate_filter.suppressed
+        return metrics
+
+    def start(self):
+        """
+        Start watching clients, disconnected clients are reconnected without user action,
+        no-data alert rules are checked and clients follow project and topic changes of other processes
+        """
+        self.reconnect_scheduler.start(self)
+        self.alert_monitor.start(self)
+        self.client_sync.start(self)
 
     def refresh_clients(self):
         for _client in self.client_list:
@@ -235,16 +505,41 @@ class MQTTClientManager:
                 self.connect_client(_client.id)
                 self.start_client(_client.id)
 
+    def sync_client(self, client_id, host, port=1883):
+        """
+        Make sure a project has a running client, recreated if the project's broker changed
+        @return: True if a client was created
+        """
+        with self.lock:
+            _client = self.get_client(client_id)
+            if _client is not None and (_client.host, _client.port) == (host, port):
+                return False
+
+            if _client is not None:
+                self.delete_client(client_id)
+            self.add_client(client_id, host, port)
+            self.connect_client(client_id)
+            self.start_client(client_id)
+            return True
+
     def add_client(self, client_id, host, port=1883, userdata=None):
         logging.debug(f"Add client {client_id}, {host}")
-        temp_client = MQTTClient(client_id, host, port, userdata)
-        self.client_list.append(temp_client)
+        previous = self.get_client(client_id)
+        if previous:
+            previous.ingest_queue.stop()
+        temp_client = MQTTClient(client_id, host, port, userdata, reconnect_scheduler=self.reconnect_scheduler,
+                                 ingest_options=self.ingest_options)
+        self.clients[int(client_id)] = temp_client
 
     def connect_client(self, client_id):
         temp_client = self.get_client(client_id)
         if temp_client:
-            logging.debug(f"Connect: {temp_client.host}")
-            temp_client.connect_async(host=temp_client.host, port=temp_client.port)
+            if temp_client.is_loop_running():
+                # The network loop retries on its own, skip its remaining backoff
+                self.reconnect_scheduler.wake(temp_client.id)
+            else:
+                logging.debug(f"Connect: {temp_client.host}")
+                temp_client.connect_async(host=temp_client.host, port=temp_client.port)
             return True
 
         return False
@@ -252,7 +547,7 @@ class MQTTClientManager:
     def start_client(self, client_id):
         temp_client = self.get_client(client_id)
         if temp_client:
-            temp_client.loop_start()
+            temp_client.start_loop()
             return True
 
         return False
@@ -260,6 +555,7 @@ class MQTTClientManager:
     def disconnect_client(self, client_id):
         temp_client = self.get_client(client_id)
         if temp_client:
+            temp_client.stopped = True
             async_to_sync(temp_client.disconnect_broker)()
             temp_client.loop_stop()
             return True
@@ -267,13 +563,13 @@ class MQTTClientManager:
         return False
 
     def delete_client(self, client_id):
-        _client = self.get_client(client_id)
-        if _client:
-            self.disconnect_client(client_id)
-            self.client_list.remove(_client)
-            return True
-
-        return False
-
-
+        with self.lock:
+            _client = self.get_client(client_id)
+            if _client:
+                self.disconnect_client(client_id)
+                self.clients.pop(int(client_id), None)
+                self.reconnect_scheduler.forget(_client.id)
+                _client.ingest_queue.stop()
+                return True
 
+            return False
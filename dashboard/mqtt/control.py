@@ -0,0 +1,164 @@
+"""
+The MQTT clients run in one process, the holder of the startup lock (see startup.run).
+Views of any process change the database, the owner's ClientSync applies the changes to its clients
+and publishes their state (Project.connected, metrics in the cache) for the other processes.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from ..models import Project, Topic
+
+METRICS_KEY = "dashboard:mqtt:metrics:{}"
+REFRESH_KEY = "dashboard:mqtt:refresh"
+
+
+def owns_clients():
+    """
+    Check if this process runs the MQTT clients.
+    Without an ASGI startup (WSGI, runserver) the first process asking takes over if no other process did.
+    """
+    from .. import startup
+
+    return startup.run()
+
+
+def get_sync_interval():
+    return getattr(settings, "MQTT_SYNC_INTERVAL", 5.0)
+
+
+def project_saved(project):
+    """
+    Create (or recreate after a broker change) and connect the client of a project
+    """
+    if not owns_clients():
+        return
+
+    from . import mqtt_client_manager
+
+    mqtt_client_manager.sync_client(project.pk, project.host, project.port)
+
+
+def project_deleted(project_pk):
+    if not owns_clients():
+        return
+
+    from . import mqtt_client_manager
+
+    mqtt_client_manager.delete_client(project_pk)
+
+
+def topics_changed(project_pk):
+    """
+    Apply added, changed or deleted topic subscriptions of a project
+    """
+    if not owns_clients():
+        return
+
+    from . import mqtt_client_manager
+
+    mqtt_client = mqtt_client_manager.get_client(project_pk)
+    if mqtt_client is not None:
+        mqtt_client.sync_subscriptions()
+
+
+def refresh():
+    """
+    Reconnect disconnected clients now rather than after their backoff
+    """
+    if not owns_clients():
+        cache.set(REFRESH_KEY, True, timeout=get_sync_interval() * 3)
+        return
+
+    from . import mqtt_client_manager
+
+    mqtt_client_manager.refresh_clients()
+
+
+def is_connected(project):
+    if not owns_clients():
+        return project.connected
+
+    from . import mqtt_client_manager
+
+    mqtt_client = mqtt_client_manager.get_client(project.pk)
+    return bool(mqtt_client and mqtt_client.connected)
+
+
+def get_metrics(project_pk):
+    """
+    @return: {"reconnect": dict or None, "ingest": dict or None}
+    """
+    if not owns_clients():
+        return cache.get(METRICS_KEY.format(project_pk), None) or {"reconnect": None, "ingest": None}
+
+    from . import mqtt_client_manager
+
+    return {
+        "reconnect": mqtt_client_manager.get_reconnect_metrics(project_pk),
+        "ingest": mqtt_client_manager.get_ingest_metrics(project_pk),
+    }
+
+
+class ClientSync:
+    """
+    Periodic reconciliation of the owner's clients with the database: clients of new projects are created,
+    clients of deleted projects removed, topic subscriptions updated, and the client state is published
+    """
+    def __init__(self, interval=5.0):
+        self.interval = float(interval)
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self, manager):
+        if self.interval <= 0 or (self.thread is not None and self.thread.is_alive()):
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, args=(manager,), name="mqtt-sync", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self, manager):
+        while not self.stop_event.wait(self.interval):
+            close_old_connections()
+            try:
+                self.sync(manager)
+            except Exception as e:
+                logging.debug(f"Client sync failed: {e}")
+
+    def sync(self, manager):
+        projects = {pk: (host, port) for pk, host, port in Project.objects.values_list("pk", "host", "port")}
+        for client_id in set(manager.clients) - set(projects):
+            manager.delete_client(client_id)
+        for pk, (host, port) in projects.items():
+            manager.sync_client(pk, host, port)
+
+        subscriptions = dict()
+        for project_pk, path, qos in Topic.objects.values_list("project_id", "path", "qos"):
+            paths = subscriptions.setdefault(project_pk, dict())
+            paths[path] = max(int(qos), paths.get(path, 0))
+        for mqtt_client in manager.client_list:
+            mqtt_client.sync_subscriptions(subscriptions.get(mqtt_client.id, dict()))
+
+        if cache.get(REFRESH_KEY, False):
+            cache.delete(REFRESH_KEY)
+            manager.refresh_clients()
+
+        self.publish_state(manager)
+
+    def publish_state(self, manager):
+        connected = [mqtt_client.id for mqtt_client in manager.client_list if mqtt_client.connected]
+        Project.objects.filter(pk__in=connected, connected=False).update(connected=True)
+        Project.objects.exclude(pk__in=connected).filter(connected=True).update(connected=False)
+        cache.set_many({
+            METRICS_KEY.format(mqtt_client.id): {
+                "reconnect": manager.get_reconnect_metrics(mqtt_client.id),
+                "ingest": manager.get_ingest_metrics(mqtt_client.id),
+            } for mqtt_client in manager.client_list
+        }, timeout=self.interval * 3)
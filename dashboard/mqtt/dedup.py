@@ -0,0 +1,70 @@
+import collections
+import hashlib
+import threading
+import time
+
+
+def message_digest(topic_path, raw, key_value=None):
+    """
+    Digest identifying a message: topic path and payload, or the value at the topic's dedup key
+    (e.g. a device timestamp or sequence number) when the payload has one.
+    Packet ids are not used, a redelivery in a new session gets a new one.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(topic_path).encode())
+    if key_value is None:
+        digest.update(b"\x00")
+        digest.update(raw)
+    else:
+        digest.update(b"\x01")
+        digest.update(repr(key_value).encode())
+    return digest.digest()
+
+
+class DuplicateFilter:
+    """
+    Time windowed set of recent message digests per topic, used to drop QoS 1/2 redeliveries.
+    Memory is bounded: entries expire after the topic's window and at most max_entries are kept per topic.
+    """
+    def __init__(self, max_entries=10000):
+        self.max_entries = int(max_entries)
+        self.seen = dict()
+        self.lock = threading.Lock()
+        self.suppressed = 0
+
+    def is_duplicate(self, topic, digest, qos, now=None):
+        """
+        Check a message against the topic's window and remember it
+        @param topic: Topic, filtering applies to topics with a dedup_window
+        @param digest: message_digest() of the message
+        @param qos: QoS of the delivery, QoS 0 messages are never redelivered
+        @return: True if the same message was seen within the window
+        """
+        if not topic.dedup_window or not qos:
+            return False
+
+        if now is None:
+            now = time.monotonic()
+
+        with self.lock:
+            entries = self.seen.get(topic.pk, None)
+            if entries is None:
+                entries = collections.OrderedDict()
+                self.seen[topic.pk] = entries
+
+            # Expire from the oldest end
+            while entries:
+                if now - next(iter(entries.values())) < topic.dedup_window and len(entries) < self.max_entries:
+                    break
+                entries.popitem(last=False)
+
+            if digest in entries:
+                self.suppressed += 1
+                return True
+
+            entries[digest] = now
+            return False
+
+    def forget(self, topic_pk):
+        with self.lock:
+            self.seen.pop(topic_pk, None)
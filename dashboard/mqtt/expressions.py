@@ -0,0 +1,200 @@
+import ast
+import keyword
+import math
+import operator
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    # math.pow works on floats, huge results raise OverflowError instead of hanging
+    ast.Pow: math.pow,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    ast.Not: operator.not_,
+}
+
+COMPARE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+FUNCTIONS = {
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": round,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "atan2": math.atan2,
+    "hypot": math.hypot,
+    "floor": math.floor,
+    "ceil": math.ceil,
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+MAX_EXPRESSION_LENGTH = 256
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def check_name(name):
+    """
+    Check that a data object name can be referenced by expressions
+    @raise ExpressionError: not an identifier, or the name of an expression function or constant
+    """
+    if not name.isidentifier() or keyword.iskeyword(name):
+        raise ExpressionError("Name must be an identifier (letters, digits and _, not starting with a digit)")
+    if name in FUNCTIONS or name in CONSTANTS:
+        raise ExpressionError(f"Name {name} is reserved for expression functions and constants")
+
+
+def get_references(source):
+    """
+    Variable names of a stored expression, empty if it does not parse
+    """
+    try:
+        return parse_expression(source)[1]
+    except ExpressionError:
+        return set()
+
+
+def parse_expression(source):
+    """
+    Parse and check an expression
+    @return: (ast tree, set of variable names)
+    @raise ExpressionError: syntax error or unsupported construct
+    """
+    if not source or len(source) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError("Expression empty or too long")
+
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}")
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS and node.id not in CONSTANTS:
+            names.add(node.id)
+
+    # Compile once with dummy bindings to reject unsupported constructs early
+    compile_node(tree.body, {name: name for name in names})
+    return tree, names
+
+
+def compile_expression(source, resolve):
+    """
+    Compile an expression into a closure, once per definition
+    @param resolve: {variable name: key of the value in the values dict}
+    @return: callable(values dict) -> value, raises KeyError if a variable has no value
+    @raise ExpressionError: invalid expression or unknown variable
+    """
+    tree, _ = parse_expression(source)
+    return compile_node(tree.body, resolve)
+
+
+def to_number(value):
+    """
+    Coerce a variable to float, so operators never work on strings, lists or huge integers
+    @raise TypeError: not a number or boolean
+    """
+    if isinstance(value, (bool, int, float)):
+        return float(value)
+
+    raise TypeError(f"Expression operand {value!r} is not a number")
+
+
+def compile_node(node, resolve):
+    if isinstance(node, ast.Constant):
+        if not isinstance(node.value, (bool, int, float)):
+            raise ExpressionError("Only numeric and boolean constants are allowed")
+        value = node.value
+        return lambda values: value
+
+    if isinstance(node, ast.Name):
+        if node.id in CONSTANTS:
+            value = CONSTANTS[node.id]
+            return lambda values: value
+        if node.id not in resolve:
+            raise ExpressionError(f"Unknown variable {node.id}")
+
+        key = resolve[node.id]
+        return lambda values: to_number(values[key])
+
+    if isinstance(node, ast.BinOp):
+        func = BINARY_OPERATORS.get(type(node.op), None)
+        if func is None:
+            raise ExpressionError(f"Operator {type(node.op).__name__} not allowed")
+
+        left, right = compile_node(node.left, resolve), compile_node(node.right, resolve)
+        return lambda values: func(left(values), right(values))
+
+    if isinstance(node, ast.UnaryOp):
+        func = UNARY_OPERATORS.get(type(node.op), None)
+        if func is None:
+            raise ExpressionError(f"Operator {type(node.op).__name__} not allowed")
+
+        operand = compile_node(node.operand, resolve)
+        return lambda values: func(operand(values))
+
+    if isinstance(node, ast.BoolOp):
+        operands = [compile_node(value, resolve) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda values: all(operand(values) for operand in operands)
+        return lambda values: any(operand(values) for operand in operands)
+
+    if isinstance(node, ast.Compare):
+        left = compile_node(node.left, resolve)
+        comparisons = list()
+        for op, comparator in zip(node.ops, node.comparators):
+            func = COMPARE_OPERATORS.get(type(op), None)
+            if func is None:
+                raise ExpressionError(f"Comparison {type(op).__name__} not allowed")
+            comparisons.append((func, compile_node(comparator, resolve)))
+
+        def compare(values):
+            current = left(values)
+            for func, right in comparisons:
+                other = right(values)
+                if not func(current, other):
+                    return False
+                current = other
+            return True
+
+        return compare
+
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = (compile_node(n, resolve) for n in (node.test, node.body, node.orelse))
+        return lambda values: body(values) if test(values) else orelse(values)
+
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise ExpressionError("Only calls to built in math functions are allowed")
+
+        func = FUNCTIONS[node.func.id]
+        args = [compile_node(arg, resolve) for arg in node.args]
+        return lambda values: func(*(arg(values) for arg in args))
+
+    raise ExpressionError(f"{type(node).__name__} not allowed in expressions")
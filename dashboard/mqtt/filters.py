@@ -0,0 +1,55 @@
+import threading
+
+from ..models import DataObject
+
+
+class SampleFilters:
+    """
+    Per data object ingest filters (deadband, minimum interval, heartbeat), evaluated before samples are stored.
+    State is the last stored sample of each data object, kept in memory.
+    """
+    def __init__(self):
+        self.last_samples = dict()
+        self.lock = threading.Lock()
+
+    def is_filtered(self, data_object):
+        return (data_object.deadband is not None or data_object.min_interval
+                or data_object.heartbeat)
+
+    def exceeds_deadband(self, data_object, value, last_value):
+        if data_object.data_type != DataObject.DATA_TYPE_NUMBER:
+            # Non numeric values are stored on change only
+            return value != last_value
+
+        threshold = data_object.deadband
+        if data_object.deadband_type == DataObject.DEADBAND_RELATIVE:
+            threshold = abs(last_value) * data_object.deadband / 100
+
+        return abs(value - last_value) > threshold
+
+    def accept(self, data_object, timestamp, value):
+        """
+        Decide whether to store a sample, and remember it if so
+        @param timestamp: sample time in seconds
+        @return: True if the sample should be stored
+        """
+        if not self.is_filtered(data_object):
+            return True
+
+        with self.lock:
+            last = self.last_samples.get(data_object.pk, None)
+            if last is not None:
+                last_timestamp, last_value = last
+                elapsed = timestamp - last_timestamp
+                if not (data_object.heartbeat and elapsed >= data_object.heartbeat):
+                    if data_object.min_interval and elapsed < data_object.min_interval:
+                        return False
+                    if data_object.deadband is not None and not self.exceeds_deadband(data_object, value, last_value):
+                        return False
+
+            self.last_samples[data_object.pk] = (timestamp, value)
+            return True
+
+    def forget(self, data_object_pk):
+        with self.lock:
+            self.last_samples.pop(data_object_pk, None)
@@ -0,0 +1,252 @@
+import math
+
+LATITUDE_KEYS = ("lat", "latitude")
+LONGITUDE_KEYS = ("lon", "lng", "long", "longitude")
+EARTH_RADIUS = 6378100.0
+# Bounding box polygons: maximum width of one polygon, parallel densification step and pole clamp (degrees)
+MAX_POLYGON_WIDTH = 90.0
+DENSIFY_STEP = 1.0
+MAX_LATITUDE = 89.9
+# Web mercator: latitude limit, sphere radius (meters), grid cells per 256px tile side and zoom range
+MERCATOR_MAX_LATITUDE = 85.0511
+MERCATOR_RADIUS = 6378137.0
+CLUSTER_CELLS_PER_TILE = 4
+MAX_ZOOM = 20
+
+
+def make_point(lon, lat):
+    """
+    GeoJSON point, None if the coordinates are not valid WGS84 degrees
+    """
+    try:
+        lon, lat = float(lon), float(lat)
+    except (TypeError, ValueError):
+        return None
+
+    if not (-180.0 <= lon <= 180.0 and -90.0 <= lat <= 90.0):
+        return None
+
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def get_first(obj, keys):
+    for key in keys:
+        if key in obj:
+            return obj[key]
+
+    return None
+
+
+def to_point(value):
+    """
+    Convert a location value into a GeoJSON point
+    Accepted: GeoJSON point, {"lat": .., "lon": ..} (lng/long/latitude/longitude), [lon, lat] (GeoJSON order)
+    and "lat,lon" strings (the usual human order)
+    @return: GeoJSON point dict, None if not a valid location
+    """
+    if isinstance(value, dict):
+        if value.get("type") == "Point":
+            coordinates = value.get("coordinates", None)
+            if isinstance(coordinates, (list, tuple)) and len(coordinates) >= 2:
+                return make_point(coordinates[0], coordinates[1])
+            return None
+
+        return make_point(get_first(value, LONGITUDE_KEYS), get_first(value, LATITUDE_KEYS))
+
+    if isinstance(value, (list, tuple)) and len(value) >= 2:
+        return make_point(value[0], value[1])
+
+    if isinstance(value, str):
+        parts = value.split(",")
+        if len(parts) == 2:
+            return make_point(parts[1].strip(), parts[0].strip())
+
+    return None
+
+
+def bbox_geometries(west, south, east, north):
+    """
+    GeoJSON polygons covering a bounding box, for $geoWithin queries on 2dsphere indexes.
+    2dsphere edges are geodesics: the box is split into pieces of at most MAX_POLYGON_WIDTH degrees (each smaller
+    than a hemisphere) and the parallels are densified so the edges follow them.
+    A box with west > east crosses the antimeridian and is covered from west to 180 and from -180 to east.
+    @return: polygon list, empty if the box covers the whole globe
+    @raise ValueError: invalid box
+    """
+    if make_point(west, south) is None or make_point(east, north) is None:
+        raise ValueError("Bounding box outside of WGS84 bounds")
+    if west == east or south >= north:
+        raise ValueError("Bounding box must be west,south,east,north")
+
+    south, north = max(south, -MAX_LATITUDE), min(north, MAX_LATITUDE)
+    if east - west >= 360 and south <= -MAX_LATITUDE and north >= MAX_LATITUDE:
+        return list()
+
+    if west > east:
+        spans = [(west, 180.0), (-180.0, east)]
+    else:
+        spans = [(west, east)]
+
+    return [
+        polygon for span_west, span_east in spans if span_west < span_east
+        for polygon in span_polygons(span_west, south, span_east, north)
+    ]
+
+
+def span_polygons(west, south, east, north):
+    """
+    Polygons of a box not crossing the antimeridian (west < east), see bbox_geometries()
+    """
+    polygons = list()
+    pieces = math.ceil((east - west) / MAX_POLYGON_WIDTH)
+    width = (east - west) / pieces
+    for piece in range(pieces):
+        piece_west = west + piece * width
+        piece_east = east if piece == pieces - 1 else piece_west + width
+        steps = max(math.ceil((piece_east - piece_west) / DENSIFY_STEP), 1)
+        lons = [piece_west + (piece_east - piece_west) * i / steps for i in range(steps + 1)]
+        ring = [[lon, south] for lon in lons] + [[lon, north] for lon in reversed(lons)] + [[piece_west, south]]
+        polygons.append({"type": "Polygon", "coordinates": [ring]})
+
+    return polygons
+
+
+def parse_bbox(value):
+    """
+    Parse a "west,south,east,north" parameter
+    @return: bbox_geometries() of the box
+    @raise ValueError: invalid box
+    """
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be west,south,east,north")
+
+    return bbox_geometries(*parts)
+
+
+def within_filter(field, geometries):
+    """
+    Query filter matching points inside any of the geometries
+    """
+    if not geometries:
+        return dict()
+    if len(geometries) == 1:
+        return {field: {"$geoWithin": {"$geometry": geometries[0]}}}
+
+    return {"$or": [{field: {"$geoWithin": {"$geometry": geometry}}} for geometry in geometries]}
+
+
+def radius_filter(field, lon, lat, radius):
+    """
+    Query filter matching points within a spherical circle, radius in meters
+    @raise ValueError: invalid center or radius
+    """
+    center = make_point(lon, lat)
+    if center is None:
+        raise ValueError("Center outside of WGS84 bounds")
+    if radius <= 0:
+        raise ValueError("radius must be positive")
+
+    return {field: {"$geoWithin": {"$centerSphere": [center["coordinates"], float(radius) / EARTH_RADIUS]}}}
+
+
+def mercator_x(lon):
+    """
+    Normalized web mercator x, 0 at -180 to 1 at 180
+    """
+    return (lon + 180.0) / 360.0
+
+
+def mercator_y(lat):
+    """
+    Normalized web mercator y, 0 at the top to 1 at the bottom
+    """
+    lat = min(max(lat, -MERCATOR_MAX_LATITUDE), MERCATOR_MAX_LATITUDE)
+    return (1 - math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) / math.pi) / 2
+
+
+def web_mercator(lon, lat):
+    """
+    EPSG:3857 coordinates (meters) of a point, as used by map tiles
+    """
+    x = math.radians(lon) * MERCATOR_RADIUS
+    y = (0.5 - mercator_y(lat)) * 2 * math.pi * MERCATOR_RADIUS
+    return x, y
+
+
+def get_cluster_cell_size(zoom):
+    """
+    Grid cell size in normalized mercator units, CLUSTER_CELLS_PER_TILE cells per tile side
+    """
+    zoom = min(max(int(zoom), 0), MAX_ZOOM)
+    return 1.0 / (2 ** zoom * CLUSTER_CELLS_PER_TILE)
+
+
+def get_fit_zoom(west, south, east, north, tiles=3):
+    """
+    Highest zoom level at which the extent fits in tiles x tiles map tiles
+    """
+    width = max(mercator_x(east) - mercator_x(west), mercator_y(south) - mercator_y(north))
+    if width <= 0:
+        return MAX_ZOOM
+
+    return min(max(int(math.floor(math.log2(tiles / width))), 0), MAX_ZOOM)
+
+
+def cluster_pipeline(doc_filter, zoom, limit):
+    """
+    Aggregation grouping points into a web mercator grid whose cells shrink with the zoom level
+    @return: pipeline producing {"count", "lon", "lat", "device"} per non empty cell, largest first.
+    "lon"/"lat" are the centroid, "device" the only device of single point cells
+    """
+    cell = get_cluster_cell_size(zoom)
+    lon = {"$arrayElemAt": ["$location.coordinates", 0]}
+    lat = {"$arrayElemAt": ["$location.coordinates", 1]}
+    clamped_lat = {"$min": [{"$max": [lat, -MERCATOR_MAX_LATITUDE]}, MERCATOR_MAX_LATITUDE]}
+    x = {"$divide": [{"$add": [lon, 180.0]}, 360.0]}
+    y = {"$divide": [
+        {"$subtract": [1, {"$divide": [
+            {"$ln": {"$tan": {"$add": [math.pi / 4, {"$multiply": [clamped_lat, math.pi / 360]}]}}},
+            math.pi
+        ]}]},
+        2
+    ]}
+    return [
+        {"$match": doc_filter},
+        {"$group": {
+            "_id": {"x": {"$floor": {"$divide": [x, cell]}}, "y": {"$floor": {"$divide": [y, cell]}}},
+            "count": {"$sum": 1},
+            "lon": {"$avg": lon},
+            "lat": {"$avg": lat},
+            "device": {"$first": "$device"},
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "count": 1,
+            "lon": 1,
+            "lat": 1,
+            "device": {"$cond": [{"$eq": ["$count", 1]}, "$device", None]},
+        }},
+    ]
+
+
+def extent_pipeline(doc_filter):
+    """
+    Aggregation of the bounding box of the matching points
+    @return: pipeline producing one {"west", "south", "east", "north"} document, none if no points match
+    """
+    lon = {"$arrayElemAt": ["$location.coordinates", 0]}
+    lat = {"$arrayElemAt": ["$location.coordinates", 1]}
+    return [
+        {"$match": doc_filter},
+        {"$group": {
+            "_id": None,
+            "west": {"$min": lon},
+            "south": {"$min": lat},
+            "east": {"$max": lon},
+            "north": {"$max": lat},
+        }},
+        {"$project": {"_id": 0}},
+    ]
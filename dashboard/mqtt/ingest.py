@@ -0,0 +1,136 @@
+import collections
+import logging
+import threading
+import time
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_DROP_NEWEST = "drop_newest"
+POLICY_SAMPLE = "sample"
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_SAMPLE)
+
+
+class IngestMetrics:
+    def __init__(self):
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.blocked_time = 0.0
+        self.processing_time = 0.0
+        self.processing_time_max = 0.0
+
+    def as_dict(self):
+        metrics = dict(self.__dict__)
+        metrics["processing_time_avg"] = self.processing_time / self.processed if self.processed else 0.0
+        return metrics
+
+
+class IngestQueue:
+    """
+    Bounded queue between the MQTT network thread and the DB writer thread.
+    When full, the overflow policy decides what happens to a new message:
+    block - wait for room (backpressure on the network loop, and so on the broker)
+    drop_oldest - discard the oldest queued message
+    drop_newest - discard the new message
+    sample - keep one in every sample_rate new messages (replacing the oldest), discard the others
+    """
+    def __init__(self, handler, max_size=10000, policy=POLICY_BLOCK, sample_rate=10, name=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown ingest queue policy {policy}")
+
+        self.handler = handler
+        self.max_size = int(max_size)
+        self.policy = policy
+        self.sample_rate = max(int(sample_rate), 1)
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.metrics = IngestMetrics()
+        self.overflow_count = 0
+        self.running = True
+        self.worker = threading.Thread(target=self.run, name=name or "mqtt-ingest", daemon=True)
+        self.worker.start()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, *item):
+        """
+        Queue a message for the handler
+        @return: True if the message was queued
+        """
+        with self.condition:
+            if len(self.items) >= self.max_size and not self.make_room():
+                self.metrics.dropped += 1
+                return False
+
+            self.items.append(item)
+            self.metrics.enqueued += 1
+            self.condition.notify_all()
+            return True
+
+    def make_room(self):
+        # Called with the condition held and the queue full
+        if self.policy == POLICY_BLOCK:
+            start = time.monotonic()
+            while self.running and len(self.items) >= self.max_size:
+                self.condition.wait(1.0)
+            self.metrics.blocked_time += time.monotonic() - start
+            return self.running
+        elif self.policy == POLICY_DROP_OLDEST:
+            self.items.popleft()
+            self.metrics.dropped += 1
+            return True
+        elif self.policy == POLICY_SAMPLE:
+            self.overflow_count += 1
+            if self.overflow_count % self.sample_rate != 0:
+                return False
+
+            self.items.popleft()
+            self.metrics.dropped += 1
+            return True
+
+        return False
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.items:
+                    self.condition.wait()
+
+                if not self.running:
+                    return
+
+                item = self.items.popleft()
+                if not self.items:
+                    self.overflow_count = 0
+                self.condition.notify_all()
+
+            start = time.perf_counter()
+            try:
+                self.handler(*item)
+            except Exception as e:
+                self.metrics.failed += 1
+                logging.error(f"Ingest handler failed: {e}")
+
+            elapsed = time.perf_counter() - start
+            self.metrics.processed += 1
+            self.metrics.processing_time += elapsed
+            self.metrics.processing_time_max = max(self.metrics.processing_time_max, elapsed)
+
+    def stop(self):
+        """
+        Stop the worker, queued messages are discarded
+        """
+        with self.condition:
+            self.running = False
+            self.metrics.dropped += len(self.items)
+            self.items.clear()
+            self.condition.notify_all()
+
+    def get_metrics(self):
+        metrics = self.metrics.as_dict()
+        metrics["queued"] = len(self.items)
+        metrics["max_size"] = self.max_size
+        metrics["policy"] = self.policy
+        return metrics
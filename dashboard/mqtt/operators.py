@@ -0,0 +1,124 @@
+import collections
+import threading
+
+from ..models import DataObject
+
+
+class MovingAverage:
+    def __init__(self, window):
+        self.values = collections.deque(maxlen=max(int(window), 1))
+        self.total = 0.0
+
+    def update(self, timestamp, value):
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        return self.total / len(self.values)
+
+
+class Ewma:
+    def __init__(self, alpha):
+        self.alpha = float(alpha)
+        self.value = None
+
+    def update(self, timestamp, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value = self.alpha * value + (1 - self.alpha) * self.value
+        return self.value
+
+
+class Derivative:
+    """
+    Change per second between consecutive samples
+    """
+    def __init__(self, param=None):
+        self.last = None
+
+    def get_delta(self, value, last_value):
+        return value - last_value
+
+    def update(self, timestamp, value):
+        last, self.last = self.last, (timestamp, value)
+        if last is None or timestamp <= last[0]:
+            return None
+
+        return self.get_delta(value, last[1]) / (timestamp - last[0])
+
+
+class CounterRate(Derivative):
+    """
+    Increase per second of a monotonic counter, a decrease is taken as a counter reset
+    """
+    def get_delta(self, value, last_value):
+        return value - last_value if value >= last_value else value
+
+
+class RollingExtreme:
+    """
+    Min (or max) of the last window samples, monotonic deque so each sample costs amortised O(1)
+    """
+    def __init__(self, window, maximum=False):
+        self.window = max(int(window), 1)
+        self.maximum = maximum
+        self.count = 0
+        self.candidates = collections.deque()
+
+    def update(self, timestamp, value):
+        self.count += 1
+        while self.candidates and (
+                self.candidates[-1][1] <= value if self.maximum else self.candidates[-1][1] >= value):
+            self.candidates.pop()
+        self.candidates.append((self.count, value))
+        if self.candidates[0][0] <= self.count - self.window:
+            self.candidates.popleft()
+
+        return self.candidates[0][1]
+
+
+def create_operator(data_object):
+    operator = data_object.operator
+    param = data_object.operator_param
+    if operator == DataObject.OPERATOR_MOVING_AVERAGE:
+        return MovingAverage(param)
+    elif operator == DataObject.OPERATOR_EWMA:
+        return Ewma(param)
+    elif operator == DataObject.OPERATOR_DERIVATIVE:
+        return Derivative()
+    elif operator == DataObject.OPERATOR_RATE:
+        return CounterRate()
+    elif operator == DataObject.OPERATOR_MIN:
+        return RollingExtreme(param)
+    elif operator == DataObject.OPERATOR_MAX:
+        return RollingExtreme(param, maximum=True)
+
+    raise ValueError(f"Unknown operator {operator}")
+
+
+class DerivedSeries:
+    """
+    Streaming operator state of derived data objects, O(1) per sample
+    """
+    def __init__(self):
+        self.operators = dict()
+        self.lock = threading.Lock()
+
+    def update(self, data_object, timestamp, value):
+        """
+        Feed a source sample to a derived data object
+        @return: derived value, None while the operator has no output yet
+        """
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+
+        # A changed definition starts from scratch
+        key = (data_object.operator, data_object.operator_param)
+        with self.lock:
+            state = self.operators.get(data_object.pk, None)
+            if state is None or state[0] != key:
+                state = (key, create_operator(data_object))
+                self.operators[data_object.pk] = state
+
+            return state[1].update(timestamp, float(value))
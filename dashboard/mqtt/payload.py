@@ -0,0 +1,182 @@
+import functools
+import json
+import logging
+import re
+import struct
+
+from ..utils import is_installed
+
+PARSED_JSON = "json"
+PARSED_CBOR = "cbor"
+PARSED_MSGPACK = "msgpack"
+
+# First step of a key path, then steps separated by "." or "["
+KEY_PATH_FIRST_STEP = re.compile(r"([^.\[\]]+)|\[(-?\d+)\]")
+KEY_PATH_STEP = re.compile(r"\.([^.\[\]]+)|\[(-?\d+)\]")
+
+
+def json_loads(data):
+    """
+    Decode JSON with orjson when installed, stdlib json otherwise
+    @raise ValueError: invalid JSON
+    """
+    if is_installed("orjson"):
+        import orjson
+
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+class Payload:
+    """
+    Message payload shared by all topics matching a message, each representation is decoded at most once
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        self.parsed = dict()
+
+    def get(self, kind, decoder):
+        """
+        Get a decoded representation
+        @param kind: cache key of the representation
+        @param decoder: called with the raw payload on first access
+        """
+        try:
+            return self.parsed[kind]
+        except KeyError:
+            pass
+
+        value = decoder(self.raw)
+        self.parsed[kind] = value
+        return value
+
+    def get_json(self):
+        """
+        @return: decoded JSON document, or the payload text if it is not JSON (None if not text either)
+        """
+        return self.get(PARSED_JSON, decode_json_or_text)
+
+    def get_cbor(self):
+        return self.get(PARSED_CBOR, decode_cbor)
+
+    def get_msgpack(self):
+        return self.get(PARSED_MSGPACK, decode_msgpack)
+
+    def unpack(self, struct_format, offset=0):
+        """
+        Unpack a fixed layout field
+        @param struct_format: struct module format string, e.g. "<f" or "<dd"
+        @param offset: byte offset of the field
+        @return: value, tuple if the format has several items, None if the payload is too short
+        """
+        return self.get(("struct", struct_format, offset), lambda raw: unpack_field(raw, struct_format, offset))
+
+
+def decode_json_or_text(raw):
+    try:
+        return json_loads(raw)
+    except ValueError:
+        pass
+
+    try:
+        return raw.decode()
+    except UnicodeDecodeError:
+        logging.debug("Payload is neither JSON nor text")
+        return None
+
+
+def decode_cbor(raw):
+    if not is_installed("cbor2"):
+        logging.debug("CBOR payload received but cbor2 is not installed")
+        return None
+
+    import cbor2
+
+    try:
+        return cbor2.loads(raw)
+    except (cbor2.CBORDecodeError, ValueError) as e:
+        logging.debug(f"Invalid CBOR payload: {e}")
+        return None
+
+
+def decode_msgpack(raw):
+    if not is_installed("msgpack"):
+        logging.debug("MessagePack payload received but msgpack is not installed")
+        return None
+
+    import msgpack
+
+    try:
+        return msgpack.unpackb(raw)
+    except (msgpack.UnpackException, ValueError) as e:
+        logging.debug(f"Invalid MessagePack payload: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=256)
+def get_struct(struct_format):
+    """
+    Compiled struct, shared by all data objects using the same format
+    @raise struct.error: invalid format
+    """
+    return struct.Struct(struct_format)
+
+
+def unpack_field(raw, struct_format, offset=0):
+    try:
+        values = get_struct(struct_format).unpack_from(raw, offset)
+    except struct.error as e:
+        logging.debug(f"Unpack {struct_format} at {offset} failed: {e}")
+        return None
+
+    return values[0] if len(values) == 1 else values
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_key_path(key):
+    """
+    Compile a data object key into an accessor, parsed once per distinct key
+    Keys are dotted paths with optional array indexes, e.g. "temp", "sensors[0].value", "$.gps.lat".
+    A top level key equal to the whole key (e.g. "gps.lat") takes precedence over the path.
+    @return: callable(document) -> value or None
+    @raise ValueError: invalid key path
+    """
+    path = key[2:] if key.startswith("$.") else key
+    steps = list()
+    position = 0
+    while position < len(path):
+        step = KEY_PATH_STEP if position else KEY_PATH_FIRST_STEP
+        match = step.match(path, position)
+        if match is None:
+            raise ValueError(f"Invalid key path {key}")
+
+        name, index = match.groups()
+        steps.append(name if index is None else int(index))
+        position = match.end()
+
+    if not steps:
+        raise ValueError(f"Invalid key path {key}")
+
+    if len(steps) == 1 and isinstance(steps[0], str):
+        # Top level key, the common case
+        name = steps[0]
+        return lambda document: document.get(name, None) if isinstance(document, dict) else None
+
+    def accessor(document):
+        if isinstance(document, dict) and key in document:
+            return document[key]
+
+        for step in steps:
+            if isinstance(document, (str, bytes)):
+                # Do not index into strings
+                return None
+
+            try:
+                document = document[step]
+            except (KeyError, IndexError, TypeError):
+                return None
+
+        return document
+
+    return accessor
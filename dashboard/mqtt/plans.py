@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ..models import Project, Topic, DataObject, AlertRule
+from ..permissions import bump_version
+from .payload import compile_key_path
+from .expressions import parse_expression, compile_node, ExpressionError
+
+GLOBAL_VERSION_KEY = "dashboard:plans:version"
+
+# {project id: (shared version, checked at, built at, plan)}
+_plans = dict()
+_generation = 0
+_lock = threading.Lock()
+
+
+class TopicPlan:
+    """
+    Data objects of a topic with their compiled key accessors, derived data objects by source,
+    compiled expressions, enabled alert rules by data object and the keys of location data objects
+    """
+    def __init__(self, topic, data_objects, alert_rules=None):
+        self.topic = topic
+        self.extractors = list()
+        self.derived = dict()
+        self.expressions = list()
+        self.alert_rules = dict()
+        self.dedup_accessor = None
+        if topic.dedup_key:
+            try:
+                self.dedup_accessor = compile_key_path(topic.dedup_key)
+            except ValueError as e:
+                logging.debug(f"Topic {topic.pk}: {e}")
+        self.locations = frozenset(
+            f"{data_object.pk}" for data_object in data_objects
+            if data_object.data_type == DataObject.DATA_TYPE_LOCATION
+        )
+        for rule in alert_rules or ():
+            self.alert_rules.setdefault(rule.data_object_id, list()).append(rule)
+        names = {data_object.name: f"{data_object.pk}" for data_object in data_objects}
+        expressions = list()
+        for data_object in data_objects:
+            if data_object.is_expression():
+                try:
+                    resolve = {name: key for name, key in names.items() if key != f"{data_object.pk}"}
+                    tree, references = parse_expression(data_object.expression)
+                    expression = compile_node(tree.body, resolve)
+                    expressions.append((data_object, expression, {resolve[name] for name in references}))
+                except ExpressionError as e:
+                    logging.debug(f"Data object {data_object.pk}: {e}")
+                continue
+
+            if data_object.is_derived():
+                if data_object.source_id is not None and data_object.operator:
+                    self.derived.setdefault(data_object.source_id, list()).append(data_object)
+                continue
+
+            try:
+                accessor = compile_key_path(data_object.key) if data_object.key else None
+            except ValueError as e:
+                logging.debug(f"Data object {data_object.pk}: {e}")
+                continue
+
+            self.extractors.append((data_object, accessor))
+
+        self.expressions = sort_expressions(expressions)
+
+
+def sort_expressions(expressions):
+    """
+    Order expressions so the expressions they reference are evaluated first
+    @param expressions: [(data_object, compiled expression, keys of the referenced values)] in pk order
+    @return: [(data_object, compiled expression)], expressions in a reference cycle are left out
+    """
+    pending = {f"{entry[0].pk}": entry for entry in expressions}
+    ordered = list()
+    while pending:
+        ready = [key for key, (_, _, references) in pending.items() if not references & pending.keys()]
+        if not ready:
+            logging.debug(f"Expression reference cycle between data objects {', '.join(pending)}")
+            break
+
+        for key in ready:
+            data_object, expression, _ = pending.pop(key)
+            ordered.append((data_object, expression))
+
+    return ordered
+
+
+class ProjectPlan:
+    """
+    Everything needed to process a project's messages without per message queries
+    """
+    def __init__(self, project, topic_plans):
+        self.project = project
+        self.topic_plans = topic_plans
+        self.no_data_rules = [
+            rule
+            for topic_plan in topic_plans
+            for rules in topic_plan.alert_rules.values()
+            for rule in rules
+            if rule.rule_type == AlertRule.RULE_NO_DATA
+        ]
+
+
+def build_project_plan(project_id):
+    project = Project.objects.get(pk=project_id)
+    data_objects = dict()
+    for data_object in DataObject.objects.filter(topic__project_id=project_id).order_by("pk"):
+        data_objects.setdefault(data_object.topic_id, list()).append(data_object)
+
+    alert_rules = dict()
+    rules = AlertRule.objects.filter(data_object__topic__project_id=project_id, enabled=True).order_by("pk")
+    for rule in rules.select_related("data_object"):
+        alert_rules.setdefault(rule.data_object.topic_id, list()).append(rule)
+
+    topic_plans = [
+        TopicPlan(topic, data_objects.get(topic.pk, list()), alert_rules.get(topic.pk, None))
+        for topic in Topic.objects.filter(project_id=project_id).order_by("pk")
+    ]
+    return ProjectPlan(project, topic_plans)
+
+
+def get_plan_cache_settings():
+    return getattr(settings, "MQTT_PLAN_CACHE", dict())
+
+
+def get_project_version_key(project_id):
+    return f"dashboard:plans:version:{project_id}"
+
+
+def get_shared_version(project_id):
+    """
+    Version of a project's plan in the shared cache, bumped by changes made in any process
+    """
+    versions = cache.get_many([GLOBAL_VERSION_KEY, get_project_version_key(project_id)])
+    return versions.get(GLOBAL_VERSION_KEY, 0), versions.get(get_project_version_key(project_id), 0)
+
+
+def get_project_plan(project_id, now=None):
+    """
+    Get the cached extraction plan of a project, rebuilt after any change to its topics, data objects or rules.
+    Changes of this process apply at once, changes of other processes once the shared version is checked
+    (every check_interval seconds), and plans older than max_age are rebuilt regardless.
+    @raise Project.DoesNotExist: unknown project
+    """
+    if now is None:
+        now = time.monotonic()
+
+    cache_settings = get_plan_cache_settings()
+    entry = _plans.get(project_id, None)
+    if entry is not None and now - entry[1] < cache_settings.get("check_interval", 1.0):
+        return entry[3]
+
+    generation = _generation
+    version = get_shared_version(project_id)
+    if entry is not None and entry[0] == version and now - entry[2] < cache_settings.get("max_age", 30.0):
+        with _lock:
+            if generation == _generation:
+                _plans[project_id] = (version, now, entry[2], entry[3])
+        return entry[3]
+
+    plan = build_project_plan(project_id)
+    with _lock:
+        # Not cached if something changed while building
+        if generation == _generation:
+            _plans[project_id] = (version, now, now, plan)
+
+    return plan
+
+
+def invalidate(project_id):
+    global _generation
+    with _lock:
+        _generation += 1
+        _plans.pop(project_id, None)
+
+    # Other processes rebuild once the change is visible to them
+    transaction.on_commit(lambda: bump_version(get_project_version_key(project_id)))
+
+
+def invalidate_all():
+    global _generation
+    with _lock:
+        _generation += 1
+        _plans.clear()
+
+    transaction.on_commit(lambda: bump_version(GLOBAL_VERSION_KEY))
+
+
+@receiver([post_save, post_delete], sender=Project)
+def project_changed(sender, instance, **kwargs):
+    invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Topic)
+def topic_changed(sender, instance, **kwargs):
+    invalidate(instance.project_id)
+
+
+@receiver([post_save, post_delete], sender=DataObject)
+def dataobject_changed(sender, instance, **kwargs):
+    try:
+        project_id = instance.topic.project_id
+    except Topic.DoesNotExist:
+        # Deleted along with its topic, which invalidates the project
+        return
+
+    invalidate(project_id)
+
+
+@receiver([post_save, post_delete], sender=AlertRule)
+def alert_rule_changed(sender, instance, **kwargs):
+    # The rule's data object may already be gone (cascade), rules change rarely
+    invalidate_all()
@@ -0,0 +1,156 @@
+import logging
+import random
+import threading
+import time
+
+
+class ReconnectMetrics:
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_attempt = None
+        self.last_connected = None
+        self.last_disconnected = None
+        self.last_error = None
+        self.next_delay = 0.0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class ReconnectScheduler:
+    """
+    Schedules broker (re)connection attempts of all MQTT clients.
+    Retries use exponential backoff with jitter and at most max_concurrent attempts run at a time,
+    so a broker coming back after an outage is not hit by every client at once.
+    A watcher thread restarts network loops of clients that are not running.
+    """
+    def __init__(self, min_delay=1.0, max_delay=120.0, max_concurrent=10, check_interval=5.0):
+        self.min_delay = float(min_delay)
+        self.max_delay = float(max_delay)
+        self.check_interval = float(check_interval)
+        self.slots = threading.BoundedSemaphore(int(max_concurrent))
+        self.metrics = dict()
+        self.metrics_lock = threading.Lock()
+        self.wake_events = dict()
+        self.watcher = None
+        self.stop_event = threading.Event()
+
+    def get_metrics(self, client_id):
+        with self.metrics_lock:
+            metrics = self.metrics.get(client_id, None)
+            if metrics is None:
+                metrics = ReconnectMetrics()
+                self.metrics[client_id] = metrics
+
+            return metrics
+
+    def get_all_metrics(self):
+        with self.metrics_lock:
+            return {client_id: metrics.as_dict() for client_id, metrics in self.metrics.items()}
+
+    def forget(self, client_id):
+        with self.metrics_lock:
+            self.metrics.pop(client_id, None)
+            self.wake_events.pop(client_id, None)
+
+    def get_delay(self, failures):
+        """
+        Exponential backoff with "equal jitter": half of the delay is fixed, half random
+        """
+        delay = min(self.max_delay, self.min_delay * (2 ** max(failures - 1, 0)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def get_wake_event(self, client_id):
+        with self.metrics_lock:
+            return self.wake_events.setdefault(client_id, threading.Event())
+
+    def wake(self, client_id):
+        """
+        Skip the remaining backoff of a client (e.g. user requested refresh)
+        """
+        self.get_wake_event(client_id).set()
+
+    def wait(self, mqtt_client):
+        """
+        Sleep before the next attempt of a client, called from the client's network thread
+        """
+        metrics = self.get_metrics(mqtt_client.id)
+        delay = self.get_delay(metrics.consecutive_failures)
+        metrics.next_delay = delay
+        wake_event = self.get_wake_event(mqtt_client.id)
+        deadline = time.monotonic() + delay
+        while not mqtt_client.is_stopping():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if wake_event.wait(min(remaining, 1.0)):
+                break
+
+        wake_event.clear()
+
+    def attempt(self, mqtt_client, connect):
+        """
+        Run a connection attempt once a slot is free
+        @param connect: callable doing the connection (socket connect + CONNECT packet)
+        """
+        while not self.slots.acquire(timeout=1.0):
+            if mqtt_client.is_stopping():
+                raise OSError("Client stopping")
+
+        metrics = self.get_metrics(mqtt_client.id)
+        metrics.attempts += 1
+        metrics.last_attempt = time.time()
+        try:
+            return connect()
+        except Exception as e:
+            self.record_failure(mqtt_client.id, e)
+            raise
+        finally:
+            self.slots.release()
+
+    def record_failure(self, client_id, error):
+        metrics = self.get_metrics(client_id)
+        metrics.failures += 1
+        metrics.consecutive_failures += 1
+        metrics.last_error = repr(error)
+        logging.debug(f"Connection attempt of client {client_id} failed: {error}")
+
+    def record_connected(self, client_id):
+        metrics = self.get_metrics(client_id)
+        metrics.successes += 1
+        metrics.consecutive_failures = 0
+        metrics.last_connected = time.time()
+        metrics.last_error = None
+
+    def record_disconnected(self, client_id):
+        self.get_metrics(client_id).last_disconnected = time.time()
+
+    def start(self, manager):
+        """
+        Start the watcher thread of a client manager
+        """
+        if self.watcher is not None and self.watcher.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.watcher = threading.Thread(target=self.watch, args=(manager,), name="mqtt-reconnect", daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def watch(self, manager):
+        while not self.stop_event.wait(self.check_interval):
+            for mqtt_client in manager.client_list:
+                if mqtt_client.stopped or mqtt_client.is_loop_running():
+                    continue
+
+                logging.debug(f"Restart network loop of client {mqtt_client.id}")
+                try:
+                    manager.connect_client(mqtt_client.id)
+                    manager.start_client(mqtt_client.id)
+                except Exception as e:
+                    self.record_failure(mqtt_client.id, e)
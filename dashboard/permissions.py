@@ -0,0 +1,155 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from guardian import shortcuts
+from guardian.models import UserObjectPermission, GroupObjectPermission
+
+from .models import Project
+
+GLOBAL_VERSION_KEY = "dashboard:perms:version"
+
+
+def get_cache_timeout():
+    return getattr(settings, "PERMISSION_CACHE_TIMEOUT", 3600)
+
+
+def get_user_version_key(user_id):
+    return f"dashboard:perms:version:{user_id}"
+
+
+def get_versions(user_id):
+    versions = cache.get_many([GLOBAL_VERSION_KEY, get_user_version_key(user_id)])
+    return versions.get(GLOBAL_VERSION_KEY, 0), versions.get(get_user_version_key(user_id), 0)
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def bump_versions(user_or_group):
+    if isinstance(user_or_group, User):
+        bump_version(get_user_version_key(user_or_group.pk))
+    else:
+        # Groups, or several users or groups at once
+        bump_version(GLOBAL_VERSION_KEY)
+
+
+def assign_perm(perm, user_or_group, obj=None):
+    """
+    guardian.shortcuts.assign_perm invalidating cached permissions.
+    Assigning to a queryset or list (of objects, users or groups) goes through guardian's bulk_create paths,
+    which send no post_save: use this function instead of guardian's for project permissions
+    """
+    result = shortcuts.assign_perm(perm, user_or_group, obj)
+    bump_versions(user_or_group)
+    return result
+
+
+def remove_perm(perm, user_or_group=None, obj=None):
+    """
+    guardian.shortcuts.remove_perm invalidating cached permissions, see assign_perm
+    """
+    result = shortcuts.remove_perm(perm, user_or_group, obj)
+    bump_versions(user_or_group)
+    return result
+
+
+def compute_project_perms(user):
+    """
+    Compute the object permissions a user has on every project, in two queries
+    @param user: user
+    @return: dict {project pk: frozenset of permission codenames}
+    """
+    if user.is_superuser:
+        codenames = frozenset(codename for codename, _ in Project._meta.permissions)
+        return {pk: codenames for pk in Project.objects.values_list("pk", flat=True)}
+
+    content_type = ContentType.objects.get_for_model(Project)
+    project_perms = dict()
+    user_perms = UserObjectPermission.objects.filter(
+        user=user, content_type=content_type
+    ).values_list("object_pk", "permission__codename")
+    group_perms = GroupObjectPermission.objects.filter(
+        group__user=user, content_type=content_type
+    ).values_list("object_pk", "permission__codename")
+
+    for object_pk, codename in list(user_perms) + list(group_perms):
+        project_perms.setdefault(int(object_pk), set()).add(codename)
+
+    return {pk: frozenset(codenames) for pk, codenames in project_perms.items()}
+
+
+def get_project_perms(user):
+    """
+    Get the cached object permissions of a user on every project
+    @param user: user
+    @return: dict {project pk: frozenset of permission codenames}
+    """
+    if not user or not user.is_authenticated:
+        return dict()
+
+    global_version, user_version = get_versions(user.pk)
+    key = f"dashboard:perms:{user.pk}:{global_version}:{user_version}"
+    project_perms = cache.get(key, None)
+    if project_perms is None:
+        project_perms = compute_project_perms(user)
+        cache.set(key, project_perms, timeout=get_cache_timeout())
+
+    return project_perms
+
+
+def get_perms(user, project):
+    """
+    Cached replacement of guardian.shortcuts.get_perms for projects
+    """
+    return get_project_perms(user).get(project.pk, frozenset())
+
+
+def get_projects_for_user(user, perms):
+    """
+    Cached replacement of guardian.shortcuts.get_objects_for_user(user, perms, any_perm=True) for projects
+    @param perms: permission names, with or without app label
+    @return: Project queryset
+    """
+    codenames = {perm.split(".")[-1] for perm in perms}
+    project_ids = [pk for pk, user_perms in get_project_perms(user).items() if codenames & user_perms]
+    return Project.objects.filter(pk__in=project_ids)
+
+
+@receiver([post_save, post_delete], sender=UserObjectPermission)
+def user_permission_changed(sender, instance, **kwargs):
+    logging.debug(f"Object permissions changed for user {instance.user_id}")
+    bump_version(get_user_version_key(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=GroupObjectPermission)
+def group_permission_changed(sender, instance, **kwargs):
+    logging.debug(f"Object permissions changed for group {instance.group_id}")
+    bump_version(GLOBAL_VERSION_KEY)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, **kwargs):
+    if not action.startswith("post_"):
+        return
+
+    if isinstance(instance, User):
+        bump_version(get_user_version_key(instance.pk))
+    else:
+        bump_version(GLOBAL_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=Project)
+def project_changed(sender, instance, **kwargs):
+    if kwargs.get("created", True):
+        # Superusers have every permission on every project, their cached project list changes
+        bump_version(GLOBAL_VERSION_KEY)
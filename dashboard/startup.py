@@ -0,0 +1,90 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from . import utils
+
+# Lock file of the process running the MQTT clients, kept open for the process lifetime
+_startup_lock = None
+_run_lock = threading.Lock()
+
+
+def restore_project_client(project):
+    from .mqtt import mqtt_client_manager
+
+    mqtt_client_manager.sync_client(project.pk, project.host, project.port)
+    return project.pk
+
+
+def restore_clients(max_workers=None):
+    """
+    Create and connect an MQTT client for every project, concurrently
+    @param max_workers: concurrent restorations (default settings.MQTT_RESTORE_WORKERS)
+    @return: restored project ids
+    """
+    from .models import Project
+
+    if max_workers is None:
+        max_workers = getattr(settings, "MQTT_RESTORE_WORKERS", 8)
+
+    projects = list(Project.objects.only("pk", "host", "port"))
+    if not projects:
+        return list()
+
+    restored = list()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(restore_project_client, project): project for project in projects}
+        for fut in concurrent.futures.as_completed(futures):
+            try:
+                restored.append(fut.result())
+            except Exception as e:
+                logging.error(f"Restore client {futures[fut].pk} failed: {e}")
+
+    return restored
+
+
+def run():
+    """
+    Explicit startup phase, called by the ASGI entry point once the application is loaded,
+    and by dashboard.mqtt.control on first use in processes without one (WSGI, runserver).
+    Only one process per host runs the MQTT clients (settings.MQTT_STARTUP_LOCK): brokers drop sessions
+    whose client id is already connected, so every worker connecting each project would make them fight.
+    Other processes control the clients through the database, see dashboard.mqtt.control.
+    @return: True if this process runs the MQTT clients
+    """
+    global _startup_lock
+    from .mqtt import mqtt_client_manager
+
+    if _startup_lock is not None:
+        return True
+
+    with _run_lock:
+        if _startup_lock is not None:
+            return True
+
+        lock = utils.acquire_process_lock(settings.MQTT_STARTUP_LOCK)
+        if lock is None:
+            logging.debug("MQTT clients run in another process")
+            return False
+
+        logging.info("MQTT clients run in this process")
+        mqtt_client_manager.start()
+        _startup_lock = lock
+
+    if not getattr(settings, "MQTT_RESTORE_ON_STARTUP", False):
+        return True
+
+    start = time.perf_counter()
+    try:
+        restored = restore_clients()
+    except DatabaseError as e:
+        # e.g. migrations not applied yet
+        logging.error(f"Client restoration skipped: {e}")
+        return True
+
+    logging.info(f"Restored {len(restored)} MQTT clients in {time.perf_counter() - start:.3f}s")
+    return True
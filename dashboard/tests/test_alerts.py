@@ -0,0 +1,76 @@
+from django.test import SimpleTestCase
+
+from ..models import AlertRule, DataObject, Topic
+from ..mqtt.alerts import AlertEngine, STATE_FIRED, STATE_RESOLVED
+from ..mqtt.client import MessageParserMixin
+from ..mqtt.payload import Payload
+from ..mqtt.plans import TopicPlan
+
+DATA_OBJECT = DataObject(pk=1, name="temp", key="temp", format=DataObject.FORMAT_CHOICE_JSON,
+                         data_type=DataObject.DATA_TYPE_NUMBER)
+
+
+def make_rule(pk, rule_type, threshold=None, hysteresis=0, timeout=None):
+    return AlertRule(pk=pk, name=f"r{pk}", rule_type=rule_type, threshold=threshold, hysteresis=hysteresis,
+                     timeout=timeout, data_object=DATA_OBJECT)
+
+
+class AlertEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = AlertEngine()
+
+    def feed(self, rules, values):
+        for timestamp, value in enumerate(values):
+            self.engine.evaluate(rules, DATA_OBJECT, float(timestamp), value)
+        return [(event["state"], event["value"]) for event in self.engine.drain()]
+
+    def test_above_with_hysteresis(self):
+        rules = [make_rule(1, AlertRule.RULE_ABOVE, threshold=30, hysteresis=2)]
+        self.assertEqual(self.feed(rules, [25, 31, 35, 29, 27, 32]), [
+            (STATE_FIRED, 31), (STATE_RESOLVED, 27), (STATE_FIRED, 32),
+        ])
+        self.assertEqual(self.engine.drain(), list())
+
+    def test_below(self):
+        rules = [make_rule(1, AlertRule.RULE_BELOW, threshold=0)]
+        self.assertEqual(self.feed(rules, [1, -1, -2, 0.5]), [(STATE_FIRED, -1), (STATE_RESOLVED, 0.5)])
+
+    def test_rate(self):
+        rules = [make_rule(1, AlertRule.RULE_RATE, threshold=5)]
+        self.assertEqual(self.feed(rules, [0, 2, 10, 12]), [(STATE_FIRED, 10), (STATE_RESOLVED, 12)])
+
+    def test_non_numeric_values_are_ignored(self):
+        rules = [make_rule(1, AlertRule.RULE_ABOVE, threshold=0)]
+        self.assertEqual(self.feed(rules, ["high", True, None]), list())
+
+    def test_changed_rule_starts_over(self):
+        self.feed([make_rule(1, AlertRule.RULE_ABOVE, threshold=30)], [31])
+        self.assertEqual(self.feed([make_rule(1, AlertRule.RULE_ABOVE, threshold=40)], [45]), [(STATE_FIRED, 45)])
+
+    def test_no_data(self):
+        rules = [make_rule(1, AlertRule.RULE_NO_DATA, timeout=10)]
+        # First check starts the grace period of a data object never seen
+        self.engine.check_timeouts(rules, 100)
+        self.engine.check_timeouts(rules, 105)
+        self.assertEqual(self.engine.drain(), list())
+
+        self.engine.check_timeouts(rules, 111)
+        event, = self.engine.drain()
+        self.assertEqual((event["state"], event["timestamp"]), (STATE_FIRED, 111))
+
+        self.engine.evaluate(rules, DATA_OBJECT, 112, 1)
+        self.assertEqual([event["state"] for event in self.engine.drain()], [STATE_RESOLVED])
+
+
+class IngestAlertTests(SimpleTestCase):
+    def test_rules_of_extracted_values(self):
+        rule = make_rule(1, AlertRule.RULE_ABOVE, threshold=30)
+        plan = TopicPlan(Topic(pk=1), [DATA_OBJECT], alert_rules=[rule])
+        parser = MessageParserMixin()
+        parser.alert_engine = AlertEngine()
+
+        parser.create_mongodb_data_object(plan, Payload(b'{"temp": 31}'), timestamp=1.0)
+        parser.create_mongodb_data_object(plan, Payload(b'{"hum": 50}'), timestamp=2.0)
+
+        event, = parser.alert_engine.drain()
+        self.assertEqual((event["rule"], event["dataobject"], event["value"]), (1, 1, 31.0))
@@ -0,0 +1,127 @@
+import json
+from unittest import mock
+
+import msgpack
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from ..models import DataObject, Project, Topic
+from .. import permissions, utils
+
+
+class AcceptTests(SimpleTestCase):
+    def accepts_msgpack(self, accept):
+        return utils.accepts_msgpack(RequestFactory().get("/", HTTP_ACCEPT=accept))
+
+    def test_parse(self):
+        self.assertEqual(utils.parse_accept("Application/JSON;q=0.5, application/msgpack, */*;q=0.1"), {
+            "application/json": 0.5, "application/msgpack": 1.0, "*/*": 0.1,
+        })
+        self.assertEqual(utils.parse_accept("text/html;q=x, ,"), {"text/html": 0.0})
+
+    def test_quality(self):
+        accepted = utils.parse_accept("application/*;q=0.8, */*;q=0.1")
+        self.assertEqual(utils.get_accept_quality(accepted, "application/msgpack"), 0.8)
+        self.assertEqual(utils.get_accept_quality(accepted, "text/csv"), 0.1)
+        self.assertEqual(utils.get_accept_quality(dict(), "text/csv"), 0.0)
+
+    def test_preference(self):
+        self.assertTrue(self.accepts_msgpack("application/x-msgpack"))
+        self.assertTrue(self.accepts_msgpack("application/json;q=0.5, application/msgpack"))
+        self.assertFalse(self.accepts_msgpack("application/json, application/msgpack"))
+        self.assertFalse(self.accepts_msgpack("application/msgpack;q=0.5, application/json"))
+        self.assertFalse(self.accepts_msgpack("application/msgpack;q=0, */*"))
+        self.assertFalse(self.accepts_msgpack("*/*"))
+        self.assertFalse(self.accepts_msgpack(""))
+
+
+def iter_sample_chunks(samples):
+    async def iter_chunks(project, topics, start=None, end=None, dataobjects=None):
+        yield samples
+
+    return iter_chunks
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("dashboard.startup.run", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user("alice", password="secret")
+        self.project = Project.objects.create(name="p", description="", host="broker", port=1883, db_name="db")
+        self.other_project = Project.objects.create(name="q", description="", host="broker", port=1883, db_name="db")
+        self.topic = Topic.objects.create(name="t", description="", path="sensors/#", project=self.project)
+        self.dataobject = DataObject.objects.create(
+            name="temp", description="", data_type=DataObject.DATA_TYPE_NUMBER,
+            format=DataObject.FORMAT_CHOICE_JSON, key="temp", topic=self.topic,
+        )
+        permissions.assign_perm("can_view", self.user, self.project)
+
+    def get(self, name, args=(), **kwargs):
+        return self.client.get(reverse(f"dashboard:{name}", args=args), **kwargs)
+
+    def test_authentication_required(self):
+        response = self.get("api_projects")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(json.loads(response.content), {"error": "Authentication required"})
+
+    def test_projects(self):
+        self.client.force_login(self.user)
+        response = self.get("api_projects")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual([project["id"] for project in json.loads(response.content)["projects"]], [self.project.pk])
+
+    def test_msgpack(self):
+        self.client.force_login(self.user)
+        response = self.get("api_topics", args=[self.project.pk], HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual([topic["path"] for topic in msgpack.unpackb(response.content)["topics"]], ["sensors/#"])
+
+        response = self.get("api_topics", args=[self.project.pk], HTTP_ACCEPT="application/msgpack;q=0")
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_project_without_access(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.get("api_topics", args=[self.other_project.pk]).status_code, 404)
+
+    def test_series(self):
+        self.client.force_login(self.user)
+        key = f"{self.dataobject.pk}"
+        samples = [(self.topic.pk, float(timestamp), {key: timestamp}) for timestamp in (10, 20, 30)]
+        with mock.patch("dashboard.mongodb.async_db_utils.iter_sample_chunks", iter_sample_chunks(samples)):
+            data = json.loads(self.get("api_series", args=[self.dataobject.pk], data={"limit": 2}).content)
+            self.assertEqual(data["timestamp"], [10.0, 20.0])
+            self.assertEqual(data["value"], [10, 20])
+            self.assertEqual(data["next"], 20.0)
+
+            data = json.loads(self.get("api_series", args=[self.dataobject.pk], data={"after": 20}).content)
+            self.assertEqual(data["timestamp"], [30.0])
+            self.assertIsNone(data["next"])
+
+    def test_series_bad_parameters(self):
+        self.client.force_login(self.user)
+        for params in ({"limit": 0}, {"resolution": "nan"}, {"after": "inf"}):
+            response = self.get("api_series", args=[self.dataobject.pk], data=params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_clusters(self):
+        self.client.force_login(self.user)
+        location = DataObject.objects.create(
+            name="gps", description="", data_type=DataObject.DATA_TYPE_LOCATION,
+            format=DataObject.FORMAT_CHOICE_JSON, key="gps", topic=self.topic,
+        )
+        clusters = [{"count": 3, "lon": 13.4, "lat": 52.5, "device": None}]
+
+        async def get_clusters(project, dataobject, zoom, *args):
+            return clusters
+
+        with mock.patch("dashboard.mongodb.async_db_utils.get_clusters", get_clusters):
+            data = json.loads(self.get("api_clusters", args=[location.pk], data={"zoom": 3}).content)
+            self.assertEqual((data["zoom"], data["clusters"]), (3, clusters))
+            self.assertEqual(self.get("api_clusters", args=[location.pk], data={"zoom": 21}).status_code, 400)
+        # Only location data objects are clustered
+        self.assertEqual(self.get("api_clusters", args=[self.dataobject.pk]).status_code, 404)
@@ -0,0 +1,52 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import DataObject, Project, Topic
+
+
+class QueryDataObjectValuesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="secret")
+        project = Project.objects.create(name="p", description="", host="broker", port=1883, db_name="db")
+        self.topic = Topic.objects.create(name="t", description="", path="sensors/#", project=project)
+        self.data_object = DataObject.objects.create(
+            name="temp", description="", data_type=DataObject.DATA_TYPE_NUMBER,
+            format=DataObject.FORMAT_CHOICE_JSON, key="temp", topic=self.topic,
+        )
+        self.url = reverse("dashboard:get_dataobject_values", args=[self.data_object.pk])
+
+    def test_authentication_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_missing_data_object(self):
+        self.client.force_login(self.user)
+        url = reverse("dashboard:get_dataobject_values", args=[self.data_object.pk + 1])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_line_widget(self):
+        key = f"{self.data_object.pk}"
+        samples = [{"timestamp": 1675245600 + i, "value": {key: float(i)} if i != 1 else {"0": 1}} for i in range(40)]
+        calls = list()
+
+        async def get_data_objects(project, topic):
+            calls.append(topic)
+            return samples
+
+        self.client.force_login(self.user)
+        with mock.patch("dashboard.mongodb.async_db_utils.get_data_objects", get_data_objects):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(calls, [self.topic])
+        rows = response.context["data_list"]
+        # Samples without a value of the data object are skipped, at most 30 rows are shown
+        self.assertEqual(len(rows), 30)
+        self.assertEqual([row.value for row in rows[:2]], [0.0, 2.0])
+        self.assertEqual(rows[0].timestamp, datetime.datetime.fromtimestamp(1675245600))
+        self.assertTrue(response.context["bokeh_div"])
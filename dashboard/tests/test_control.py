@@ -0,0 +1,178 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from ..models import Project, Topic
+from ..mqtt import control
+from ..mqtt.client import MQTTClient
+
+
+class FakeClient:
+    def __init__(self, client_id, connected=True):
+        self.id = client_id
+        self.connected = connected
+        self.subscriptions = None
+
+    def sync_subscriptions(self, wanted=None):
+        self.subscriptions = wanted
+
+
+class FakeManager:
+    def __init__(self, clients=()):
+        self.clients = {c.id: c for c in clients}
+        self.synced = list()
+        self.deleted = list()
+        self.refreshed = False
+
+    @property
+    def client_list(self):
+        return list(self.clients.values())
+
+    def sync_client(self, client_id, host, port=1883):
+        self.synced.append((client_id, host, port))
+        self.clients.setdefault(client_id, FakeClient(client_id))
+
+    def delete_client(self, client_id):
+        self.deleted.append(client_id)
+        self.clients.pop(client_id, None)
+
+    def refresh_clients(self):
+        self.refreshed = True
+
+    def get_reconnect_metrics(self, client_id):
+        return {"attempts": client_id}
+
+    def get_ingest_metrics(self, client_id):
+        return None
+
+
+class ControlTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = mock.Mock()
+        patcher = mock.patch("dashboard.mqtt.mqtt_client_manager", self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def owner(self, owns):
+        patcher = mock.patch("dashboard.startup.run", return_value=owns)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_other_process_leaves_clients_alone(self):
+        self.owner(False)
+        project = Project(pk=1, host="broker", port=1883, connected=True)
+        control.project_saved(project)
+        control.project_deleted(1)
+        control.topics_changed(1)
+        self.assertEqual(self.manager.method_calls, list())
+        self.assertTrue(control.is_connected(project))
+
+    def test_other_process_refresh_is_handed_over(self):
+        self.owner(False)
+        control.refresh()
+        self.manager.refresh_clients.assert_not_called()
+        self.assertTrue(cache.get(control.REFRESH_KEY))
+
+    def test_other_process_reads_published_metrics(self):
+        self.owner(False)
+        self.assertEqual(control.get_metrics(1), {"reconnect": None, "ingest": None})
+        cache.set(control.METRICS_KEY.format(1), {"reconnect": {"attempts": 2}, "ingest": None})
+        self.assertEqual(control.get_metrics(1)["reconnect"], {"attempts": 2})
+
+    def test_owner_applies_changes(self):
+        self.owner(True)
+        control.project_saved(Project(pk=1, host="broker", port=1883))
+        self.manager.sync_client.assert_called_once_with(1, "broker", 1883)
+        control.topics_changed(1)
+        self.manager.get_client.return_value.sync_subscriptions.assert_called_once_with()
+        control.project_deleted(1)
+        self.manager.delete_client.assert_called_once_with(1)
+
+
+class ClientSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sync(self):
+        project = Project.objects.create(name="p", description="", host="broker", port=1883, db_name="db")
+        Topic.objects.create(name="a", description="", path="a/#", qos=0, project=project)
+        Topic.objects.create(name="b", description="", path="a/#", qos=2, project=project)
+        stale = FakeClient(project.pk + 1)
+        manager = FakeManager([stale])
+        cache.set(control.REFRESH_KEY, True)
+
+        control.ClientSync(interval=5).sync(manager)
+
+        self.assertEqual(manager.deleted, [stale.id])
+        self.assertEqual(manager.synced, [(project.pk, "broker", 1883)])
+        self.assertEqual(manager.clients[project.pk].subscriptions, {"a/#": 2})
+        self.assertTrue(manager.refreshed)
+        self.assertIsNone(cache.get(control.REFRESH_KEY))
+        project.refresh_from_db()
+        self.assertTrue(project.connected)
+        self.assertEqual(cache.get(control.METRICS_KEY.format(project.pk))["reconnect"], {"attempts": project.pk})
+
+
+class SubscriptionSyncTests(SimpleTestCase):
+    def setUp(self):
+        self.client = MQTTClient(1, "broker", 1883)
+        self.addCleanup(self.client.ingest_queue.stop)
+        self.client.connected = True
+        self.client.subscribe = mock.Mock(return_value=(0, 1))
+        self.client.unsubscribe = mock.Mock(return_value=(0, 2))
+
+    def test_only_changes_are_sent(self):
+        self.client.sync_subscriptions({"a": 1, "b": 0})
+        self.client.subscribe.assert_called_once_with([("a", 1), ("b", 0)])
+
+        self.client.subscribe.reset_mock()
+        self.assertEqual(self.client.sync_subscriptions({"a": 1, "b": 0}), 0)
+        self.client.subscribe.assert_not_called()
+
+        self.client.sync_subscriptions({"a": 2})
+        self.client.unsubscribe.assert_called_once_with(["b"])
+        self.client.subscribe.assert_called_once_with([("a", 2)])
+        self.assertEqual(self.client.subscriptions, {"a": 2})
+
+    def test_disconnected_client_waits_for_connect(self):
+        self.client.connected = False
+        self.assertEqual(self.client.sync_subscriptions({"a": 1}), 0)
+        self.client.subscribe.assert_not_called()
+
+
+class BatchedSubscribeTests(SimpleTestCase):
+    def setUp(self):
+        self.client = MQTTClient(1, "broker", 1883)
+        self.addCleanup(self.client.ingest_queue.stop)
+        self.client.connected = True
+        self.client.subscribe = mock.Mock(return_value=(0, 1))
+        self.client.control_threadpool = mock.Mock()
+
+    def test_batches(self):
+        wanted = {f"t/{i}": i % 3 for i in range(5)}
+        with self.settings(MQTT_SUBSCRIBE_BATCH_SIZE=2):
+            self.assertEqual(self.client.sync_subscriptions(wanted), 3)
+        self.assertEqual([len(call.args[0]) for call in self.client.subscribe.call_args_list], [2, 2, 1])
+        self.assertEqual(self.client.subscriptions, wanted)
+
+    def test_failed_batch_is_retried_next_sync(self):
+        self.client.subscribe.side_effect = [(0, 1), (4, None)]
+        with self.settings(MQTT_SUBSCRIBE_BATCH_SIZE=1):
+            self.assertEqual(self.client.sync_subscriptions({"a": 0, "b": 0}), 1)
+        self.assertEqual(self.client.subscriptions, {"a": 0})
+
+    def test_new_session_resubscribes_everything(self):
+        self.client.subscriptions = {"a": 0}
+        with mock.patch.object(self.client, "get_topic_subscriptions", return_value={"a": 0}):
+            self.assertEqual(self.client.subscribe_project_topics(), 1)
+        self.client.subscribe.assert_called_once_with([("a", 0)])
+
+    def test_connect_hands_subscribing_off(self):
+        self.client._connected(None, None, {"session present": 0}, 0)
+        self.client.control_threadpool.submit.assert_called_once_with(self.client.subscribe_project_topics)
+
+        self.client.control_threadpool.reset_mock()
+        self.client._connected(None, None, {"session present": 1}, 0)
+        self.client.control_threadpool.submit.assert_not_called()
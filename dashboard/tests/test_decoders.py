@@ -0,0 +1,75 @@
+import struct
+from unittest import mock
+
+import cbor2
+import msgpack
+from django.test import SimpleTestCase
+
+from ..models import DataObject, Topic
+from ..mqtt.client import MessageParserMixin
+from ..mqtt.payload import Payload
+from ..mqtt.plans import TopicPlan
+
+
+def make_data_object(pk, data_format, key="", data_type=DataObject.DATA_TYPE_NUMBER, **kwargs):
+    return DataObject(pk=pk, name=f"d{pk}", format=data_format, key=key, data_type=data_type, **kwargs)
+
+
+class DecoderTests(SimpleTestCase):
+    def extract(self, data_objects, raw):
+        plan = TopicPlan(Topic(pk=1), data_objects)
+        return MessageParserMixin().create_mongodb_data_object(plan, Payload(raw))
+
+    def test_cbor(self):
+        raw = cbor2.dumps({"temp": 21.5, "gps": {"lat": 52.5}, "state": "ok"})
+        data_objects = [
+            make_data_object(1, DataObject.FORMAT_CHOICE_CBOR, "temp"),
+            make_data_object(2, DataObject.FORMAT_CHOICE_CBOR, "gps.lat"),
+            make_data_object(3, DataObject.FORMAT_CHOICE_CBOR, "state", DataObject.DATA_TYPE_STRING),
+        ]
+        with mock.patch("cbor2.loads", wraps=cbor2.loads) as loads:
+            self.assertEqual(self.extract(data_objects, raw), {"1": 21.5, "2": 52.5, "3": "ok"})
+        # Decoded once for all data objects
+        loads.assert_called_once()
+
+    def test_single_value_without_key(self):
+        self.assertEqual(self.extract([make_data_object(1, DataObject.FORMAT_CHOICE_CBOR)], cbor2.dumps(7)),
+                         {"1": 7.0})
+        self.assertEqual(self.extract([make_data_object(1, DataObject.FORMAT_CHOICE_MSGPACK)], msgpack.packb(8)),
+                         {"1": 8.0})
+
+    def test_msgpack(self):
+        raw = msgpack.packb({"temp": 20, "sensors": [1, 2]})
+        data_objects = [
+            make_data_object(1, DataObject.FORMAT_CHOICE_MSGPACK, "temp"),
+            make_data_object(2, DataObject.FORMAT_CHOICE_MSGPACK, "sensors[1]"),
+        ]
+        self.assertEqual(self.extract(data_objects, raw), {"1": 20.0, "2": 2.0})
+
+    def test_struct(self):
+        raw = struct.pack("<fH4s", 1.5, 300, b"ok")
+        data_objects = [
+            make_data_object(1, DataObject.FORMAT_CHOICE_STRUCT, struct_format="<f"),
+            make_data_object(2, DataObject.FORMAT_CHOICE_STRUCT, struct_format="<H", struct_offset=4),
+            make_data_object(3, DataObject.FORMAT_CHOICE_STRUCT, data_type=DataObject.DATA_TYPE_STRING,
+                             struct_format="4s", struct_offset=6),
+            # Past the end of the payload, or without a layout
+            make_data_object(4, DataObject.FORMAT_CHOICE_STRUCT, struct_format="<d", struct_offset=6),
+            make_data_object(5, DataObject.FORMAT_CHOICE_STRUCT),
+        ]
+        self.assertEqual(self.extract(data_objects, raw), {"1": 1.5, "2": 300.0, "3": "ok"})
+
+    def test_invalid_payloads(self):
+        self.assertEqual(self.extract([make_data_object(1, DataObject.FORMAT_CHOICE_CBOR, "temp")], b"\xff"), dict())
+        self.assertEqual(self.extract([make_data_object(1, DataObject.FORMAT_CHOICE_MSGPACK, "temp")], b"\xc1"),
+                         dict())
+        self.assertEqual(
+            self.extract([make_data_object(1, DataObject.FORMAT_CHOICE_STRUCT, struct_format="<q!")], b"\x00" * 8),
+            dict()
+        )
+
+    def test_missing_library(self):
+        with mock.patch("dashboard.mqtt.payload.is_installed", return_value=False):
+            self.assertEqual(
+                self.extract([make_data_object(1, DataObject.FORMAT_CHOICE_CBOR)], cbor2.dumps(7)), dict()
+            )
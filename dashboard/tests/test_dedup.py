@@ -0,0 +1,102 @@
+from unittest import mock
+
+from paho.mqtt.client import MQTTMessage
+
+from django.test import SimpleTestCase
+
+from ..models import Topic
+from ..mqtt.client import MQTTClient
+from ..mqtt.dedup import DuplicateFilter, message_digest
+from ..mqtt.plans import TopicPlan
+
+
+class DuplicateFilterTests(SimpleTestCase):
+    def setUp(self):
+        self.topic = Topic(pk=1, qos=1, dedup_window=10)
+
+    def test_redelivery(self):
+        dedup = DuplicateFilter()
+        digest = message_digest("sensors/1", b"21.5")
+        self.assertFalse(dedup.is_duplicate(self.topic, digest, 1, now=0))
+        self.assertTrue(dedup.is_duplicate(self.topic, digest, 1, now=5))
+        self.assertEqual(dedup.suppressed, 1)
+
+    def test_key_value(self):
+        # Identical readings with different device timestamps are distinct messages
+        first = message_digest("sensors/1", b'{"ts": 1, "t": 21.5}', 1)
+        self.assertNotEqual(first, message_digest("sensors/1", b'{"ts": 2, "t": 21.5}', 2))
+        self.assertEqual(first, message_digest("sensors/1", b'{"t": 21.5, "ts": 1}', 1))
+        self.assertNotEqual(message_digest("sensors/1", b"1"), message_digest("sensors/1", b"", 1))
+
+    def test_window_expiry(self):
+        dedup = DuplicateFilter()
+        digest = message_digest("sensors/1", b"21.5")
+        dedup.is_duplicate(self.topic, digest, 1, now=0)
+        self.assertFalse(dedup.is_duplicate(self.topic, digest, 1, now=10))
+        self.assertEqual(len(dedup.seen[self.topic.pk]), 1)
+
+    def test_max_entries(self):
+        dedup = DuplicateFilter(max_entries=2)
+        digests = [message_digest("sensors/1", str(value).encode()) for value in range(3)]
+        for digest in digests:
+            dedup.is_duplicate(self.topic, digest, 1, now=0)
+
+        self.assertEqual(list(dedup.seen[self.topic.pk]), digests[1:])
+        self.assertFalse(dedup.is_duplicate(self.topic, digests[0], 1, now=1))
+
+    def test_disabled(self):
+        dedup = DuplicateFilter()
+        digest = message_digest("sensors/1", b"21.5")
+        for topic, qos in ((self.topic, 0), (Topic(pk=3, qos=1, dedup_window=0), 1)):
+            dedup.is_duplicate(topic, digest, qos, now=0)
+            self.assertFalse(dedup.is_duplicate(topic, digest, qos, now=1))
+
+
+class RedeliveryTests(SimpleTestCase):
+    """
+    Messages go through the client's receive callback, with ingest and storage stubbed out
+    """
+    def setUp(self):
+        self.client = MQTTClient(1, "broker", 1883)
+        self.addCleanup(self.client.ingest_queue.stop)
+        self.client.ingest_queue.put = lambda *item: self.client._MQTTClient__process_message(*item)
+        self.stored = list()
+        for target, kwargs in (
+            ("dashboard.mqtt.plans.get_project_plan", dict()),
+            ("dashboard.mongodb.spool.store_sample", dict(side_effect=lambda *args: self.stored.append(args))),
+            ("dashboard.mqtt.client.MQTTClient.create_mongodb_data_object", dict(return_value={"1": 21.5})),
+        ):
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def receive(self, topic, payload, qos, mid):
+        plan = TopicPlan(topic, list())
+        with mock.patch.object(MQTTClient, "get_topic_info_from_message",
+                               return_value=[{"topic": topic, "plan": plan}]):
+            message = MQTTMessage(mid, b"sensors/1")
+            message.payload = payload
+            message.qos = qos
+            self.client._message_received(None, None, message)
+
+    def test_redelivery_in_new_session(self):
+        topic = Topic(pk=1, path="sensors/1", qos=1, dedup_window=10)
+        self.receive(topic, b"21.5", 1, 7)
+        # Unacknowledged message sent again after a reconnect, under another packet id
+        self.receive(topic, b"21.5", 1, 1)
+        self.assertEqual(len(self.stored), 1)
+        self.assertEqual(self.client.duplicate_filter.suppressed, 1)
+
+    def test_qos0_deliveries_are_kept(self):
+        # Subscribed with QoS 1 but published with QoS 0, every delivery has packet id 0
+        topic = Topic(pk=1, path="sensors/1", qos=1, dedup_window=10)
+        self.receive(topic, b"21.5", 0, 0)
+        self.receive(topic, b"21.5", 0, 0)
+        self.assertEqual(len(self.stored), 2)
+
+    def test_dedup_key(self):
+        topic = Topic(pk=1, path="sensors/1", qos=1, dedup_window=10, dedup_key="ts")
+        self.receive(topic, b'{"ts": 1, "t": 21.5}', 1, 7)
+        self.receive(topic, b'{"ts": 2, "t": 21.5}', 1, 8)
+        self.receive(topic, b'{"t": 21.5, "ts": 2}', 1, 1)
+        self.assertEqual(len(self.stored), 2)
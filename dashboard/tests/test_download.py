@@ -0,0 +1,96 @@
+import datetime
+import gzip
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from ..models import DataObject, Project, Topic
+from .. import permissions, utils
+
+
+class DateRangeTests(SimpleTestCase):
+    def test_dates(self):
+        start, end = utils.get_date_range(QueryDict("start=2023-02-01&end=2023-02-02"))
+        self.assertEqual(start, datetime.datetime(2023, 2, 1))
+        # A bare end date includes the whole day
+        self.assertEqual(end, datetime.datetime(2023, 2, 3))
+
+    def test_datetimes_to_utc(self):
+        start, end = utils.get_date_range(QueryDict("start=2023-02-01T10:00%2B02:00"))
+        self.assertEqual(start, datetime.datetime(2023, 2, 1, 8))
+        self.assertIsNone(end)
+
+    def test_defaults_to_today(self):
+        start, end = utils.get_date_range(QueryDict())
+        self.assertEqual(start.date(), datetime.datetime.utcnow().date())
+        self.assertEqual(start.time(), datetime.time.min)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            utils.get_date_range(QueryDict("start=yesterday"))
+        with self.assertRaises(ValueError):
+            utils.get_date_range(QueryDict("start=2023-02-02T00:00&end=2023-02-01"))
+
+
+class GzipStreamTests(SimpleTestCase):
+    def test_round_trip(self):
+        chunks = list(utils.gzip_stream(["a,b\n", b"1,2\n", ""]))
+        self.assertEqual(gzip.decompress(b"".join(chunks)), b"a,b\n1,2\n")
+
+
+class DownloadViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="secret")
+        self.project = Project.objects.create(name="p", description="", host="broker", port=1883, db_name="db")
+        topic = Topic.objects.create(name="t", description="", path="sensors/#", project=self.project)
+        self.dataobject = DataObject.objects.create(
+            name="temp", description="", data_type=DataObject.DATA_TYPE_NUMBER,
+            format=DataObject.FORMAT_CHOICE_JSON, key="temp", topic=topic,
+        )
+        key = f"{self.dataobject.pk}"
+        self.samples = [(topic.pk, 1675245600.0 + i, {key: float(i)} if i != 1 else {}) for i in range(3)]
+
+    def download(self, **params):
+        url = reverse("dashboard:download_csv", args=[self.dataobject.pk])
+        with mock.patch("dashboard.mongodb.db_utils.iter_samples", return_value=iter(self.samples)) as iter_samples:
+            response = self.client.get(url, params)
+            content = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, content, iter_samples
+
+    def test_permissions(self):
+        self.assertEqual(self.download()[0].status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.download()[0].status_code, 404)
+
+    def test_streamed_csv(self):
+        permissions.assign_perm("can_view", self.user, self.project)
+        self.client.force_login(self.user)
+        response, content, iter_samples = self.download(start="2023-02-01", end="2023-02-01")
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn(f"{self.dataobject.pk}_2023-02-01.csv", response["Content-Disposition"])
+        lines = content.decode().splitlines()
+        # Samples without a value for the data object are skipped
+        self.assertEqual(lines[0], "timestamp,temp")
+        self.assertEqual([line.split(",")[1] for line in lines[1:]], ["0.0", "2.0"])
+        _, _, start, end = iter_samples.call_args.args
+        self.assertEqual((start, end), (datetime.datetime(2023, 2, 1), datetime.datetime(2023, 2, 2)))
+
+    def test_gzip(self):
+        permissions.assign_perm("can_view", self.user, self.project)
+        self.client.force_login(self.user)
+        response, content, _ = self.download(compress="gzip")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn(".csv.gz", response["Content-Disposition"])
+        self.assertEqual(len(gzip.decompress(content).decode().splitlines()), 3)
+
+    def test_invalid_range(self):
+        permissions.assign_perm("can_view", self.user, self.project)
+        self.client.force_login(self.user)
+        self.assertEqual(self.download(start="2023-02-02", end="2023-02-01")[0].status_code, 400)
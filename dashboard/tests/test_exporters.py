@@ -0,0 +1,74 @@
+import datetime
+import io
+import json
+import unittest
+
+from django.test import SimpleTestCase
+
+from ..models import DataObject
+from ..exporters import ArrowExporter, CSVExporter, NDJSONExporter, ParquetExporter, get_exporter_class
+
+COLUMNS = [("temp", DataObject.DATA_TYPE_NUMBER), ("state", DataObject.DATA_TYPE_STRING)]
+START = datetime.datetime(2023, 2, 1, 10, 0, 0)
+
+
+def make_rows(count):
+    return [(START + datetime.timedelta(seconds=i), float(i), None if i % 2 else f"s{i}") for i in range(count)]
+
+
+class TextExporterTests(SimpleTestCase):
+    def test_csv(self):
+        exporter = CSVExporter(COLUMNS)
+        exporter.batch_size = 2
+        chunks = list(exporter.stream(make_rows(3)))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual("".join(chunks).splitlines(), [
+            "timestamp,temp,state",
+            "2023-02-01 10:00:00,0.0,s0",
+            "2023-02-01 10:00:01,1.0,",
+            "2023-02-01 10:00:02,2.0,s2",
+        ])
+
+    def test_ndjson(self):
+        lines = "".join(NDJSONExporter(COLUMNS).stream(make_rows(2))).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {"timestamp": "2023-02-01T10:00:00", "temp": 0.0, "state": "s0"},
+            {"timestamp": "2023-02-01T10:00:01", "temp": 1.0},
+        ])
+
+    def test_get_exporter_class(self):
+        self.assertIs(get_exporter_class("CSV"), CSVExporter)
+        self.assertIsNone(get_exporter_class("xlsx"))
+
+
+@unittest.skipUnless(ArrowExporter.is_available(), "pyarrow is not installed")
+class ArrowExporterTests(SimpleTestCase):
+    def read_arrow(self, data):
+        import pyarrow.ipc
+
+        return pyarrow.ipc.open_stream(io.BytesIO(data)).read_all()
+
+    def test_arrow(self):
+        exporter = ArrowExporter(COLUMNS)
+        exporter.batch_size = 2
+        table = self.read_arrow(b"".join(exporter.stream(make_rows(3))))
+        self.assertEqual(table.column_names, ["timestamp", "temp", "state"])
+        self.assertEqual(table.column("temp").to_pylist(), [0.0, 1.0, 2.0])
+        self.assertEqual(table.column("state").to_pylist(), ["s0", None, "s2"])
+        self.assertEqual(table.column("timestamp").to_pylist()[2], START + datetime.timedelta(seconds=2))
+
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        data = b"".join(ParquetExporter(COLUMNS).stream(make_rows(3)))
+        table = pyarrow.parquet.read_table(io.BytesIO(data))
+        self.assertEqual(table.column("temp").to_pylist(), [0.0, 1.0, 2.0])
+
+    def test_mismatched_values_only_are_dropped(self):
+        rows = make_rows(3)
+        rows[1] = (rows[1][0], "n/a", rows[1][2])
+        exporter = ArrowExporter(COLUMNS)
+        with self.assertLogs(level="WARNING"):
+            table = self.read_arrow(b"".join(exporter.stream(rows)))
+        self.assertEqual(table.column("temp").to_pylist(), [0.0, None, 2.0])
+        self.assertEqual(exporter.dropped, 1)
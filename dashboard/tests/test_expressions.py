@@ -0,0 +1,156 @@
+import math
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from ..forms import NewDataObjectForm
+from ..models import DataObject, Project, Topic
+from ..mqtt.expressions import compile_expression, parse_expression, check_name, ExpressionError
+from ..mqtt.plans import TopicPlan
+
+
+class ExpressionTests(SimpleTestCase):
+    def evaluate(self, source, values=None):
+        resolve = {name: name for name in (values or dict())}
+        return compile_expression(source, resolve)(values or dict())
+
+    def test_arithmetic(self):
+        self.assertEqual(self.evaluate("a * 2 + b", {"a": 3, "b": 1.5}), 7.5)
+        self.assertEqual(self.evaluate("(a - 32) / 1.8", {"a": 212}), 100.0)
+        self.assertEqual(self.evaluate("2 ** 10"), 1024.0)
+
+    def test_functions_and_constants(self):
+        self.assertAlmostEqual(self.evaluate("sqrt(a) + sin(pi / 2)", {"a": 16}), 5.0)
+        self.assertEqual(self.evaluate("max(a, b, 0)", {"a": -1, "b": -2}), 0)
+        self.assertEqual(self.evaluate("hypot(3, 4)"), 5.0)
+
+    def test_comparisons_and_conditions(self):
+        self.assertTrue(self.evaluate("0 < a <= 10", {"a": 10}))
+        self.assertFalse(self.evaluate("0 < a <= 10", {"a": 11}))
+        self.assertEqual(self.evaluate("1 if a > 0 and not b else 2", {"a": 1, "b": False}), 1)
+
+    def test_names(self):
+        _, names = parse_expression("temp * factor + max(pi, e)")
+        self.assertEqual(names, {"temp", "factor"})
+
+    def test_rejected_constructs(self):
+        for source in (
+            "a.__class__",
+            "a[0]",
+            "(lambda: 1)()",
+            "'abc' * 3",
+            "open('x')",
+            "__import__('os')",
+            "round(a, ndigits=2)",
+            "[a for a in b]",
+            "a @ b",
+            "a is b",
+            "",
+            "a +",
+            "a" * 300,
+        ):
+            with self.subTest(source=source), self.assertRaises(ExpressionError):
+                parse_expression(source)
+
+    def test_unknown_variable(self):
+        with self.assertRaises(ExpressionError):
+            compile_expression("a + b", {"a": "1"})
+
+    def test_operands_must_be_numbers(self):
+        expression = compile_expression("a * 999999999", {"a": "1"})
+        for value in ("x", [1], {"b": 1}, None):
+            with self.subTest(value=value), self.assertRaises(TypeError):
+                expression({"1": value})
+
+        self.assertEqual(expression({"1": True}), 999999999.0)
+
+    def test_huge_results(self):
+        with self.assertRaises(OverflowError):
+            self.evaluate("a ** a", {"a": 1e6})
+        self.assertTrue(math.isinf(self.evaluate("a * a", {"a": 1e300})))
+
+    def test_missing_value(self):
+        with self.assertRaises(KeyError):
+            compile_expression("a + 1", {"a": "1"})(dict())
+
+
+class ExpressionOrderTests(SimpleTestCase):
+    def make_expression(self, pk, name, expression):
+        return DataObject(
+            pk=pk, name=name, format=DataObject.FORMAT_CHOICE_EXPRESSION, expression=expression
+        )
+
+    def test_forward_references(self):
+        data_objects = [
+            DataObject(pk=1, name="raw", format=DataObject.FORMAT_CHOICE_JSON, key="raw"),
+            self.make_expression(2, "doubled", "scaled * 2"),
+            self.make_expression(3, "scaled", "raw / 10"),
+        ]
+        plan = TopicPlan(Topic(pk=1), data_objects)
+        self.assertEqual([data_object.pk for data_object, _ in plan.expressions], [3, 2])
+
+        values = {"1": 50.0}
+        for data_object, expression in plan.expressions:
+            values[f"{data_object.pk}"] = expression(values)
+        self.assertEqual(values["2"], 10.0)
+
+    def test_cycles_are_dropped(self):
+        data_objects = [
+            self.make_expression(1, "a", "b + 1"),
+            self.make_expression(2, "b", "a + 1"),
+            self.make_expression(3, "c", "2 * pi"),
+        ]
+        plan = TopicPlan(Topic(pk=1), data_objects)
+        self.assertEqual([data_object.pk for data_object, _ in plan.expressions], [3])
+
+
+class NameTests(SimpleTestCase):
+    def test_check_name(self):
+        check_name("temp_1")
+        for name in ("e", "max", "pi", "temp 1", "1temp", "if", "a-b"):
+            with self.subTest(name=name), self.assertRaises(ExpressionError):
+                check_name(name)
+
+    def test_form(self):
+        data = {"name": "max", "data_type": DataObject.DATA_TYPE_NUMBER, "format": DataObject.FORMAT_CHOICE_JSON,
+                "key": "max", "widget_type": DataObject.WIDGET_TYPE_CHOICES[0][0]}
+        self.assertIn("name", NewDataObjectForm(data).errors)
+        # Names saved before the rule existed can be kept
+        self.assertNotIn("name", NewDataObjectForm(data, current_name="max").errors)
+
+
+class ReferencedDataObjectTests(TestCase):
+    def setUp(self):
+        project = Project.objects.create(name="p", description="", host="broker", port=1883, db_name="db")
+        self.topic = Topic.objects.create(name="t", description="", path="sensors/#", project=project)
+        self.temp = self.add_data_object("temp", key="temp")
+        self.add_data_object("fahrenheit", format=DataObject.FORMAT_CHOICE_EXPRESSION, expression="temp * 1.8 + 32")
+
+    def add_data_object(self, name, **kwargs):
+        return DataObject.objects.create(
+            name=name, description="", data_type=DataObject.DATA_TYPE_NUMBER, topic=self.topic, **kwargs
+        )
+
+    def test_delete_blocked(self):
+        with mock.patch("dashboard.mongodb.db_utils.delete_dataobject") as delete_dataobject:
+            response = self.client.get(reverse("dashboard:delete_dataobject", args=[self.temp.pk]))
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(b"fahrenheit", response.content)
+        delete_dataobject.assert_not_called()
+        self.assertTrue(DataObject.objects.filter(pk=self.temp.pk).exists())
+
+    def test_rename_blocked(self):
+        data = {"name": "temperature", "desc": "", "data_type": DataObject.DATA_TYPE_NUMBER,
+                "format": DataObject.FORMAT_CHOICE_JSON, "key": "temp",
+                "widget_type": DataObject.WIDGET_TYPE_CHOICES[0][0]}
+        self.client.post(reverse("dashboard:edit_dataobject", args=[self.temp.pk]), data)
+        self.temp.refresh_from_db()
+        self.assertEqual(self.temp.name, "temp")
+
+        data["desc"] = "Outside"
+        data["name"] = "temp"
+        response = self.client.post(reverse("dashboard:edit_dataobject", args=[self.temp.pk]), data)
+        self.assertEqual(response.status_code, 201)
+        self.temp.refresh_from_db()
+        self.assertEqual(self.temp.description, "Outside")
@@ -0,0 +1,51 @@
+from django.test import SimpleTestCase
+
+from ..models import DataObject
+from ..mqtt.filters import SampleFilters
+
+
+class SampleFiltersTests(SimpleTestCase):
+    def make_data_object(self, **kwargs):
+        return DataObject(pk=1, data_type=DataObject.DATA_TYPE_NUMBER, **kwargs)
+
+    def test_unfiltered(self):
+        filters = SampleFilters()
+        data_object = self.make_data_object()
+        self.assertTrue(all(filters.accept(data_object, timestamp, 1.0) for timestamp in range(5)))
+
+    def test_absolute_deadband(self):
+        filters = SampleFilters()
+        data_object = self.make_data_object(deadband=0.5)
+        accepted = [value for value in (10.0, 10.4, 10.6, 10.2, 11.2) if filters.accept(data_object, 0, value)]
+        self.assertEqual(accepted, [10.0, 10.6, 11.2])
+
+    def test_relative_deadband(self):
+        filters = SampleFilters()
+        data_object = self.make_data_object(deadband=10, deadband_type=DataObject.DEADBAND_RELATIVE)
+        accepted = [value for value in (100.0, 109.0, 111.0, 121.0) if filters.accept(data_object, 0, value)]
+        self.assertEqual(accepted, [100.0, 111.0])
+
+    def test_non_numeric_on_change(self):
+        filters = SampleFilters()
+        data_object = DataObject(pk=1, data_type="STR", deadband=0)
+        accepted = [value for value in ("on", "on", "off", "off") if filters.accept(data_object, 0, value)]
+        self.assertEqual(accepted, ["on", "off"])
+
+    def test_min_interval(self):
+        filters = SampleFilters()
+        data_object = self.make_data_object(min_interval=10)
+        accepted = [timestamp for timestamp in (0, 5, 10, 15, 25) if filters.accept(data_object, timestamp, 1.0)]
+        self.assertEqual(accepted, [0, 10, 25])
+
+    def test_heartbeat(self):
+        filters = SampleFilters()
+        data_object = self.make_data_object(deadband=1, heartbeat=60)
+        accepted = [timestamp for timestamp in (0, 30, 59, 60, 90, 120) if filters.accept(data_object, timestamp, 5.0)]
+        self.assertEqual(accepted, [0, 60, 120])
+
+    def test_forget(self):
+        filters = SampleFilters()
+        data_object = self.make_data_object(min_interval=10)
+        filters.accept(data_object, 0, 1.0)
+        filters.forget(data_object.pk)
+        self.assertTrue(filters.accept(data_object, 1, 1.0))
@@ -0,0 +1,137 @@
+import math
+
+from django.test import SimpleTestCase
+
+from ..mqtt import geo
+
+OPERATORS = {
+    "$add": lambda a, b: a + b,
+    "$subtract": lambda a, b: a - b,
+    "$multiply": lambda a, b: a * b,
+    "$divide": lambda a, b: a / b,
+    "$min": min,
+    "$max": max,
+    "$ln": math.log,
+    "$tan": math.tan,
+    "$floor": math.floor,
+    "$arrayElemAt": lambda array, index: array[index],
+}
+
+
+def evaluate(expression, doc):
+    """
+    Evaluate the aggregation expressions used by the cluster pipeline
+    """
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = doc
+        for name in expression[1:].split("."):
+            value = value[name]
+        return value
+    if isinstance(expression, dict):
+        (operator, args), = expression.items()
+        args = args if isinstance(args, list) else [args]
+        return OPERATORS[operator](*[evaluate(arg, doc) for arg in args])
+
+    return expression
+
+
+class GeoTests(SimpleTestCase):
+    def test_to_point(self):
+        expected = {"type": "Point", "coordinates": [13.4, 52.5]}
+        for value in (
+            {"type": "Point", "coordinates": [13.4, 52.5]},
+            {"lat": 52.5, "lon": 13.4},
+            {"latitude": "52.5", "lng": "13.4"},
+            [13.4, 52.5],
+            "52.5, 13.4",
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(geo.to_point(value), expected)
+
+        for value in ({"lat": 95, "lon": 0}, [200, 0], "abc", "1,2,3", 42, None):
+            with self.subTest(value=value):
+                self.assertIsNone(geo.to_point(value))
+
+    def test_bbox(self):
+        geometries = geo.parse_bbox("10,50,12,53")
+        self.assertEqual(len(geometries), 1)
+        ring = geometries[0]["coordinates"][0]
+        self.assertEqual(ring[0], ring[-1])
+        self.assertEqual({lon for lon, _ in ring}, {10.0, 11.0, 12.0})
+        self.assertEqual({lat for _, lat in ring}, {50.0, 53.0})
+        self.assertEqual(geo.within_filter("location", geometries),
+                         {"location": {"$geoWithin": {"$geometry": geometries[0]}}})
+
+    def test_wide_bbox(self):
+        geometries = geo.parse_bbox("-180,-10,180,10")
+        self.assertEqual(len(geometries), 4)
+        self.assertEqual(len(geo.within_filter("location", geometries)["$or"]), 4)
+
+    def test_world_bbox(self):
+        self.assertEqual(geo.parse_bbox("-180,-90,180,90"), list())
+        self.assertEqual(geo.within_filter("location", list()), dict())
+
+    def test_antimeridian_bbox(self):
+        geometries = geo.parse_bbox("170,-10,-170,10")
+        self.assertEqual(len(geometries), 2)
+        spans = [{lon for lon, _ in geometry["coordinates"][0]} for geometry in geometries]
+        self.assertEqual((min(spans[0]), max(spans[0])), (170.0, 180.0))
+        self.assertEqual((min(spans[1]), max(spans[1])), (-180.0, -170.0))
+        self.assertEqual(len(geo.parse_bbox("180,-10,-170,10")), 1)
+        # Everything but 10..12 degrees east, each side split below MAX_POLYGON_WIDTH
+        self.assertEqual(len(geo.parse_bbox("12,50,10,53")), 5)
+
+    def test_invalid_bbox(self):
+        for value in ("1,2,3", "10,50,10,53", "10,53,12,50", "-190,0,0,10", "a,b,c,d"):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                geo.parse_bbox(value)
+
+    def test_radius(self):
+        query = geo.radius_filter("location", 13.4, 52.5, geo.EARTH_RADIUS / 100)
+        self.assertEqual(query, {"location": {"$geoWithin": {"$centerSphere": [[13.4, 52.5], 0.01]}}})
+        with self.assertRaises(ValueError):
+            geo.radius_filter("location", 13.4, 52.5, 0)
+        with self.assertRaises(ValueError):
+            geo.radius_filter("location", 13.4, 91, 100)
+
+    def test_fit_zoom(self):
+        self.assertEqual(geo.get_fit_zoom(-180, -85, 180, 85), 1)
+        self.assertEqual(geo.get_fit_zoom(13.4, 52.5, 13.4, 52.5), geo.MAX_ZOOM)
+        self.assertGreater(geo.get_fit_zoom(13.3, 52.4, 13.5, 52.6), 8)
+
+
+class ClusterTests(SimpleTestCase):
+    def get_cells(self, points, zoom):
+        group = geo.cluster_pipeline({}, zoom, 10)[1]["$group"]
+        cells = dict()
+        for lon, lat in points:
+            doc = {"location": {"type": "Point", "coordinates": [lon, lat]}}
+            cell = evaluate(group["_id"]["x"], doc), evaluate(group["_id"]["y"], doc)
+            cells.setdefault(cell, list()).append((lon, lat))
+        return cells
+
+    def test_cell_size(self):
+        self.assertEqual(geo.get_cluster_cell_size(0), 1 / geo.CLUSTER_CELLS_PER_TILE)
+        self.assertEqual(geo.get_cluster_cell_size(1), geo.get_cluster_cell_size(0) / 2)
+        self.assertEqual(geo.get_cluster_cell_size(99), geo.get_cluster_cell_size(geo.MAX_ZOOM))
+
+    def test_cells_match_mercator_grid(self):
+        points = [(13.40, 52.52), (13.41, 52.51), (2.35, 48.86), (-179.9, -89.0), (179.9, 89.0)]
+        for zoom in (0, 4, 12):
+            cell_size = geo.get_cluster_cell_size(zoom)
+            for cell, cell_points in self.get_cells(points, zoom).items():
+                for lon, lat in cell_points:
+                    self.assertEqual(cell, (math.floor(geo.mercator_x(lon) / cell_size),
+                                            math.floor(geo.mercator_y(lat) / cell_size)))
+
+    def test_cells_shrink_with_zoom(self):
+        points = [(13.40, 52.52), (13.41, 52.51), (2.35, 48.86)]
+        self.assertEqual(len(self.get_cells(points, 2)), 1)
+        self.assertEqual(len(self.get_cells(points, 8)), 2)
+        self.assertEqual(len(self.get_cells(points, 16)), 3)
+
+    def test_largest_clusters_first(self):
+        pipeline = geo.cluster_pipeline({"dataobject": 1}, 5, 50)
+        self.assertEqual(pipeline[0], {"$match": {"dataobject": 1}})
+        self.assertIn({"$sort": {"count": -1}}, pipeline)
+        self.assertIn({"$limit": 50}, pipeline)
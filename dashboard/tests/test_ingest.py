@@ -0,0 +1,73 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from ..mqtt.ingest import IngestQueue, POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_SAMPLE
+
+
+class IngestQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.processed = list()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def handler(self, item):
+        self.started.set()
+        self.release.wait(5)
+        self.processed.append(item)
+
+    def make_full_queue(self, policy, sample_rate=10):
+        """
+        Queue of size 2 holding 2 and 3, while the worker is busy with 1
+        """
+        queue = IngestQueue(self.handler, max_size=2, policy=policy, sample_rate=sample_rate)
+        self.addCleanup(queue.stop)
+        self.addCleanup(self.release.set)
+        queue.put(1)
+        self.assertTrue(self.started.wait(5))
+        queue.put(2)
+        queue.put(3)
+        return queue
+
+    def test_drop_oldest(self):
+        queue = self.make_full_queue(POLICY_DROP_OLDEST)
+        self.assertTrue(queue.put(4))
+        self.assertEqual(list(queue.items), [(3,), (4,)])
+        self.assertEqual(queue.get_metrics()["dropped"], 1)
+
+    def test_drop_newest(self):
+        queue = self.make_full_queue(POLICY_DROP_NEWEST)
+        self.assertFalse(queue.put(4))
+        self.assertEqual(list(queue.items), [(2,), (3,)])
+        self.assertEqual(queue.get_metrics()["dropped"], 1)
+
+    def test_sample(self):
+        queue = self.make_full_queue(POLICY_SAMPLE, sample_rate=2)
+        self.assertFalse(queue.put(4))
+        self.assertTrue(queue.put(5))
+        self.assertFalse(queue.put(6))
+        self.assertEqual(list(queue.items), [(3,), (5,)])
+        self.assertEqual(queue.get_metrics()["dropped"], 3)
+
+    def test_block(self):
+        queue = self.make_full_queue(POLICY_BLOCK)
+        producer = threading.Thread(target=queue.put, args=(4,))
+        producer.start()
+        producer.join(0.2)
+        self.assertTrue(producer.is_alive())
+
+        self.release.set()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        for _ in range(500):
+            if len(self.processed) == 4:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(self.processed, [1, 2, 3, 4])
+        self.assertEqual(queue.get_metrics()["dropped"], 0)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            IngestQueue(self.handler, policy="unknown")
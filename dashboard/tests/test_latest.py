@@ -0,0 +1,140 @@
+import asyncio
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from ..models import DataObject, Project, Topic
+from ..mongodb import async_db_utils, db_utils
+
+
+class FakeLatestCollection:
+    """
+    Latest value index applying the $set updates of get_latest_update()
+    """
+    full_name = "db.fake_latest"
+
+    def __init__(self, fail=False):
+        self.docs = dict()
+        self.indexes = list()
+        self.fail = fail
+
+    def create_index(self, keys, unique=False):
+        self.indexes.append((keys, unique))
+
+    def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise ConnectionError("down")
+        for operation in operations:
+            doc = self.docs.setdefault(operation._filter["topic"], {"latest": dict()})
+            for field, value in operation._doc["$set"].items():
+                doc["latest"][field.split(".", 1)[1]] = value
+
+    async def find_one(self, doc_filter, projection=None):
+        return self.docs.get(doc_filter["topic"], None)
+
+
+class FakeDayCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def aggregate(self, pipeline):
+        for doc in self.docs:
+            yield doc
+
+
+class LatestIndexTests(SimpleTestCase):
+    def setUp(self):
+        db_utils._indexed_collections.discard(FakeLatestCollection.full_name)
+        self.addCleanup(db_utils._indexed_collections.discard, FakeLatestCollection.full_name)
+
+    def test_update(self):
+        update = db_utils.get_latest_update(3, {"timestamp": 10.0, "value": {"1": 21.5, "2": "ok"}})
+        self.assertEqual(update._filter, {"topic": 3})
+        self.assertEqual(update._doc, {"$set": {
+            "latest.1": {"timestamp": 10.0, "value": 21.5},
+            "latest.2": {"timestamp": 10.0, "value": "ok"},
+        }})
+        self.assertTrue(update._upsert)
+
+    def test_last_sample_wins(self):
+        collection = FakeLatestCollection()
+        db_utils.update_latest(collection, [
+            db_utils.get_latest_update(3, {"timestamp": 10.0, "value": {"1": 1, "2": 2}}),
+            db_utils.get_latest_update(3, {"timestamp": 11.0, "value": {"1": 3}}),
+        ])
+        db_utils.update_latest(collection, list())
+        self.assertEqual(collection.docs[3]["latest"], {
+            "1": {"timestamp": 11.0, "value": 3}, "2": {"timestamp": 10.0, "value": 2},
+        })
+        # Unique topic index created once per collection
+        self.assertEqual(collection.indexes, [([("topic", 1)], True)])
+
+    def test_failures_are_not_raised(self):
+        with self.assertLogs(level="ERROR"):
+            db_utils.update_latest(FakeLatestCollection(fail=True), [
+                db_utils.get_latest_update(3, {"timestamp": 10.0, "value": {"1": 1}})
+            ])
+
+    def get_latest_value(self, latest_collection, day_collection, dataobject):
+        with mock.patch.object(async_db_utils, "get_latest_collection", return_value=latest_collection), \
+                mock.patch.object(async_db_utils, "get_project_collection", return_value=day_collection):
+            return asyncio.run(async_db_utils.get_latest_value(None, dataobject))
+
+    def test_read(self):
+        collection = FakeLatestCollection()
+        db_utils.update_latest(collection, [db_utils.get_latest_update(3, {"timestamp": 10.0, "value": {"1": 5}})])
+        day_collection = mock.Mock()
+        latest = self.get_latest_value(collection, day_collection, DataObject(pk=1, topic_id=3))
+        self.assertEqual(latest, {"timestamp": 10.0, "value": 5})
+        day_collection.aggregate.assert_not_called()
+
+    def test_fallback_to_day_document(self):
+        # Stored before the index existed: newest first, then appended samples
+        day_collection = FakeDayCollection([{"values": [
+            {"timestamp": 20.0, "value": {"1": 2}},
+            {"timestamp": 10.0, "value": {"1": 1}},
+            {"timestamp": 30.0, "value": {"2": 9}},
+            {"timestamp": 25.0, "value": {"1": 3}},
+        ]}])
+        latest = self.get_latest_value(FakeLatestCollection(), day_collection, DataObject(pk=1, topic_id=3))
+        self.assertEqual(latest, {"timestamp": 25.0, "value": 3})
+        self.assertIsNone(self.get_latest_value(FakeLatestCollection(), FakeDayCollection([]),
+                                                DataObject(pk=1, topic_id=3)))
+
+
+class LatestValueViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser("admin", password="secret")
+        self.client.force_login(self.user)
+        project = Project.objects.create(name="p", description="", host="broker", port=1883, db_name="db")
+        topic = Topic.objects.create(name="t", description="", path="sensors/#", project=project)
+        self.data_object = DataObject.objects.create(
+            name="temp", description="", data_type=DataObject.DATA_TYPE_NUMBER,
+            format=DataObject.FORMAT_CHOICE_JSON, key="temp", topic=topic, widget_type=DataObject.WIDGET_TYPE_STATUS,
+        )
+
+    def get(self, name, latest):
+        async def get_latest_value(project, dataobject):
+            return latest
+
+        with mock.patch.object(async_db_utils, "get_latest_value", get_latest_value), \
+                mock.patch.object(async_db_utils, "get_data_objects") as get_data_objects:
+            response = self.client.get(reverse(f"dashboard:{name}", args=[self.data_object.pk]))
+        # Latest value widgets never read the time series
+        get_data_objects.assert_not_called()
+        return response
+
+    def test_status_widget(self):
+        response = self.get("get_dataobject_values", {"timestamp": 1675245600.0, "value": 21.5})
+        self.assertEqual(response.context["value"], 21.5)
+        self.assertContains(response, "21.5")
+
+    def test_api(self):
+        data = self.get("api_latest", {"timestamp": 10.0, "value": 21.5}).json()
+        self.assertEqual((data["timestamp"], data["value"]), (10.0, 21.5))
+        data = self.get("api_latest", None).json()
+        self.assertEqual((data["timestamp"], data["value"]), (None, None))
@@ -0,0 +1,63 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import mongodb
+
+
+class AsyncClientTests(SimpleTestCase):
+    def setUp(self):
+        mongodb.reset_clients()
+        self.addCleanup(mongodb.reset_clients)
+        patcher = mock.patch("motor.motor_asyncio.AsyncIOMotorClient", side_effect=lambda *args, **kwargs: mock.Mock())
+        self.client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_client_per_loop(self):
+        async def get_clients():
+            handle = mongodb.get_async_cached_handle("db", object)
+            self.assertIs(mongodb.get_async_cached_handle("db", object), handle)
+            return mongodb.get_async_client(), mongodb.get_async_client()
+
+        first, same = asyncio.run(get_clients())
+        self.assertIs(first, same)
+
+        second, _ = asyncio.run(get_clients())
+        self.assertIsNot(second, first)
+        # The client of the closed loop is released
+        first.close.assert_called_once_with()
+        self.assertEqual(self.client_class.call_count, 2)
+
+    def test_no_running_loop(self):
+        with self.assertRaises(RuntimeError):
+            mongodb.get_async_client()
+
+
+class ClientTests(SimpleTestCase):
+    def setUp(self):
+        mongodb.reset_clients()
+        self.addCleanup(mongodb.reset_clients)
+        patcher = mock.patch("pymongo.MongoClient", side_effect=lambda *args, **kwargs: mock.Mock())
+        self.client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lazy_shared_client(self):
+        self.client_class.assert_not_called()
+        client = mongodb.get_mongodb_client()
+        self.assertIs(mongodb.get_mongodb_client(), client)
+        self.client_class.assert_called_once()
+
+    def test_pool_options(self):
+        options = {"maxPoolSize": 5, "readPreference": "secondaryPreferred"}
+        with self.settings(MONGODB_CLIENT_OPTIONS=options, MONGODB_CONNECTION_URI="mongodb://db"):
+            mongodb.get_mongodb_client()
+        self.client_class.assert_called_once_with("mongodb://db", **options)
+
+    def test_new_client_after_fork(self):
+        client = mongodb.get_mongodb_client()
+        handle = mongodb.get_cached_handle("db", object)
+        with mock.patch("os.getpid", return_value=-1):
+            # Client and handles of the parent process are not reused in the child
+            self.assertIsNot(mongodb.get_cached_handle("db", object), handle)
+            self.assertIsNot(mongodb.get_mongodb_client(), client)
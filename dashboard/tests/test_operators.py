@@ -0,0 +1,40 @@
+from django.test import SimpleTestCase
+
+from ..models import DataObject
+from ..mqtt.operators import MovingAverage, Ewma, CounterRate, RollingExtreme, DerivedSeries
+
+
+class OperatorTests(SimpleTestCase):
+    def feed(self, operator, values):
+        return [operator.update(timestamp, value) for timestamp, value in enumerate(values)]
+
+    def test_moving_average(self):
+        self.assertEqual(self.feed(MovingAverage(3), [3, 6, 9, 12]), [3, 4.5, 6, 9])
+
+    def test_ewma(self):
+        self.assertEqual(self.feed(Ewma(0.5), [10, 20, 20]), [10, 15, 17.5])
+
+    def test_counter_rate(self):
+        operator = CounterRate()
+        self.assertIsNone(operator.update(0, 100))
+        self.assertEqual(operator.update(10, 150), 5)
+        # Counter reset or wrap: the new value is the increase since the reset
+        self.assertEqual(operator.update(20, 30), 3)
+        self.assertIsNone(operator.update(20, 40))
+
+    def test_rolling_extreme(self):
+        values = [5, 3, 4, 8, 1, 2, 6, 7]
+        self.assertEqual(self.feed(RollingExtreme(3), values), [5, 3, 3, 3, 1, 1, 1, 2])
+        self.assertEqual(self.feed(RollingExtreme(3, maximum=True), values), [5, 5, 5, 8, 8, 8, 6, 7])
+
+    def test_derived_series(self):
+        series = DerivedSeries()
+        data_object = DataObject(pk=1, operator=DataObject.OPERATOR_MOVING_AVERAGE, operator_param=2)
+        self.assertIsNone(series.update(data_object, 0, "x"))
+        self.assertIsNone(series.update(data_object, 0, True))
+        self.assertEqual(series.update(data_object, 0, 2), 2)
+        self.assertEqual(series.update(data_object, 1, 4), 3)
+
+        # A changed definition starts from scratch
+        data_object.operator = DataObject.OPERATOR_MAX
+        self.assertEqual(series.update(data_object, 2, 1), 1)
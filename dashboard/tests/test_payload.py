@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..mqtt import payload
+from ..mqtt.payload import Payload, compile_key_path
+
+
+class PayloadTests(SimpleTestCase):
+    def test_decoded_once(self):
+        message = Payload(b'{"temp": 21.5}')
+        with mock.patch.object(payload, "json_loads", wraps=payload.json_loads) as json_loads:
+            self.assertEqual(message.get_json(), {"temp": 21.5})
+            self.assertIs(message.get_json(), message.get_json())
+        json_loads.assert_called_once_with(b'{"temp": 21.5}')
+
+    def test_text_and_binary(self):
+        self.assertEqual(Payload(b"on").get_json(), "on")
+        self.assertIsNone(Payload(b"\xff\xfe").get_json())
+
+    def test_failed_decode_is_cached(self):
+        message = Payload(b"\xff")
+        decoder = mock.Mock(return_value=None)
+        self.assertIsNone(message.get("custom", decoder))
+        self.assertIsNone(message.get("custom", decoder))
+        decoder.assert_called_once_with(b"\xff")
+
+    def test_stdlib_json_fallback(self):
+        with mock.patch.object(payload, "is_installed", return_value=False):
+            self.assertEqual(payload.json_loads(b'{"a": [1, 2]}'), {"a": [1, 2]})
+            with self.assertRaises(ValueError):
+                payload.json_loads(b"{")
+
+
+class KeyPathTests(SimpleTestCase):
+    def test_top_level(self):
+        accessor = compile_key_path("temp")
+        self.assertEqual(accessor({"temp": 21.5}), 21.5)
+        self.assertIsNone(accessor({"hum": 40}))
+        self.assertIsNone(accessor([1, 2]))
+
+    def test_nested(self):
+        document = {"sensors": [{"value": 1}, {"value": 2}], "gps": {"lat": 52.5}}
+        self.assertEqual(compile_key_path("sensors[1].value")(document), 2)
+        self.assertEqual(compile_key_path("sensors[-1].value")(document), 2)
+        self.assertEqual(compile_key_path("$.gps.lat")(document), 52.5)
+        self.assertIsNone(compile_key_path("sensors[5].value")(document))
+        self.assertIsNone(compile_key_path("gps.lat.deg")(document))
+
+    def test_literal_key_first(self):
+        # Keys stored before nested paths existed may contain dots or brackets
+        accessor = compile_key_path("gps.lat")
+        self.assertEqual(accessor({"gps.lat": 52.5, "gps": {"lat": 0}}), 52.5)
+        self.assertEqual(accessor({"gps": {"lat": 52.5}}), 52.5)
+        self.assertEqual(compile_key_path("values[0]")({"values[0]": 1, "values": [2]}), 1)
+
+    def test_no_string_indexing(self):
+        self.assertIsNone(compile_key_path("name[0]")({"name": "abc"}))
+
+    def test_invalid(self):
+        for key in ("", ".temp", "a[x]", "a..b", "$.", "sensors[0]value", "a.", "a[0]]"):
+            with self.subTest(key=key), self.assertRaises(ValueError):
+                compile_key_path(key)
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.test import TestCase
+
+from guardian.shortcuts import assign_perm as guardian_assign_perm
+
+from ..models import Project
+from .. import permissions
+
+
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="secret")
+        self.projects = [
+            Project.objects.create(name=f"p{i}", description="", host="broker", port=1883, db_name="db")
+            for i in range(2)
+        ]
+
+    def test_cached(self):
+        self.assertEqual(permissions.get_perms(self.user, self.projects[0]), frozenset())
+        with self.assertNumQueries(0):
+            permissions.get_perms(self.user, self.projects[0])
+
+    def test_single_assign_and_remove(self):
+        permissions.get_perms(self.user, self.projects[0])
+        guardian_assign_perm("can_view", self.user, self.projects[0])
+        self.assertEqual(permissions.get_perms(self.user, self.projects[0]), {"can_view"})
+
+        permissions.remove_perm("can_view", self.user, self.projects[0])
+        self.assertEqual(permissions.get_perms(self.user, self.projects[0]), frozenset())
+
+    def test_bulk_assign_and_remove(self):
+        permissions.get_perms(self.user, self.projects[0])
+        permissions.assign_perm("can_view", self.user, Project.objects.all())
+        self.assertEqual(
+            permissions.get_projects_for_user(self.user, ["dashboard.can_view"]).count(), len(self.projects)
+        )
+
+        permissions.remove_perm("can_view", self.user, Project.objects.all())
+        self.assertEqual(permissions.get_perms(self.user, self.projects[1]), frozenset())
+
+    def test_group_membership(self):
+        group = Group.objects.create(name="operators")
+        permissions.assign_perm("can_delete", group, self.projects[1])
+        self.assertEqual(permissions.get_perms(self.user, self.projects[1]), frozenset())
+
+        self.user.groups.add(group)
+        self.assertEqual(permissions.get_perms(self.user, self.projects[1]), {"can_delete"})
+
+    def test_superuser(self):
+        admin = User.objects.create_superuser("admin", password="secret")
+        self.assertIn("is_owner", permissions.get_perms(admin, self.projects[0]))
+
+    def test_superuser_sees_new_and_deleted_projects(self):
+        admin = User.objects.create_superuser("admin", password="secret")
+        self.assertEqual(len(permissions.get_project_perms(admin)), 2)
+
+        project = Project.objects.create(name="p2", description="", host="broker", port=1883, db_name="db")
+        self.assertIn(project.pk, permissions.get_project_perms(admin))
+
+        project.delete()
+        self.assertNotIn(project.pk, permissions.get_project_perms(admin))
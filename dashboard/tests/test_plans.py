@@ -0,0 +1,57 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..models import DataObject, Project, Topic
+from ..mqtt import plans
+
+
+class PlanCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        plans.invalidate_all()
+        self.project = Project.objects.create(name="p", description="", host="broker", port=1883, db_name="db")
+        self.topic = Topic.objects.create(name="t", description="", path="sensors/#", project=self.project)
+
+    def add_data_object(self, name):
+        return DataObject.objects.create(
+            name=name, description="", data_type=DataObject.DATA_TYPE_NUMBER, format=DataObject.FORMAT_CHOICE_JSON,
+            key=name, topic=self.topic,
+        )
+
+    def get_keys(self, plan):
+        return [data_object.key for data_object, _ in plan.topic_plans[0].extractors]
+
+    def test_cached_between_checks(self):
+        plan = plans.get_project_plan(self.project.pk, now=0)
+        self.assertIs(plans.get_project_plan(self.project.pk, now=0.5), plan)
+        self.assertIs(plans.get_project_plan(self.project.pk, now=5), plan)
+
+    def test_change_in_other_process(self):
+        plan = plans.get_project_plan(self.project.pk, now=0)
+        # Saved by another process: no local signal, only the shared version moves
+        DataObject.objects.bulk_create([DataObject(
+            name="temp", description="", data_type=DataObject.DATA_TYPE_NUMBER,
+            format=DataObject.FORMAT_CHOICE_JSON, key="temp", topic=self.topic,
+        )])
+        plans.bump_version(plans.get_project_version_key(self.project.pk))
+
+        self.assertIs(plans.get_project_plan(self.project.pk, now=0.5), plan)
+        self.assertEqual(self.get_keys(plans.get_project_plan(self.project.pk, now=2)), ["temp"])
+
+    def test_max_age(self):
+        plan = plans.get_project_plan(self.project.pk, now=0)
+        with self.settings(MQTT_PLAN_CACHE={"check_interval": 1, "max_age": 10}):
+            self.assertIs(plans.get_project_plan(self.project.pk, now=5), plan)
+            self.assertIsNot(plans.get_project_plan(self.project.pk, now=11), plan)
+
+    def test_data_object_change_of_unseen_topic(self):
+        # No plan was built in this process, the change still reaches the shared version
+        version = plans.get_shared_version(self.project.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_data_object("temp")
+        self.assertNotEqual(plans.get_shared_version(self.project.pk), version)
+
+    def test_local_change_applies_at_once(self):
+        plans.get_project_plan(self.project.pk, now=0)
+        self.add_data_object("temp")
+        self.assertEqual(self.get_keys(plans.get_project_plan(self.project.pk, now=0.1)), ["temp"])
@@ -0,0 +1,104 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..mqtt.reconnect import ReconnectScheduler
+
+
+class FakeClient:
+    def __init__(self, client_id, stopping=False):
+        self.id = client_id
+        self.stopping = stopping
+
+    def is_stopping(self):
+        return self.stopping
+
+
+class ReconnectSchedulerTests(SimpleTestCase):
+    def test_backoff(self):
+        scheduler = ReconnectScheduler(min_delay=1, max_delay=10)
+        with mock.patch("random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual([scheduler.get_delay(failures) for failures in range(7)], [1, 1, 2, 4, 8, 10, 10])
+        with mock.patch("random.uniform", side_effect=lambda low, high: low):
+            # Half of the delay is fixed
+            self.assertEqual(scheduler.get_delay(4), 4)
+
+    def test_metrics(self):
+        scheduler = ReconnectScheduler()
+        client = FakeClient(1)
+
+        def refuse():
+            raise ConnectionRefusedError()
+
+        for _ in range(2):
+            with self.assertRaises(ConnectionRefusedError):
+                scheduler.attempt(client, refuse)
+        self.assertEqual(scheduler.get_metrics(1).consecutive_failures, 2)
+
+        self.assertEqual(scheduler.attempt(client, lambda: 0), 0)
+        scheduler.record_connected(1)
+        metrics = scheduler.get_all_metrics()[1]
+        self.assertEqual((metrics["attempts"], metrics["failures"], metrics["successes"]), (3, 2, 1))
+        self.assertEqual(metrics["consecutive_failures"], 0)
+        self.assertIsNone(metrics["last_error"])
+
+        scheduler.forget(1)
+        self.assertEqual(scheduler.get_all_metrics(), dict())
+
+    def test_concurrency_cap(self):
+        scheduler = ReconnectScheduler(max_concurrent=2)
+        running = list()
+        peak = list()
+        lock = threading.Lock()
+        barrier = threading.Barrier(2)
+
+        def connect():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            try:
+                barrier.wait(timeout=0.5)
+            except threading.BrokenBarrierError:
+                pass
+            with lock:
+                running.pop()
+
+        threads = [threading.Thread(target=scheduler.attempt, args=(FakeClient(i), connect)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(sum(scheduler.get_metrics(i).attempts for i in range(6)), 6)
+
+    def test_stopping_client_gives_up_waiting_for_a_slot(self):
+        scheduler = ReconnectScheduler(max_concurrent=1)
+        scheduler.slots.acquire()
+        connect = mock.Mock()
+        with self.assertRaises(OSError):
+            scheduler.attempt(FakeClient(1, stopping=True), connect)
+        connect.assert_not_called()
+
+    def test_wake_skips_backoff(self):
+        scheduler = ReconnectScheduler(min_delay=60)
+        scheduler.get_metrics(1).consecutive_failures = 3
+        scheduler.wake(1)
+        waiter = threading.Thread(target=scheduler.wait, args=(FakeClient(1),))
+        waiter.start()
+        waiter.join(timeout=2)
+        self.assertFalse(waiter.is_alive())
+        self.assertGreaterEqual(scheduler.get_metrics(1).next_delay, 60)
+
+    def test_watcher_restarts_stopped_loops(self):
+        scheduler = ReconnectScheduler()
+        running = mock.Mock(id=1, stopped=False, **{"is_loop_running.return_value": True})
+        dead = mock.Mock(id=2, stopped=False, **{"is_loop_running.return_value": False})
+        manager = mock.Mock(client_list=[running, dead])
+        scheduler.stop_event = mock.Mock(**{"wait.side_effect": [False, True]})
+
+        scheduler.watch(manager)
+
+        manager.connect_client.assert_called_once_with(2)
+        manager.start_client.assert_called_once_with(2)
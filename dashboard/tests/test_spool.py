@@ -0,0 +1,180 @@
+import datetime
+import json
+import os
+import tempfile
+from unittest import mock
+
+import pymongo
+from django.test import SimpleTestCase
+
+from ..models import Project, Topic
+from ..mongodb import db_utils, spool as spool_module
+from ..mongodb.spool import Spool, SpoolLockedError, CHECKPOINT_NAME
+
+
+class SpoolTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.written = list()
+
+    def make_spool(self, **kwargs):
+        spool = Spool(self.directory, fsync="never", **kwargs)
+        self.addCleanup(spool.lock_file.close)
+        return spool
+
+    def add_samples(self, db_name, collection_name, samples):
+        self.written.extend(sample["timestamp"] for _, _, sample in samples)
+
+    def append(self, spool, timestamps):
+        with mock.patch.object(Spool, "start_replay"):
+            for timestamp in timestamps:
+                spool.append("db", "col", 1, 1, {"timestamp": timestamp, "value": {"1": timestamp}})
+
+    def test_directory_lock(self):
+        self.make_spool()
+        with self.assertRaises(SpoolLockedError):
+            Spool(self.directory)
+
+    def test_replay_after_crash(self):
+        spool = self.make_spool()
+        self.append(spool, [1, 2, 3])
+        path = spool.active_path
+        spool.close_segment()
+        # Crash after the first record was written and checkpointed, with a torn record at the end
+        with open(path, "rb") as f:
+            offset = len(f.readline())
+        spool.write_checkpoint(path, offset)
+        with open(path, "ab") as f:
+            f.write(b'["db","col",1,1,{"timest')
+        spool.lock_file.close()
+
+        recovered = self.make_spool()
+        self.assertEqual(recovered.list_segments(), [path])
+        with mock.patch.object(db_utils, "add_samples", self.add_samples):
+            recovered.replay_segment(path)
+
+        self.assertEqual(self.written, [2, 3])
+        self.assertFalse(recovered.has_pending())
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_batch_is_replayed(self):
+        spool = self.make_spool(replay_batch_size=1)
+        self.append(spool, [1, 2, 3])
+        path = spool.active_path
+        spool.close_segment()
+
+        calls = list()
+
+        def add_samples(db_name, collection_name, samples):
+            calls.append(samples)
+            if len(calls) == 2:
+                raise ConnectionError("MongoDB down")
+            self.add_samples(db_name, collection_name, samples)
+
+        with mock.patch.object(db_utils, "add_samples", add_samples):
+            with self.assertRaises(ConnectionError):
+                spool.replay_segment(path)
+            with open(os.path.join(self.directory, CHECKPOINT_NAME)) as f:
+                self.assertEqual(json.load(f)["segment"], os.path.basename(path))
+
+            spool.replay_segment(path)
+
+        self.assertEqual(self.written, [1, 2, 3])
+        self.assertEqual(spool.get_metrics()["replayed"], 3)
+
+    def test_segments_roll_over(self):
+        spool = self.make_spool(segment_size=1)
+        self.append(spool, [1, 2])
+        self.assertEqual(len(spool.list_segments()), 2)
+        self.assertIsNone(spool.active)
+
+    def test_locations_are_replayed(self):
+        spool = self.make_spool()
+        point = {"type": "Point", "coordinates": [13.4, 52.5]}
+        with mock.patch.object(Spool, "start_replay"):
+            spool.append("db", "col", 1, 1, {"timestamp": 1, "value": {"2": point}}, ("dev/1", 1, {"2": point}))
+            # Sample written, only its location failed
+            spool.append("db", "col", 1, 1, None, ("dev/1", 2, {"2": point}))
+        path = spool.active_path
+        spool.close_segment()
+
+        located = list()
+        with mock.patch.object(db_utils, "add_samples", self.add_samples), \
+                mock.patch.object(db_utils, "add_spooled_locations",
+                                  lambda db_name, collection_name, entries: located.extend(entries)):
+            spool.replay_segment(path)
+
+        self.assertEqual(self.written, [1])
+        self.assertEqual(located, [(1, "dev/1", 1, {"2": point}), (1, "dev/1", 2, {"2": point})])
+
+
+    def test_replayed_positions_keep_latest(self):
+        locations_col, positions_col = mock.MagicMock(), mock.MagicMock()
+        point = {"type": "Point", "coordinates": [13.4, 52.5]}
+        entries = [(1, "dev/1", 1, {"2": point}), (1, "dev/1", 2, {"2": point})]
+        db_utils.write_locations(locations_col, positions_col, entries)
+
+        self.assertEqual(len(locations_col.insert_many.call_args.args[0]), 2)
+        operations = positions_col.bulk_write.call_args.args[0]
+        self.assertEqual(len(operations), 1)
+        self.assertEqual(operations[0]._doc["$set"]["timestamp"], 2)
+
+
+class StoreSampleTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = Spool(directory.name, fsync="never", write_timeout=0.2)
+        self.addCleanup(self.spool.lock_file.close)
+        self.appended = list()
+        for target, kwargs in (
+            (spool_module, dict(get_spool=mock.Mock(return_value=self.spool))),
+            (Spool, dict(append=lambda spool, *record: self.appended.append(record))),
+            (db_utils, dict(get_project_collection_name=mock.Mock(return_value="col"))),
+        ):
+            patcher = mock.patch.multiple(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.project = Project(pk=1, name="p", db_name="db")
+        self.topic = Topic(pk=2)
+        self.time = datetime.datetime(2023, 2, 1, 10, 0, 0)
+        self.point = {"type": "Point", "coordinates": [13.4, 52.5]}
+
+    def store(self):
+        spool_module.store_sample(self.project, self.topic, {"time": self.time, "values": {"3": self.point}},
+                                  "dev/1", {"3": self.point})
+
+    def test_short_write_timeout(self):
+        with mock.patch.object(pymongo, "timeout", wraps=pymongo.timeout) as timeout, \
+                mock.patch.multiple(db_utils, add_data_obj=mock.DEFAULT, add_locations=mock.DEFAULT) as writes:
+            self.store()
+
+        timeout.assert_called_with(0.2)
+        writes["add_locations"].assert_called_once_with(
+            self.project, self.topic, "dev/1", self.time.timestamp(), {"3": self.point}
+        )
+        self.assertEqual(self.appended, list())
+
+    def test_outage_spools_sample_and_locations(self):
+        with mock.patch.object(db_utils, "add_data_obj", side_effect=pymongo.errors.ServerSelectionTimeoutError), \
+                mock.patch.object(db_utils, "add_locations") as add_locations:
+            self.store()
+
+        add_locations.assert_not_called()
+        timestamp = self.time.timestamp()
+        self.assertEqual(self.appended, [(
+            "db", "col", 2, self.time.toordinal(), {"timestamp": timestamp, "value": {"3": self.point}},
+            ("dev/1", timestamp, {"3": self.point}),
+        )])
+
+    def test_failed_locations_spooled_alone(self):
+        with mock.patch.object(db_utils, "add_data_obj"), \
+                mock.patch.object(db_utils, "add_locations", side_effect=pymongo.errors.ServerSelectionTimeoutError):
+            self.store()
+
+        self.assertEqual(len(self.appended), 1)
+        self.assertIsNone(self.appended[0][4])
+        self.assertEqual(self.appended[0][5][0], "dev/1")
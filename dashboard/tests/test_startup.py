@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from .. import utils
+
+HEAVY_MODULES = ("pymongo", "motor", "numpy", "pyarrow", "bokeh", "paho", "msgpack", "cbor2", "orjson")
+
+
+class ColdImportTests(SimpleTestCase):
+    def test_views_import_no_heavy_modules(self):
+        script = (
+            "import json, sys, django\n"
+            "django.setup()\n"
+            "import dashboard.views, dashboard.urls\n"
+            f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE="ist_project.settings"),
+            capture_output=True,
+            check=True,
+        )
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), list())
+
+    def test_is_installed(self):
+        self.assertTrue(utils.is_installed("json"))
+        self.assertFalse(utils.is_installed("dashboard_no_such_module"))
@@ -0,0 +1,120 @@
+import asyncio
+import datetime
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..models import Topic
+from ..mongodb import db_utils, async_db_utils
+from .. import timeseries
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, sort):
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """
+    Day documents by topic, find() serves one topic's documents in date order
+    """
+    full_name = "db.fake"
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = list()
+
+    def find(self, doc_filter, projection=None, batch_size=None):
+        self.queries.append(doc_filter)
+        return FakeCursor(sorted((doc for doc in self.docs if doc["topic"] == doc_filter["topic"]),
+                                 key=lambda doc: doc["date"]))
+
+
+def make_doc(topic_pk, date, timestamps):
+    return {"topic": topic_pk, "date": date, "values": [
+        {"timestamp": timestamp, "value": {f"{topic_pk}": timestamp}} for timestamp in timestamps
+    ]}
+
+
+DOCS = [
+    make_doc(1, 1, [30.0, 10.0, 20.0]),
+    make_doc(1, 2, [90000.0]),
+    make_doc(2, 1, [15.0, 25.0]),
+    make_doc(2, 2, [90000.0, 95000.0]),
+]
+
+
+class SampleMergeTests(SimpleTestCase):
+    def setUp(self):
+        self.collection = FakeCollection(DOCS)
+        self.topics = [Topic(pk=1), Topic(pk=2)]
+
+    def test_merge(self):
+        with mock.patch.object(db_utils, "get_project_collection", return_value=self.collection), \
+                mock.patch.object(db_utils, "ensure_project_indexes"):
+            samples = list(db_utils.iter_samples(None, self.topics))
+
+        self.assertEqual([(topic_pk, timestamp) for topic_pk, timestamp, _ in samples], [
+            (1, 10.0), (2, 15.0), (1, 20.0), (2, 25.0), (1, 30.0), (1, 90000.0), (2, 90000.0), (2, 95000.0),
+        ])
+        self.assertEqual([query["topic"] for query in self.collection.queries], [1, 2])
+
+    def test_range(self):
+        start = datetime.datetime.utcfromtimestamp(0) + datetime.timedelta(seconds=15)
+        end = start + datetime.timedelta(seconds=10)
+        samples = db_utils.get_document_samples(DOCS[0], start, end)
+        self.assertEqual([timestamp for _, timestamp, _ in samples], [20.0])
+
+    def test_async_merge(self):
+        async def collect():
+            return [chunk async for chunk in async_db_utils.iter_sample_chunks(None, self.topics, chunk_size=2)]
+
+        async def ensure_project_indexes(collection):
+            pass
+
+        with mock.patch.object(async_db_utils, "get_project_collection", return_value=self.collection), \
+                mock.patch.object(async_db_utils, "ensure_project_indexes", ensure_project_indexes):
+            chunks = asyncio.run(collect())
+
+        self.assertEqual([timestamp for chunk in chunks for _, timestamp, _ in chunk],
+                         [10.0, 15.0, 20.0, 25.0, 30.0, 90000.0, 90000.0, 95000.0])
+        # Both samples at 90000 stay together
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 3, 1])
+
+
+class WideChunkTests(SimpleTestCase):
+    def test_join(self):
+        samples = [(1, 10.0, {"1": 1}), (2, 10.0, {"2": 2}), (1, 20.0, {"1": 3}), (2, 30.0, {"3": 4})]
+        self.assertEqual(list(timeseries.iter_wide_chunks(samples, ["1", "2"])), [
+            [[10.0, 1, 2], [20.0, 3, None]],
+        ])
+
+    def test_chunks_keep_timestamps_whole(self):
+        samples = [(1, 10.0, {"1": 1}), (2, 10.0, {"2": 2}), (1, 20.0, {"1": 3}), (2, 20.0, {"2": 4})]
+        self.assertEqual(list(timeseries.iter_wide_chunks(samples, ["1", "2"], chunk_size=1)), [
+            [[10.0, 1, 2]], [[20.0, 3, 4]],
+        ])
+
+
+class ResampleTests(SimpleTestCase):
+    def test_resample(self):
+        rows = [[0.0, 1.0, "a"], [5.0, 3.0, None], [10.0, None, "b"], [12.0, 6.0, "c"]]
+        self.assertEqual(timeseries.resample_rows(rows, 10, [True, False]), [
+            [0.0, 2.0, "a"], [10.0, 6.0, "c"],
+        ])
+
+    def test_buckets_across_chunks(self):
+        chunks = [[[0.0, 1.0], [10.0, 2.0]], [[15.0, 4.0], [20.0, 5.0]]]
+        self.assertEqual(list(timeseries.iter_resampled_chunks(chunks, 10, [True])), [
+            [[0.0, 1.0]], [[10.0, 3.0]], [[20.0, 5.0]],
+        ])
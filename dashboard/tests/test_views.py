@@ -0,0 +1,99 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import DataObject, Project, Topic
+
+
+def make_project(name="p"):
+    return Project.objects.create(name=name, description="", host="broker", port=1883, db_name="db")
+
+
+def make_data_object(topic, name):
+    return DataObject.objects.create(
+        name=name, description="", data_type=DataObject.DATA_TYPE_NUMBER, format=DataObject.FORMAT_CHOICE_JSON,
+        key=name, topic=topic,
+    )
+
+
+class QueryDataObjectsViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="secret")
+        self.client.force_login(self.user)
+        self.topic = Topic.objects.create(name="t", description="", path="sensors/#", project=make_project())
+        self.data_objects = [make_data_object(self.topic, f"d{i}") for i in range(3)]
+
+    def make_samples(self, count):
+        values = {f"{data_object.pk}": 1.0 for data_object in self.data_objects}
+        # Values of a deleted data object are skipped
+        values["999"] = 2.0
+        return [{"timestamp": 1675245600 + i, "value": values} for i in range(count)]
+
+    def query(self, samples):
+        async def get_data_objects(project, topic):
+            return samples
+
+        url = reverse("dashboard:query_dataobjects", args=[self.topic.pk])
+        with mock.patch("dashboard.mongodb.async_db_utils.get_data_objects", get_data_objects), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, len(queries)
+
+    def test_rows(self):
+        response, _ = self.query(self.make_samples(2))
+        self.assertEqual(response.status_code, 200)
+        rows = response.context["data_details"]
+        self.assertEqual(len(rows), 2 * len(self.data_objects))
+        self.assertEqual({row.model for row in rows}, set(self.data_objects))
+
+    def test_query_count_does_not_grow_with_samples(self):
+        _, few = self.query(self.make_samples(1))
+        _, many = self.query(self.make_samples(25))
+        self.assertGreater(few, 0)
+        self.assertEqual(few, many)
+
+
+class IndexViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("dashboard.startup.run", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_superuser("admin", password="secret")
+        self.client.force_login(self.user)
+
+    def add_project(self, name, topics=2):
+        project = make_project(name)
+        for i in range(topics):
+            topic = Topic.objects.create(name=f"t{i}", description="", path=f"{name}/{i}", project=project)
+            make_data_object(topic, "temp")
+            make_data_object(topic, "humidity")
+        return project
+
+    def get_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("dashboard:index"))
+        return response, len(queries)
+
+    def test_counts(self):
+        self.add_project("p")
+        response, _ = self.get_index()
+        entry, = response.context["project_list"]
+        self.assertEqual((entry["project_params"]["project"].topic_count,
+                          entry["project_params"]["project"].dataobject_count), (2, 4))
+        self.assertEqual(len(entry["topics"]), 2)
+
+    def test_query_count_does_not_grow_with_projects(self):
+        self.add_project("p")
+        _, few = self.get_index()
+        for i in range(4):
+            self.add_project(f"q{i}", topics=3)
+        response, many = self.get_index()
+        self.assertEqual(len(response.context["project_list"]), 5)
+        self.assertEqual(few, many)
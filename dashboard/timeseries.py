@@ -0,0 +1,126 @@
+import datetime
+
+import numpy
+
+
+def iter_wide_chunks(samples, keys, chunk_size=1000):
+    """
+    Join samples of several series on timestamp
+    @param samples: time ordered (topic_pk, timestamp, values dict) as returned by db_utils.iter_samples
+    @param keys: data object pk strings, one per output column
+    @param chunk_size: rows per chunk, the row of the current timestamp is completed first
+    @return: generator of lists of [timestamp, value1, value2, ...] rows
+    """
+    index = {key: i for i, key in enumerate(keys, start=1)}
+    rows = list()
+    row = None
+    for _, timestamp, values in samples:
+        if row is None or row[0] != timestamp:
+            if len(rows) >= chunk_size:
+                chunk = get_present_rows(rows)
+                if chunk:
+                    yield chunk
+                rows = list()
+
+            row = [timestamp] + [None] * len(keys)
+            rows.append(row)
+
+        for key, val in values.items():
+            i = index.get(key, None)
+            if i is not None:
+                row[i] = val
+
+    chunk = get_present_rows(rows)
+    if chunk:
+        yield chunk
+
+
+def get_present_rows(rows):
+    return [row for row in rows if any(val is not None for val in row[1:])]
+
+
+def resample_rows(rows, interval, numeric_columns):
+    """
+    Resample rows into fixed intervals, averaging numeric columns and keeping the last value of others
+    @param rows: [timestamp, value1, ...] rows sorted by timestamp
+    @param interval: bucket size in seconds
+    @param numeric_columns: list of bools, one per value column
+    @return: list of [bucket start timestamp, value1, ...] rows
+    """
+    timestamps = numpy.fromiter((row[0] for row in rows), dtype=float, count=len(rows))
+    buckets, inverse = numpy.unique(numpy.floor(timestamps / interval), return_inverse=True)
+    bucket_count = len(buckets)
+
+    columns = [buckets * interval]
+    for i, numeric in enumerate(numeric_columns, start=1):
+        raw = [row[i] for row in rows]
+        present = numpy.fromiter((val is not None for val in raw), dtype=bool, count=len(raw))
+        if numeric:
+            values = numpy.array([val if val is not None else numpy.nan for val in raw], dtype=float)
+            sums = numpy.bincount(inverse[present], weights=values[present], minlength=bucket_count)
+            counts = numpy.bincount(inverse[present], minlength=bucket_count)
+            with numpy.errstate(invalid="ignore", divide="ignore"):
+                means = sums / counts
+            columns.append([None if count == 0 else float(mean) for mean, count in zip(means, counts)])
+        else:
+            positions = numpy.flatnonzero(present)
+            last = numpy.full(bucket_count, -1)
+            numpy.maximum.at(last, inverse[positions], positions)
+            columns.append([None if pos < 0 else raw[pos] for pos in last])
+
+    return [list(row) for row in zip(*columns)]
+
+
+class ChunkResampler:
+    """
+    Resample a time ordered stream of row chunks. Rows of the last bucket of a chunk are
+    carried into the next chunk so buckets spanning chunk boundaries are not split.
+    """
+    def __init__(self, interval, numeric_columns):
+        self.interval = interval
+        self.numeric_columns = numeric_columns
+        self.carry = list()
+
+    def add(self, chunk):
+        """
+        @return: resampled rows that are complete (may be empty)
+        """
+        rows = self.carry + chunk
+        last_bucket = numpy.floor(rows[-1][0] / self.interval)
+        split = len(rows)
+        while split > 0 and numpy.floor(rows[split - 1][0] / self.interval) == last_bucket:
+            split -= 1
+
+        self.carry = rows[split:]
+        if split > 0:
+            return resample_rows(rows[:split], self.interval, self.numeric_columns)
+
+        return list()
+
+    def finish(self):
+        carry, self.carry = self.carry, list()
+        if carry:
+            return resample_rows(carry, self.interval, self.numeric_columns)
+
+        return list()
+
+
+def iter_resampled_chunks(chunks, interval, numeric_columns):
+    resampler = ChunkResampler(interval, numeric_columns)
+    for chunk in chunks:
+        rows = resampler.add(chunk)
+        if rows:
+            yield rows
+
+    rows = resampler.finish()
+    if rows:
+        yield rows
+
+
+def iter_datetime_rows(chunks):
+    """
+    Flatten row chunks, converting stored timestamps to datetimes
+    """
+    for chunk in chunks:
+        for row in chunk:
+            yield (datetime.datetime.fromtimestamp(row[0]),) + tuple(row[1:])
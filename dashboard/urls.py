@@ -15,12 +15,14 @@ new_urls = [
     path("project/new/", views.NewProjectView.as_view(), name="new_project"),
     path("topic/new/<slug:project_id>/", views.NewTopicView.as_view(), name="new_topic"),
     path("dataobject/new/<slug:topic_id>", views.NewDataObject.as_view(), name="new_dataobject"),
+    path("alertrule/new/<slug:dataobject_id>", views.NewAlertRuleView.as_view(), name="new_alertrule"),
 ]
 
 delete_urls = [
     path("project/delete/<slug:project_id>/", views.DeleteProjectView.as_view(), name="delete_project"),
     path("topic/delete/<slug:topic_id>/", views.DeleteTopicView.as_view(), name="delete_topic"),
-    path("dataobject/delete/<slug:dataobject_id>", views.DeleteDataObject.as_view(), name="delete_dataobject")
+    path("dataobject/delete/<slug:dataobject_id>", views.DeleteDataObject.as_view(), name="delete_dataobject"),
+    path("alertrule/delete/<slug:alertrule_id>", views.DeleteAlertRuleView.as_view(), name="delete_alertrule"),
 ]
 
 edit_urls = [
@@ -38,8 +40,22 @@ ajax_urls = [
 
 download_urls = [
     path("download/dataobject/<slug:dataobject_id>/", views.DownloadView.as_view(), name="download_csv"),
+    path("download/topic/<slug:topic_id>/", views.WideDownloadView.as_view(), name="download_topic"),
+    path("download/project/<slug:project_id>/", views.WideDownloadView.as_view(), name="download_project"),
+]
+
+api_urls = [
+    path("api/projects/", views.ApiProjectsView.as_view(), name="api_projects"),
+    path("api/projects/<slug:project_id>/topics/", views.ApiTopicsView.as_view(), name="api_topics"),
+    path("api/topics/<slug:topic_id>/dataobjects/", views.ApiDataObjectsView.as_view(), name="api_dataobjects"),
+    path("api/dataobjects/<slug:dataobject_id>/series/", views.ApiSeriesView.as_view(), name="api_series"),
+    path("api/dataobjects/<slug:dataobject_id>/latest/", views.ApiLatestView.as_view(), name="api_latest"),
+    path("api/dataobjects/<slug:dataobject_id>/locations/", views.ApiLocationsView.as_view(), name="api_locations"),
+    path("api/dataobjects/<slug:dataobject_id>/positions/", views.ApiPositionsView.as_view(), name="api_positions"),
+    path("api/dataobjects/<slug:dataobject_id>/clusters/", views.ApiClustersView.as_view(), name="api_clusters"),
+    path("api/projects/<slug:project_id>/events/", views.ApiEventsView.as_view(), name="api_events"),
 ]
 
 urlpatterns = [
     path("", views.IndexView.as_view(), name="index"),
-] + new_urls + delete_urls + detail_urls + ajax_urls + download_urls + edit_urls
+] + new_urls + delete_urls + detail_urls + ajax_urls + download_urls + edit_urls + api_urls
@@ -1,7 +1,169 @@
 import logging
+import datetime
+import functools
+import importlib.util
+import json
+import os
+import sys
+import zlib
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack")
+
+DataRow = namedtuple("DataRow", ["timestamp", "model", "value"])
+
+
+@functools.lru_cache(maxsize=None)
+def is_installed(name):
+    """
+    Check if an optional module is installed without importing it, callers import it where it is used
+    @param name: module name
+    """
+    return name in sys.modules or importlib.util.find_spec(name) is not None
+
+
+def acquire_process_lock(path):
+    """
+    Take an exclusive, non blocking lock on a file, held as long as the returned file stays open
+    @param path: lock file path, created if missing
+    @return: open lock file, None if another process holds the lock
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    lock_file = open(path, "a")
+    if fcntl is None:
+        # No advisory locks on this platform, single process deployments only
+        return lock_file
+
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+
+    return lock_file
 
 
 class CSVFileRowEcho:
     def write(self, value):
         return value
 
+
+def parse_datetime_param(value, end_of_day=False):
+    """
+    Parse an ISO date/datetime query parameter into a naive UTC datetime
+    @param value: query string value, e.g. 2023-02-01 or 2023-02-01T10:00
+    @param end_of_day: for bare dates, return the start of the following day (exclusive bound)
+    @return: datetime or None if value is empty
+    @raise ValueError: value is not a valid ISO date/datetime
+    """
+    if not value:
+        return None
+
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    if end_of_day and len(value) == len("YYYY-MM-DD"):
+        parsed += datetime.timedelta(days=1)
+
+    return parsed
+
+
+def get_date_range(params):
+    """
+    Get the (start, end) export range from request parameters, defaults to today
+    @param params: request.GET
+    @return: (start, end) naive UTC datetimes, end may be None
+    @raise ValueError: invalid parameters
+    """
+    start = parse_datetime_param(params.get("start"))
+    end = parse_datetime_param(params.get("end"), end_of_day=True)
+    if start is None:
+        today = datetime.datetime.utcnow().date()
+        start = datetime.datetime.combine(today, datetime.time.min)
+
+    if end is not None and end <= start:
+        raise ValueError("end must be after start")
+
+    return start, end
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Gzip compress an iterable of str/bytes chunks on the fly
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def parse_accept(header):
+    """
+    Parse an Accept header
+    @return: dict {media range (lower case): quality}, e.g. {"application/json": 1.0, "*/*": 0.1}
+    """
+    accepted = dict()
+    for entry in header.split(","):
+        media_range, *params = [part.strip() for part in entry.split(";")]
+        if not media_range:
+            continue
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    quality = 0.0
+
+        media_range = media_range.lower()
+        accepted[media_range] = max(quality, accepted.get(media_range, 0.0))
+
+    return accepted
+
+
+def get_accept_quality(accepted, content_type):
+    """
+    Quality of a content type in a parsed Accept header, the most specific matching range wins
+    """
+    main_type = content_type.split("/")[0]
+    for media_range in (content_type, f"{main_type}/*", "*/*"):
+        if media_range in accepted:
+            return accepted[media_range]
+
+    return 0.0
+
+
+def accepts_msgpack(request):
+    """
+    Check if MessagePack is preferred over JSON in the Accept header (and available), JSON wins ties
+    """
+    if not is_installed("msgpack"):
+        return False
+
+    accepted = parse_accept(request.headers.get("Accept", ""))
+    msgpack_quality = max(get_accept_quality(accepted, content_type) for content_type in MSGPACK_CONTENT_TYPES)
+    return msgpack_quality > 0 and msgpack_quality > get_accept_quality(accepted, "application/json")
+
+
+def json_dumps(data):
+    return json.dumps(data, separators=(",", ":"), default=str)
+
+
+def msgpack_dumps(data):
+    import msgpack
+
+    return msgpack.packb(data, default=str)
@@ -1,29 +1,28 @@
+import math
 import asyncio
-import concurrent.futures
-import csv
 import logging
 import datetime
 import time
 
 import django.db.models
-import pymongo
+from django.db.models import Count
 from django.shortcuts import render, get_object_or_404
 from django.http import HttpResponse, StreamingHttpResponse
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user
+from django.core.cache import cache
 from django.utils.decorators import method_decorator
 
-from guardian.shortcuts import assign_perm, get_perms, get_objects_for_user
-
-from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.sync import sync_to_async
 # from channels.layers import get_channel_layer
 
-from .forms import NewProjectForm, NewTopicForm, NewDataObjectForm
-from .models import Project, Topic, DataObject
-from .mongodb import get_db_name, db_utils
-from .bokeh_utils import BokehPlot
-from .mqtt import mqtt_client_manager
-from . import utils
+from .forms import NewProjectForm, NewTopicForm, NewDataObjectForm, NewAlertRuleForm
+from .models import Project, Topic, DataObject, AlertRule
+from .mongodb import get_db_name
+from .mqtt.expressions import parse_expression, get_references
+from .mqtt import control, geo
+from . import utils, permissions
 
 from django.views.generic import TemplateView
 from django.views import View
@@ -50,11 +49,19 @@ class ViewsMixin:
         self.form_class = f_class
 
     def clear_context(self):
-        self.context.clear()
+        # Rebind rather than clear, the class level dict is shared between requests
+        self.context = dict()
 
     def add_context_data(self, key, value):
         self.context[str(key)] = value
 
+    def has_project_perms(self, project):
+        """
+        Check that the user has any of the required permissions on a project
+        """
+        user_permissions = permissions.get_perms(self.user, project)
+        return any(perm.split(".")[-1] in user_permissions for perm in self.required_permissions or [])
+
     def get_topics_for_project(self, project):
         topics = Topic.objects.filter(project=project)
         return topics
@@ -63,6 +70,38 @@ class ViewsMixin:
         data_objects = DataObject.objects.filter(topic=topic)
         return data_objects
 
+    def get_source_choices(self, topic):
+        # Data objects a derived series can be computed from
+        return self.get_dataobjects_for_topic(topic).exclude(format=DataObject.FORMAT_CHOICE_DERIVED)
+
+    def get_expression_error(self, topic, expression, data_object=None):
+        """
+        Check that an expression only references other data objects of the topic
+        @return: error message or None
+        """
+        if not expression:
+            return "Expression required for expression types"
+
+        _, names = parse_expression(expression)
+        data_objects = self.get_dataobjects_for_topic(topic)
+        if data_object is not None:
+            data_objects = data_objects.exclude(pk=data_object.pk)
+
+        unknown = names - set(data_objects.filter(name__in=names).values_list("name", flat=True))
+        if unknown:
+            return f"Unknown data objects in expression: {', '.join(sorted(unknown))}"
+
+        return None
+
+    def get_referencing_expressions(self, data_object):
+        """
+        Expression data objects of the topic referencing a data object by name
+        """
+        expressions = self.get_dataobjects_for_topic(data_object.topic).filter(
+            format=DataObject.FORMAT_CHOICE_EXPRESSION
+        ).exclude(pk=data_object.pk)
+        return [expression for expression in expressions if data_object.name in get_references(expression.expression)]
+
     def get_project(self, project_id):
         try:
             project = Project.objects.get(pk=project_id)
@@ -87,30 +126,25 @@ class ViewsMixin:
     def get_projects(self):
         if not self.user:
             return None
-        try:
-            projects = get_objects_for_user(self.user, self.required_permissions, any_perm=True)
-            return projects
-        except django.db.models.ObjectDoesNotExist:
-            return None
+        return permissions.get_projects_for_user(self.user, self.required_permissions)
 
-    def get_projects_param_list(self):
-        projects = self.get_projects()
+    def get_projects_param_list(self, projects=None):
+        if projects is None:
+            projects = self.get_projects()
+
+        projects = projects.prefetch_related("topic_set").annotate(
+            topic_count=Count("topic", distinct=True),
+            dataobject_count=Count("topic__dataobject", distinct=True),
+        )
         projects_param_list = list()
         for project in projects:
-            topics = self.get_topics_for_project(project)
-            mqtt_client = mqtt_client_manager.get_client(project.pk)
-            if mqtt_client:
-                connected = mqtt_client.connected
-            else:
-                connected = False
-
             project_params = {
                 "project": project,
-                "connected": connected
+                "connected": control.is_connected(project)
             }
             projects_entry = {
                 "project_params": project_params,
-                "topics": topics
+                "topics": project.topic_set.all()
             }
 
             projects_param_list.append(projects_entry)
@@ -121,6 +155,36 @@ class ViewsMixin:
         return render(request, self.template_name, self.context)
 
 
+class AsyncViewsMixin(ViewsMixin):
+    """
+    Helpers for async views, ORM and mongodb calls never block the event loop
+    """
+    async def aget_user(self, request):
+        self.user = await sync_to_async(get_user)(request)
+        return self.user
+
+    async def aget_project(self, project_id):
+        try:
+            return await Project.objects.aget(pk=project_id)
+        except django.db.models.ObjectDoesNotExist:
+            return None
+
+    async def aget_topic(self, topic_id):
+        try:
+            return await Topic.objects.select_related("project").aget(pk=topic_id)
+        except django.db.models.ObjectDoesNotExist:
+            return None
+
+    async def aget_data_object(self, dataobject_id):
+        try:
+            return await DataObject.objects.select_related("topic__project").aget(pk=dataobject_id)
+        except django.db.models.ObjectDoesNotExist:
+            return None
+
+    async def arender_template(self, request):
+        return await sync_to_async(render)(request, self.template_name, self.context)
+
+
 @method_decorator(detail_decorators, name="dispatch")
 class IndexView(ViewsMixin, TemplateView):
     def __init__(self):
@@ -188,6 +252,7 @@ class DetailDataObjectView(ViewsMixin, TemplateView):
         self.add_context_data("dataobject", data_object)
         self.add_context_data("topic", topic)
         self.add_context_data("project", project)
+        self.add_context_data("alert_rules", data_object.alert_rules.order_by("pk"))
         return self.context
 
 
@@ -238,15 +303,8 @@ class NewProjectView(ViewsMixin, View):
                 self.add_context_data("form", form)
                 return self.render_template(request)
 
-            assign_perm("is_owner", self.user, project)
-            mqtt_client_manager.add_client(
-                client_id=project.pk,
-                host=project.host,
-                port=project.port,
-                userdata=None
-            )
-            mqtt_client_manager.connect_client(project.pk)
-            mqtt_client_manager.start_client(project.pk)
+            permissions.assign_perm("is_owner", self.user, project)
+            control.project_saved(project)
             return HttpResponse(status=201)
         else:
             form.add_error(None, "Form not valid. Please review form and update.")
@@ -263,15 +321,7 @@ class NewTopicView(ViewsMixin, View):
         self.set_form_class(NewTopicForm)
 
     def subscribe_mqtt_topic(self, project, topic):
-        _client = mqtt_client_manager.get_client(project.pk)
-        if not _client:
-            logging.debug("Not valid client")
-            return False
-
-        return async_to_sync(_client.subscribe_topic)(
-            topic=topic.path,
-            qos=topic.qos
-        )
+        control.topics_changed(project.pk)
 
     def get(self, request, *args, **kwargs):
         self.user = get_user(request)
@@ -305,6 +355,8 @@ class NewTopicView(ViewsMixin, View):
                 sub=form.cleaned_data["sub"] == "sub",
                 pub=form.cleaned_data["sub"] == "pub",
                 qos=form.cleaned_data["qos"],
+                dedup_window=form.cleaned_data["dedup_window"] or 0,
+                dedup_key=form.cleaned_data["dedup_key"],
                 project=project,
             )
 
@@ -342,6 +394,9 @@ class NewDataObject(ViewsMixin, View):
         self.add_context_data("format_choices", DataObject.FORMAT_CHOICES)
         self.add_context_data("data_types", DataObject.DATA_TYPE_CHOICES)
         self.add_context_data("widget_types", DataObject.WIDGET_TYPE_CHOICES)
+        self.add_context_data("deadband_types", DataObject.DEADBAND_TYPE_CHOICES)
+        self.add_context_data("operator_choices", DataObject.OPERATOR_CHOICES)
+        self.add_context_data("source_choices", self.get_source_choices(topic))
         return self.render_template(request)
 
     def post(self, request, *args, **kwargs):
@@ -353,11 +408,29 @@ class NewDataObject(ViewsMixin, View):
         self.add_context_data("format_choices", DataObject.FORMAT_CHOICES)
         self.add_context_data("data_types", DataObject.DATA_TYPE_CHOICES)
         self.add_context_data("widget_types", DataObject.WIDGET_TYPE_CHOICES)
+        self.add_context_data("deadband_types", DataObject.DEADBAND_TYPE_CHOICES)
+        self.add_context_data("operator_choices", DataObject.OPERATOR_CHOICES)
+        self.add_context_data("source_choices", self.get_source_choices(topic))
 
         if form.is_valid():
             if (not form.cleaned_data["key"]) and (form.cleaned_data["format"] == DataObject.FORMAT_CHOICE_JSON):
                 form.add_error(None, "Key required for JSON types")
                 return self.render_template(request)
+            if (not form.cleaned_data["struct_format"]) and (form.cleaned_data["format"] == DataObject.FORMAT_CHOICE_STRUCT):
+                form.add_error(None, "Struct format required for packed struct types")
+                return self.render_template(request)
+
+            source = None
+            if form.cleaned_data["format"] == DataObject.FORMAT_CHOICE_DERIVED:
+                source = self.get_source_choices(topic).filter(pk=form.cleaned_data["source"]).first()
+                if source is None:
+                    form.add_error(None, "Source must be a data object of this topic")
+                    return self.render_template(request)
+            if form.cleaned_data["format"] == DataObject.FORMAT_CHOICE_EXPRESSION:
+                error = self.get_expression_error(topic, form.cleaned_data["expression"])
+                if error:
+                    form.add_error(None, error)
+                    return self.render_template(request)
 
             data_object = DataObject(
                 name=form.cleaned_data["name"],
@@ -366,6 +439,17 @@ class NewDataObject(ViewsMixin, View):
                 data_type=form.cleaned_data["data_type"],
                 path=form.cleaned_data["path"],
                 key=form.cleaned_data["key"],
+                struct_format=form.cleaned_data["struct_format"],
+                struct_offset=form.cleaned_data["struct_offset"] or 0,
+                deadband=form.cleaned_data["deadband"],
+                deadband_type=form.cleaned_data["deadband_type"] or DataObject.DEADBAND_ABSOLUTE,
+                min_interval=form.cleaned_data["min_interval"],
+                heartbeat=form.cleaned_data["heartbeat"],
+                gauge_max=form.cleaned_data["gauge_max"] or None,
+                source=source,
+                operator=form.cleaned_data["operator"] or None,
+                operator_param=form.cleaned_data["operator_param"],
+                expression=form.cleaned_data["expression"] or None,
                 topic=topic,
                 widget_type=form.cleaned_data["widget_type"]
             )
@@ -380,6 +464,74 @@ class NewDataObject(ViewsMixin, View):
             return self.render_template(request)
 
 
+class NewAlertRuleView(ViewsMixin, View):
+    def __init__(self):
+        super().__init__()
+        self.set_template_name("dashboard/modals/new_alertrule.html")
+        self.set_form_class(NewAlertRuleForm)
+        self.set_required_permissions([
+            "dashboard.is_owner",
+            "dashboard.can_add",
+        ])
+
+    def get_permitted_data_object(self, dataobject_id):
+        data_object = self.get_data_object(dataobject_id)
+        if data_object is None or not self.has_project_perms(data_object.topic.project):
+            return None
+
+        return data_object
+
+    def get(self, request, *args, **kwargs):
+        self.user = get_user(request)
+        if not self.user.is_authenticated:
+            return HttpResponse(status=403)
+
+        self.clear_context()
+        data_object = self.get_permitted_data_object(kwargs["dataobject_id"])
+        if data_object is None:
+            return HttpResponse(status=404)
+
+        self.add_context_data("dataobject", data_object)
+        self.add_context_data("form", self.form_class())
+        self.add_context_data("rule_choices", AlertRule.RULE_CHOICES)
+        return self.render_template(request)
+
+    def post(self, request, *args, **kwargs):
+        self.user = get_user(request)
+        if not self.user.is_authenticated:
+            return HttpResponse(status=403)
+
+        self.clear_context()
+        data_object = self.get_permitted_data_object(kwargs["dataobject_id"])
+        if data_object is None:
+            return HttpResponse(status=404)
+
+        form = self.form_class(request.POST)
+        self.add_context_data("dataobject", data_object)
+        self.add_context_data("form", form)
+        self.add_context_data("rule_choices", AlertRule.RULE_CHOICES)
+
+        if form.is_valid():
+            alert_rule = AlertRule(
+                name=form.cleaned_data["name"],
+                description=form.cleaned_data["desc"],
+                rule_type=form.cleaned_data["rule_type"],
+                threshold=form.cleaned_data["threshold"],
+                hysteresis=form.cleaned_data["hysteresis"] or 0,
+                timeout=form.cleaned_data["timeout"],
+                data_object=data_object,
+            )
+            try:
+                alert_rule.save()
+                return HttpResponse(status=201)
+            except:
+                form.add_error(None, "Unknown error occurred!")
+                return self.render_template(request)
+        else:
+            form.add_error(None, "Form invalid!")
+            return self.render_template(request)
+
+
 """
 Delete
 """
@@ -393,24 +545,21 @@ class DeleteProjectView(ViewsMixin, View):
         ])
 
     def get(self, request, *args, **kwargs):
+        from .mongodb import db_utils
+
         self.user = get_user(request)
         project = self.get_project(kwargs["project_id"])
-        user_permissions = get_perms(self.user, project)
+        user_permissions = permissions.get_perms(self.user, project)
         logging.debug(f"User perms: {user_permissions}, required: {self.required_permissions}")
 
         if ("is_owner" not in user_permissions) and ("can_delete" not in user_permissions):
             return HttpResponse(status=500)
 
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            fut = pool.submit(
-                db_utils.delete_project_collection, project
-            )
-
-            if not fut.result():
-                return HttpResponse(status=500)
+        if not db_utils.delete_project_collection(project):
+            return HttpResponse(status=500)
 
-        mqtt_client_manager.delete_client(project.pk)
         project.delete()
+        control.project_deleted(project.pk)
         self.clear_context()
         self.add_context_data("project_list", self.get_projects_param_list())
         return self.render_template(request)
@@ -426,30 +575,22 @@ class DeleteTopicView(ViewsMixin, View):
         ])
 
     def get(self, request, *args, **kwargs):
+        from .mongodb import db_utils
+
         topic = self.get_topic(kwargs["topic_id"])
         project = self.get_project(topic.project.pk)
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            fut = pool.submit(
-                db_utils.delete_topic_documents, project, topic
-            )
-
-            if not fut.result():
-                return HttpResponse(status=500)
+        if not db_utils.delete_topic_documents(project, topic):
+            return HttpResponse(status=500)
 
-        self.unsubscribe_mqtt_topic(project, topic)
         topic.delete()
+        self.unsubscribe_mqtt_topic(project, topic)
         self.clear_context()
         self.add_context_data("project", project)
         self.add_context_data("topics", self.get_topics_for_project(project))
         return self.render_template(request)
 
     def unsubscribe_mqtt_topic(self, project, topic):
-        _client = mqtt_client_manager.get_client(project.pk)
-        if not _client:
-            logging.error("No valid client")
-            return
-
-        async_to_sync(_client.unsubscribe_topic)(topic.path)
+        control.topics_changed(project.pk)
 
 
 class DeleteDataObject(ViewsMixin, View):
@@ -462,17 +603,18 @@ class DeleteDataObject(ViewsMixin, View):
         ])
 
     def get(self, request, *args, **kwargs):
+        from .mongodb import db_utils
+
         data_object = self.get_data_object(kwargs["dataobject_id"])
         topic = self.get_topic(data_object.topic.pk)
         project = self.get_project(topic.project.pk)
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            fut = pool.submit(
-                db_utils.delete_dataobject, project, topic, data_object
-            )
+        referencing = self.get_referencing_expressions(data_object)
+        if referencing:
+            names = ", ".join(expression.name for expression in referencing)
+            return HttpResponse(f"Data object is used by expressions: {names}", status=409)
 
-            res = fut.result()
-            if not res:
-                return HttpResponse(status=500)
+        if not db_utils.delete_dataobject(project, topic, data_object):
+            return HttpResponse(status=500)
 
         data_object.delete()
         self.clear_context()
@@ -481,11 +623,43 @@ class DeleteDataObject(ViewsMixin, View):
         return self.render_template(request)
 
 
+class DeleteAlertRuleView(ViewsMixin, View):
+    def __init__(self):
+        super().__init__()
+        self.set_template_name("dashboard/detail/include/alertrules.html")
+        self.set_required_permissions([
+            "dashboard.is_owner",
+            "dashboard.can_delete",
+        ])
+
+    def get(self, request, *args, **kwargs):
+        self.user = get_user(request)
+        if not self.user.is_authenticated:
+            return HttpResponse(status=403)
+
+        try:
+            alert_rule = AlertRule.objects.select_related("data_object__topic__project").get(pk=kwargs["alertrule_id"])
+        except django.db.models.ObjectDoesNotExist:
+            return HttpResponse(status=404)
+
+        if not self.has_project_perms(alert_rule.data_object.topic.project):
+            return HttpResponse(status=404)
+
+        data_object = alert_rule.data_object
+        alert_rule.delete()
+        self.clear_context()
+        self.add_context_data("dataobject", data_object)
+        self.add_context_data("alert_rules", data_object.alert_rules.order_by("pk"))
+        return self.render_template(request)
+
+
 class EditDataObjectView(ViewsMixin, View):
     context = {
         "format_choices": DataObject.FORMAT_CHOICES,
         "data_types": DataObject.DATA_TYPE_CHOICES,
         "widget_types": DataObject.WIDGET_TYPE_CHOICES,
+        "deadband_types": DataObject.DEADBAND_TYPE_CHOICES,
+        "operator_choices": DataObject.OPERATOR_CHOICES,
     }
 
     def __init__(self):
@@ -503,32 +677,82 @@ class EditDataObjectView(ViewsMixin, View):
             "path": data_object.path,
             "format": data_object.format,
             "key": data_object.key,
+            "struct_format": data_object.struct_format,
+            "struct_offset": data_object.struct_offset,
+            "deadband": data_object.deadband,
+            "deadband_type": data_object.deadband_type,
+            "min_interval": data_object.min_interval,
+            "heartbeat": data_object.heartbeat,
+            "gauge_max": data_object.gauge_max,
+            "source": data_object.source_id,
+            "operator": data_object.operator,
+            "operator_param": data_object.operator_param,
+            "expression": data_object.expression,
         }
 
         form = self.form_class(initial)
         self.add_context_data("form", form)
         self.add_context_data("dataobject", data_object)
+        self.add_context_data("source_choices", self.get_source_choices(topic).exclude(pk=data_object.pk))
         return self.render_template(request)
 
     def post(self, request, *args, **kwargs):
         data_object = self.get_data_object(kwargs["dataobject_id"])
-        form = self.form_class(request.POST)
+        source_choices = self.get_source_choices(data_object.topic).exclude(pk=data_object.pk)
+        form = self.form_class(request.POST, current_name=data_object.name)
         self.add_context_data("form", form)
         self.add_context_data("dataobject", data_object)
+        self.add_context_data("source_choices", source_choices)
         if not form.has_changed():
             return HttpResponse(status=201)
         elif form.is_valid():
-            data_object.name = form.cleaned_data.get("name", data_object.name)
+            name = form.cleaned_data.get("name", data_object.name)
+            if name != data_object.name:
+                referencing = self.get_referencing_expressions(data_object)
+                if referencing:
+                    names = ", ".join(expression.name for expression in referencing)
+                    form.add_error("name", f"Cannot rename, used by expressions: {names}")
+                    return render(request, self.template_name, self.context)
+
+            data_object.name = name
             data_object.description = form.cleaned_data.get("desc", data_object.description)
             data_object.path = form.cleaned_data.get("path", data_object.path)
             data_object.key = form.cleaned_data.get("key", data_object.key)
             data_object.format = form.cleaned_data.get("format", data_object.format)
+            data_object.struct_format = form.cleaned_data.get("struct_format", data_object.struct_format)
+            data_object.struct_offset = form.cleaned_data.get("struct_offset") or 0
+            data_object.deadband = form.cleaned_data.get("deadband")
+            data_object.deadband_type = form.cleaned_data.get("deadband_type") or data_object.deadband_type
+            data_object.min_interval = form.cleaned_data.get("min_interval")
+            data_object.heartbeat = form.cleaned_data.get("heartbeat")
+            data_object.gauge_max = form.cleaned_data.get("gauge_max") or None
+            data_object.operator = form.cleaned_data.get("operator") or None
+            data_object.operator_param = form.cleaned_data.get("operator_param")
+            data_object.expression = form.cleaned_data.get("expression") or None
             data_object.data_type = form.cleaned_data.get("data_type", data_object.data_type)
             data_object.widget_type = form.cleaned_data.get("widget_type", data_object.widget_type)
 
             if (data_object.format == data_object.FORMAT_CHOICE_JSON) and (not data_object.key):
                 form.add_error(None, "Key required for json data types")
                 return render(request, self.template_name, self.context)
+            if (data_object.format == data_object.FORMAT_CHOICE_STRUCT) and (not data_object.struct_format):
+                form.add_error(None, "Struct format required for packed struct types")
+                return render(request, self.template_name, self.context)
+
+            data_object.source = None
+            if data_object.is_derived():
+                data_object.source = source_choices.filter(pk=form.cleaned_data["source"]).first()
+                if data_object.source is None:
+                    form.add_error(None, "Source must be another data object of this topic")
+                    return render(request, self.template_name, self.context)
+                if data_object.derived.exists():
+                    form.add_error(None, "Data objects with derived series cannot be derived")
+                    return render(request, self.template_name, self.context)
+            if data_object.is_expression():
+                error = self.get_expression_error(data_object.topic, data_object.expression, data_object)
+                if error:
+                    form.add_error(None, error)
+                    return render(request, self.template_name, self.context)
 
             data_object.save()
             return HttpResponse(status=201)
@@ -540,154 +764,707 @@ class EditDataObjectView(ViewsMixin, View):
 """
 Ajax queries
 """
-class QueryDataObjectsView(ViewsMixin, View):
+class QueryDataObjectsView(AsyncViewsMixin, View):
+    samples_per_page = 25
+
     def __init__(self):
         super().__init__()
         self.set_template_name("dashboard/partials/ajax/dataobjects.html")
 
-    def get(self, request, *args, **kwargs):
-        self.user = get_user(request)
+    def build_data_rows(self, samples, data_objects):
+        """
+        Flatten samples into one row per stored value
+        @param samples: stored value objects ({"timestamp": ..., "value": {pk: value}})
+        @param data_objects: data objects of the topic keyed by pk
+        @return: DataRow list
+        """
+        data_rows = list()
+        for value_obj in samples:
+            timestamp = datetime.datetime.fromtimestamp(float(value_obj["timestamp"]))
+            for key, value in value_obj["value"].items():
+                data_object = data_objects.get(int(key), None)
+                if data_object is None:
+                    # Data object deleted after the sample was stored
+                    continue
+
+                data_rows.append(utils.DataRow(timestamp, data_object, value))
+
+        return data_rows
+
+    async def get(self, request, *args, **kwargs):
+        from .mongodb import async_db_utils
+
+        await self.aget_user(request)
         if not self.user.is_authenticated:
             return HttpResponse(status=403)
 
         self.clear_context()
-        topic = self.get_topic(kwargs["topic_id"])
-        project = self.get_project(topic.project.pk)
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
-            t = pool.submit(
-                db_utils.get_data_objects, project, topic
-            )
+        topic = await self.aget_topic(kwargs["topic_id"])
+        if topic is None:
+            return HttpResponse(status=404)
 
-            values_list = t.result()
+        values_list = await async_db_utils.get_data_objects(topic.project, topic)
 
+        self.add_context_data("topic", topic)
         if values_list:
-            data_details = list()
-            for value_obj in values_list:
-                data_detail = dict()
-                data_detail["timestamp"] = datetime.datetime.fromtimestamp(float(value_obj["timestamp"]))
-                for key, value in value_obj["value"].items():
-                    data_object = get_object_or_404(DataObject, pk=key)
-                    data_detail["model"] = data_object
-                    data_detail["value"] = value
-                    data_details.append(data_detail)
+            data_objects = await DataObject.objects.filter(topic=topic).ain_bulk()
+            page = Paginator(values_list, self.samples_per_page).get_page(request.GET.get("page"))
+            self.add_context_data("page", page)
+            self.add_context_data("data_details", self.build_data_rows(page.object_list, data_objects))
 
-            self.add_context_data("data_details", data_details)
+        return await self.arender_template(request)
 
-        return self.render_template(request)
 
+class QueryDataObjectValues(AsyncViewsMixin, View):
+    max_map_clusters = 500
+    default_gauge_max = 100.0
+    gauge_cache_timeout = 300
 
-class QueryDataObjectValues(ViewsMixin, View):
     def __init__(self):
         super().__init__()
         self.set_template_name("dashboard/partials/data_values_container.html")
 
-    def get(self, request, *args, **kwargs):
-        self.user = get_user(request)
+    def get_gauge_components(self, data_object, latest):
+        """
+        Rendered gauge of a latest value, cached until a newer sample arrives
+        """
+        from .bokeh_utils import BokehPlot
+
+        if data_object.data_type != DataObject.DATA_TYPE_NUMBER:
+            return "", ""
+
+        max_value = data_object.gauge_max or self.default_gauge_max
+        key = f"dashboard:gauge:{data_object.pk}:{latest['timestamp']}:{max_value}"
+        components = cache.get(key, None)
+        if components is None:
+            plot = BokehPlot()
+            plot.gauge_plot(round(float(latest["value"]), 2), max_value)
+            components = plot.get_components() or ("", "")
+            cache.set(key, components, timeout=self.gauge_cache_timeout)
+
+        return components
+
+    async def get_latest_value_widget(self, request, data_object):
+        """
+        Status and gauge widgets: one latest value read, no time series query
+        """
+        from .mongodb import async_db_utils
+
+        latest = await async_db_utils.get_latest_value(data_object.topic.project, data_object)
+        self.set_template_name("dashboard/partials/latest_value_container.html")
+        self.add_context_data("data_object", data_object)
+        if latest is not None:
+            self.add_context_data("timestamp", datetime.datetime.fromtimestamp(float(latest["timestamp"])))
+            self.add_context_data("value", latest["value"])
+            if data_object.widget_type == DataObject.WIDGET_TYPE_GAUGE:
+                bokeh_script, bokeh_div = await sync_to_async(self.get_gauge_components, thread_sensitive=False)(
+                    data_object, latest
+                )
+                self.add_context_data("bokeh_script", bokeh_script)
+                self.add_context_data("bokeh_div", bokeh_div)
+
+        return await self.arender_template(request)
+
+    def get_plot_components(self, data_object, x_values, y_values):
+        from .bokeh_utils import BokehPlot
+
+        if data_object.data_type == DataObject.DATA_TYPE_LOCATION:
+            # GeoJSON points, not plottable as a time series
+            return "", ""
+
+        plot = BokehPlot(x_list=x_values, y_list=y_values)
+        if data_object.widget_type == DataObject.WIDGET_TYPE_LINE:
+            plot.plot_timeseries()
+        elif data_object.widget_type == DataObject.WIDGET_TYPE_SCATTER:
+            plot.scatter_plot("Scatter Plot")
+
+        return plot.get_components() or ("", "")
+
+    async def get(self, request, *args, **kwargs):
+        from .mongodb import async_db_utils
+
+        await self.aget_user(request)
         if not self.user.is_authenticated:
             return HttpResponse(status=403)
 
         self.clear_context()
-        data_object = self.get_data_object(kwargs["dataobject_id"])
-        topic = self.get_topic(data_object.topic.pk)
-        project = self.get_project(topic.project.pk)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
-            fut = pool.submit(
-                db_utils.get_data_objects, project, topic
-            )
+        data_object = await self.aget_data_object(kwargs["dataobject_id"])
+        if data_object is None:
+            return HttpResponse(status=404)
 
-            values_list = fut.result()
+        if data_object.widget_type in DataObject.LATEST_VALUE_WIDGETS:
+            return await self.get_latest_value_widget(request, data_object)
+        if data_object.widget_type == DataObject.WIDGET_TYPE_MAP:
+            return await self.get_map_widget(request, data_object)
+
+        topic = data_object.topic
+        values_list = await async_db_utils.get_data_objects(topic.project, topic)
 
         if values_list:
             x_values = list()
             y_values = list()
             data_details = list()
+            key = f"{data_object.pk}"
             for value_obj in values_list:
-                data_detail = dict()
-                data_detail["timestamp"] = datetime.datetime.fromtimestamp(float(value_obj["timestamp"]))
-                for key, value in value_obj["value"].items():
-                    if int(key) != data_object.pk:
-                        continue
-                    data_detail["data_object"] = data_object
-                    data_detail["value"] = value
-                    data_details.append(data_detail)
-                    x_values.append(data_detail["timestamp"])
-                    y_values.append(value)
-
-            plot = BokehPlot(x_list=x_values[:30], y_list=y_values[:30])
-            if data_object.widget_type == DataObject.WIDGET_TYPE_LINE:
-                plot.plot_timeseries()
-                bokeh_script, bokeh_div = plot.get_components()
-            elif data_object.widget_type == DataObject.WIDGET_TYPE_SCATTER:
-                plot.scatter_plot("Scatter Plot")
-                bokeh_script, bokeh_div = plot.get_components()
-            elif data_object.widget_type == DataObject.WIDGET_TYPE_STATUS:
-                plot.plot_timeseries()
-                bokeh_script, bokeh_div = plot.get_components()
-            else:
-                bokeh_script, bokeh_div = plot.get_components()
+                value = value_obj["value"].get(key, None)
+                if value is None:
+                    continue
+
+                timestamp = datetime.datetime.fromtimestamp(float(value_obj["timestamp"]))
+                data_details.append(utils.DataRow(timestamp, data_object, value))
+                x_values.append(timestamp)
+                y_values.append(value)
+
+            # Plot rendering is CPU bound, keep it off the event loop
+            bokeh_script, bokeh_div = await sync_to_async(self.get_plot_components, thread_sensitive=False)(
+                data_object, x_values[:30], y_values[:30]
+            )
 
             self.add_context_data("data_object", data_object)
             self.add_context_data("data_list", data_details[:30])
             self.add_context_data("bokeh_script", bokeh_script)
             self.add_context_data("bokeh_div", bokeh_div)
 
-        return self.render_template(request)
+        return await self.arender_template(request)
+
+    async def get_map_widget(self, request, data_object):
+        """
+        Map widgets: clustered positions from the locations collection, no time series query
+        """
+        bokeh_script, bokeh_div = await self.get_map_components(data_object)
+        self.add_context_data("data_object", data_object)
+        self.add_context_data("bokeh_script", bokeh_script)
+        self.add_context_data("bokeh_div", bokeh_div)
+        return await self.arender_template(request)
+
+    async def get_map_components(self, data_object):
+        """
+        Map of the latest device positions, clustered server side at the zoom level fitting all devices
+        """
+        from .bokeh_utils import BokehPlot
+        from .mongodb import async_db_utils
+
+        if data_object.data_type != DataObject.DATA_TYPE_LOCATION:
+            return "", ""
+
+        project = data_object.topic.project
+        extent = await async_db_utils.get_extent(project, data_object)
+        if extent is None:
+            return "", ""
+
+        zoom = geo.get_fit_zoom(extent["west"], extent["south"], extent["east"], extent["north"])
+        clusters = await async_db_utils.get_clusters(project, data_object, zoom, limit=self.max_map_clusters)
+
+        def render():
+            plot = BokehPlot()
+            plot.map_plot(clusters, "Latest positions")
+            return plot.get_components() or ("", "")
+
+        return await sync_to_async(render, thread_sensitive=False)()
+
+
+class ExportViewMixin:
+    batch_size = 8
+    required_permissions = [
+        "dashboard.is_owner",
+        "dashboard.can_view",
+        "dashboard.can_delete",
+    ]
+
+    def dispatch(self, request, *args, **kwargs):
+        self.user = get_user(request)
+        if not self.user.is_authenticated:
+            return HttpResponse(status=403)
+
+        return super().dispatch(request, *args, **kwargs)
+
+    def export_response(self, request, columns, rows, name):
+        """
+        Stream rows in the format requested by the 'format' and 'compress' parameters
+        @param columns: (name, data_type) of each value column
+        @param rows: (datetime, value1, ...) rows iterable
+        @param name: file name without extension
+        """
+        from . import exporters
+
+        exporter_class = exporters.get_exporter_class(request.GET.get("format", "csv"))
+        if exporter_class is None:
+            return HttpResponse("Unsupported export format", status=400)
+
+        exporter = exporter_class(columns)
+        content = exporter.stream(rows)
+        filename = "{}.{}".format(name, exporter.extension)
+        content_type = exporter.content_type
+        if request.GET.get("compress") == "gzip" and exporter.compressible:
+            content = utils.gzip_stream(content)
+            filename += ".gz"
+            content_type = "application/gzip"
+
+        return StreamingHttpResponse(
+            content,
+            content_type=content_type,
+            headers={"Content-Disposition": "attachment; filename={}".format(filename)}
+        )
 
 
-class DownloadView(ViewsMixin, View):
+class DownloadView(ExportViewMixin, ViewsMixin, View):
     def __init__(self):
         super().__init__()
 
+    def get_rows(self, project, topic, dataobject, start, end):
+        from .mongodb import db_utils
+
+        key = f"{dataobject.pk}"
+        samples = db_utils.iter_samples(project, [topic], start, end, dataobjects=[dataobject],
+                                        batch_size=self.batch_size)
+        for _, timestamp, values in samples:
+            val = values.get(key, None)
+            if val is None:
+                continue
+
+            yield datetime.datetime.fromtimestamp(timestamp), val
+
     def get(self, request, *args, **kwargs):
         dataobject = self.get_data_object(kwargs["dataobject_id"])
+        if dataobject is None:
+            return HttpResponse(status=404)
+
         topic = self.get_topic(dataobject.topic.pk)
         project = self.get_project(topic.project.pk)
-        entries_num = 500
-
-        aggregation = [
-            {"$match": {
-                "$and": [{"topic": topic.pk}, {"date": datetime.datetime.utcnow().toordinal()}]
-            }},
-            {"$sort": {"values.timestamp": pymongo.DESCENDING}},
-            {"$limit": entries_num},
-            {"$project": {"_id": 0, "values.timestamp": 1, f"values.value.{dataobject.pk}": 1}},
-        ]
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
-            fut = pool.submit(
-                db_utils.get_data_objects_by_aggregation, project, aggregation
-            )
+        if not self.has_project_perms(project):
+            return HttpResponse(status=404)
 
-            cursor = fut.result()
+        try:
+            start, end = utils.get_date_range(request.GET)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+
+        return self.export_response(
+            request,
+            [(dataobject.name, dataobject.data_type)],
+            self.get_rows(project, topic, dataobject, start, end),
+            "{}_{}".format(dataobject.id, start.date().isoformat()),
+        )
 
-        if not cursor:
-            return HttpResponse(status=500)
 
-        csv_rows = list()
-        for obj in cursor:
-            values = obj["values"]
-            for elem in values:
-                val_obj = elem["value"]
-                val = val_obj.get(f"{dataobject.id}", None)
-                if not val:
+class WideDownloadView(ExportViewMixin, ViewsMixin, View):
+    """
+    Export all data objects of a topic or project as one table joined on timestamp,
+    reading every stored document once. Optional 'interval' (seconds) resamples the table.
+    """
+    def __init__(self):
+        super().__init__()
+
+    def get_column_name(self, dataobject, qualified):
+        if qualified:
+            return f"{dataobject.topic.name}.{dataobject.name}"
+
+        return dataobject.name
+
+    def get_interval(self, params):
+        """
+        Resampling interval in seconds, 0 if not requested
+        @raise ValueError: not a finite positive number
+        """
+        if not params.get("interval"):
+            return 0
+
+        interval = float(params["interval"])
+        if not math.isfinite(interval) or interval <= 0:
+            raise ValueError("interval must be a positive number of seconds")
+
+        return interval
+
+    def get(self, request, *args, **kwargs):
+        from . import timeseries
+        from .mongodb import db_utils
+
+        if "topic_id" in kwargs:
+            topic = get_object_or_404(Topic, pk=kwargs["topic_id"])
+            project = topic.project
+            topics = [topic]
+            name = "topic_{}".format(topic.id)
+        else:
+            project = get_object_or_404(Project, pk=kwargs["project_id"])
+            topics = list(self.get_topics_for_project(project))
+            name = "project_{}".format(project.id)
+
+        if not self.has_project_perms(project):
+            return HttpResponse(status=404)
+
+        dataobjects = list(DataObject.objects.filter(topic__in=topics).select_related("topic").order_by("topic", "pk"))
+        try:
+            start, end = utils.get_date_range(request.GET)
+            interval = self.get_interval(request.GET)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+
+        samples = db_utils.iter_samples(project, topics, start, end, dataobjects=dataobjects,
+                                        batch_size=self.batch_size)
+        chunks = timeseries.iter_wide_chunks(samples, [f"{dataobject.pk}" for dataobject in dataobjects])
+        if interval > 0:
+            numeric_columns = [dataobject.data_type == DataObject.DATA_TYPE_NUMBER for dataobject in dataobjects]
+            chunks = timeseries.iter_resampled_chunks(chunks, interval, numeric_columns)
+
+        qualified = len(topics) > 1
+        columns = [(self.get_column_name(dataobject, qualified), dataobject.data_type) for dataobject in dataobjects]
+        return self.export_response(
+            request,
+            columns,
+            timeseries.iter_datetime_rows(chunks),
+            "{}_{}".format(name, start.date().isoformat()),
+        )
+
+
+"""
+API
+"""
+class ApiViewsMixin(AsyncViewsMixin):
+    required_permissions = [
+        "dashboard.is_owner",
+        "dashboard.can_view",
+        "dashboard.can_delete",
+    ]
+
+    async def has_project_access(self, project):
+        user_permissions = await sync_to_async(permissions.get_perms)(self.user, project)
+        return any(perm.split(".")[-1] in user_permissions for perm in self.required_permissions)
+
+    def api_response(self, request, data, status=200):
+        if utils.accepts_msgpack(request):
+            return HttpResponse(utils.msgpack_dumps(data), content_type="application/msgpack", status=status)
+
+        return HttpResponse(utils.json_dumps(data), content_type="application/json", status=status)
+
+    def api_error(self, request, message, status):
+        return self.api_response(request, {"error": message}, status=status)
+
+    async def dispatch(self, request, *args, **kwargs):
+        await self.aget_user(request)
+        if not self.user.is_authenticated:
+            return self.api_error(request, "Authentication required", 403)
+
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class ApiProjectsView(ApiViewsMixin, View):
+    def get_project_data(self, project):
+        return {
+            "id": project.pk,
+            "name": project.name,
+            "description": project.description,
+            "host": project.host,
+            "port": project.port,
+            "connected": control.is_connected(project),
+            **control.get_metrics(project.pk),
+        }
+
+    async def get(self, request, *args, **kwargs):
+        projects = await sync_to_async(self.get_projects)()
+        data = {
+            "projects": [
+                await sync_to_async(self.get_project_data)(project) async for project in projects.order_by("pk")
+            ]
+        }
+        return self.api_response(request, data)
+
+
+class ApiTopicsView(ApiViewsMixin, View):
+    async def get(self, request, *args, **kwargs):
+        project = await self.aget_project(kwargs["project_id"])
+        if project is None or not await self.has_project_access(project):
+            return self.api_error(request, "Project not found", 404)
+
+        data = {
+            "project": project.pk,
+            "topics": [{
+                "id": topic.pk,
+                "name": topic.name,
+                "path": topic.path,
+                "qos": topic.qos,
+                "dedup_window": topic.dedup_window,
+                "dedup_key": topic.dedup_key,
+            } async for topic in self.get_topics_for_project(project).order_by("pk")]
+        }
+        return self.api_response(request, data)
+
+
+class ApiDataObjectsView(ApiViewsMixin, View):
+    async def get(self, request, *args, **kwargs):
+        topic = await self.aget_topic(kwargs["topic_id"])
+        if topic is None or not await self.has_project_access(topic.project):
+            return self.api_error(request, "Topic not found", 404)
+
+        data = {
+            "topic": topic.pk,
+            "dataobjects": [{
+                "id": dataobject.pk,
+                "name": dataobject.name,
+                "format": dataobject.format,
+                "data_type": dataobject.data_type,
+                "widget_type": dataobject.widget_type,
+                "path": dataobject.path,
+                "key": dataobject.key,
+                "struct_format": dataobject.struct_format,
+                "struct_offset": dataobject.struct_offset,
+                "deadband": dataobject.deadband,
+                "deadband_type": dataobject.deadband_type,
+                "min_interval": dataobject.min_interval,
+                "heartbeat": dataobject.heartbeat,
+                "gauge_max": dataobject.gauge_max,
+                "source": dataobject.source_id,
+                "operator": dataobject.operator,
+                "operator_param": dataobject.operator_param,
+                "expression": dataobject.expression,
+            } async for dataobject in self.get_dataobjects_for_topic(topic).order_by("pk")]
+        }
+        return self.api_response(request, data)
+
+
+class ApiSeriesView(ApiViewsMixin, View):
+    """
+    Columnar series of a data object.
+    Parameters: start/end (ISO date/datetime), resolution (seconds), limit, after (timestamp cursor)
+    """
+    default_limit = 1000
+    max_limit = 10000
+
+    async def get(self, request, *args, **kwargs):
+        from . import timeseries
+        from .mongodb import async_db_utils
+
+        dataobject = await self.aget_data_object(kwargs["dataobject_id"])
+        if dataobject is None or not await self.has_project_access(dataobject.topic.project):
+            return self.api_error(request, "Data object not found", 404)
+
+        try:
+            start, end = utils.get_date_range(request.GET)
+            resolution = float(request.GET.get("resolution", 0))
+            limit = min(int(request.GET.get("limit", self.default_limit)), self.max_limit)
+            after = request.GET.get("after", None)
+            after = float(after) if after else None
+            after_time = datetime.datetime.fromtimestamp(after) if after is not None else None
+        except (ValueError, OverflowError, OSError) as e:
+            # fromtimestamp rejects nan, inf and timestamps outside of the platform's range
+            return self.api_error(request, str(e), 400)
+
+        if limit <= 0:
+            return self.api_error(request, "limit must be positive", 400)
+        if not math.isfinite(resolution) or resolution < 0:
+            return self.api_error(request, "resolution must be a positive number of seconds", 400)
+
+        if after_time is not None:
+            start = max(start, after_time) if request.GET.get("start") else after_time
+
+        topic = dataobject.topic
+        key = f"{dataobject.pk}"
+        resampler = None
+        if resolution > 0:
+            resampler = timeseries.ChunkResampler(resolution, [dataobject.data_type == DataObject.DATA_TYPE_NUMBER])
+
+        timestamps = list()
+        values = list()
+        has_more = False
+
+        def add_rows(rows):
+            nonlocal has_more
+            for timestamp, value in rows:
+                if after is not None and timestamp <= after:
                     continue
+                if len(timestamps) >= limit:
+                    has_more = True
+                    return
+
+                timestamps.append(timestamp)
+                values.append(value)
+
+        sample_chunks = async_db_utils.iter_sample_chunks(topic.project, [topic], start, end, dataobjects=[dataobject])
+        async for samples in sample_chunks:
+            for chunk in timeseries.iter_wide_chunks(samples, [key]):
+                add_rows(resampler.add(chunk) if resampler else chunk)
+
+            if has_more:
+                break
+
+        if resampler and not has_more:
+            add_rows(resampler.finish())
+
+        data = {
+            "dataobject": dataobject.pk,
+            "data_type": dataobject.data_type,
+            "timestamp": timestamps,
+            "value": values,
+            "next": timestamps[-1] if has_more else None,
+        }
+        return self.api_response(request, data)
+
+
+class ApiLatestView(ApiViewsMixin, View):
+    """
+    Most recent sample of a data object, read from the latest value index
+    """
+    async def get(self, request, *args, **kwargs):
+        from .mongodb import async_db_utils
+
+        dataobject = await self.aget_data_object(kwargs["dataobject_id"])
+        if dataobject is None or not await self.has_project_access(dataobject.topic.project):
+            return self.api_error(request, "Data object not found", 404)
+
+        latest = await async_db_utils.get_latest_value(dataobject.topic.project, dataobject) or dict()
+        data = {
+            "dataobject": dataobject.pk,
+            "data_type": dataobject.data_type,
+            "timestamp": latest.get("timestamp", None),
+            "value": latest.get("value", None),
+        }
+        return self.api_response(request, data)
+
+
+class ApiGeoViewMixin:
+    default_limit = 1000
+    max_limit = 10000
+
+    def get_geo_filter(self, params):
+        """
+        Area filter from bbox=west,south,east,north or lon/lat/radius (meters) parameters
+        @return: query filter on "location", None for no area
+        @raise ValueError: invalid parameters
+        """
+        if params.get("bbox"):
+            return geo.within_filter("location", geo.parse_bbox(params["bbox"]))
+        if params.get("radius"):
+            if not params.get("lon") or not params.get("lat"):
+                raise ValueError("lon and lat required with radius")
+            return geo.radius_filter("location", float(params["lon"]), float(params["lat"]), float(params["radius"]))
+
+        return None
+
+    def get_limit(self, params):
+        limit = min(int(params.get("limit", self.default_limit)), self.max_limit)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+
+        return limit
+
+    async def aget_location_object(self, dataobject_id):
+        dataobject = await self.aget_data_object(dataobject_id)
+        if dataobject is None or not await self.has_project_access(dataobject.topic.project):
+            return None
+        if dataobject.data_type != DataObject.DATA_TYPE_LOCATION:
+            return None
 
-                obj_time = datetime.datetime.fromtimestamp(elem["timestamp"])
-                csv_row = (
-                    f"{obj_time}", f"{val}"
-                )
-                csv_rows.append(csv_row)
+        return dataobject
 
-        csv_writer_buffer = utils.CSVFileRowEcho()
-        csv_writer = csv.writer(csv_writer_buffer)
-        return StreamingHttpResponse(
-            (csv_writer.writerow(row) for row in csv_rows),
-            content_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename={}_{}".format(
-                dataobject.id, datetime.datetime.utcnow().toordinal())
-            }
+
+class ApiLocationsView(ApiGeoViewMixin, ApiViewsMixin, View):
+    """
+    Location samples of a location data object inside an area.
+    Parameters: bbox=west,south,east,north or lon, lat, radius (meters); start/end (ISO date/datetime), limit
+    """
+    async def get(self, request, *args, **kwargs):
+        from .mongodb import async_db_utils
+
+        dataobject = await self.aget_location_object(kwargs["dataobject_id"])
+        if dataobject is None:
+            return self.api_error(request, "Location data object not found", 404)
+
+        try:
+            start, end = utils.get_date_range(request.GET)
+            geo_filter = self.get_geo_filter(request.GET)
+            limit = self.get_limit(request.GET)
+        except ValueError as e:
+            return self.api_error(request, str(e), 400)
+
+        project = dataobject.topic.project
+        locations = await async_db_utils.get_locations(project, dataobject, geo_filter, start, end, limit)
+        return self.api_response(request, {"dataobject": dataobject.pk, "locations": locations})
+
+
+class ApiPositionsView(ApiGeoViewMixin, ApiViewsMixin, View):
+    """
+    Latest position per device of a location data object, optionally inside an area.
+    Parameters: bbox=west,south,east,north or lon, lat, radius (meters); limit
+    """
+    async def get(self, request, *args, **kwargs):
+        from .mongodb import async_db_utils
+
+        dataobject = await self.aget_location_object(kwargs["dataobject_id"])
+        if dataobject is None:
+            return self.api_error(request, "Location data object not found", 404)
+
+        try:
+            geo_filter = self.get_geo_filter(request.GET)
+            limit = self.get_limit(request.GET)
+        except ValueError as e:
+            return self.api_error(request, str(e), 400)
+
+        positions = await async_db_utils.get_positions(dataobject.topic.project, dataobject, geo_filter, limit)
+        return self.api_response(request, {"dataobject": dataobject.pk, "positions": positions})
+
+
+class ApiClustersView(ApiGeoViewMixin, ApiViewsMixin, View):
+    """
+    Map widget data: grid clusters (count, centroid) of a location data object for a zoom level.
+    Parameters: zoom (0-20), bbox=west,south,east,north or lon, lat, radius (meters), limit;
+    source=positions (latest per device, default) or locations with start/end (ISO date/datetime)
+    """
+    async def get(self, request, *args, **kwargs):
+        from .mongodb import async_db_utils
+
+        dataobject = await self.aget_location_object(kwargs["dataobject_id"])
+        if dataobject is None:
+            return self.api_error(request, "Location data object not found", 404)
+
+        try:
+            zoom = int(request.GET.get("zoom", 0))
+            history = request.GET.get("source", "positions") == "locations"
+            start, end = utils.get_date_range(request.GET)
+            geo_filter = self.get_geo_filter(request.GET)
+            limit = self.get_limit(request.GET)
+        except ValueError as e:
+            return self.api_error(request, str(e), 400)
+
+        if not 0 <= zoom <= geo.MAX_ZOOM:
+            return self.api_error(request, f"zoom must be between 0 and {geo.MAX_ZOOM}", 400)
+
+        clusters = await async_db_utils.get_clusters(
+            dataobject.topic.project, dataobject, zoom, geo_filter, start, end, history, limit
         )
+        data = {
+            "dataobject": dataobject.pk,
+            "zoom": zoom,
+            "cell_size": geo.get_cluster_cell_size(zoom),
+            "clusters": clusters,
+        }
+        return self.api_response(request, data)
+
+
+class ApiEventsView(ApiViewsMixin, View):
+    """
+    Latest alert events of a project, optionally of one data object (?dataobject=<id>)
+    """
+    default_limit = 100
+    max_limit = 1000
+
+    async def get(self, request, *args, **kwargs):
+        from .mongodb import async_db_utils
+
+        project = await self.aget_project(kwargs["project_id"])
+        if project is None or not await self.has_project_access(project):
+            return self.api_error(request, "Project not found", 404)
+
+        try:
+            limit = min(int(request.GET.get("limit", self.default_limit)), self.max_limit)
+            dataobject = request.GET.get("dataobject", None)
+            dataobjects = [int(dataobject)] if dataobject else None
+        except ValueError as e:
+            return self.api_error(request, str(e), 400)
+
+        if limit <= 0:
+            return self.api_error(request, "limit must be positive", 400)
+
+        events = await async_db_utils.get_events(project, dataobjects, limit)
+        return self.api_response(request, {"project": project.pk, "events": events})
 
 
 class RefreshConnectionsView(ViewsMixin, View):
@@ -703,18 +1480,9 @@ class RefreshConnectionsView(ViewsMixin, View):
     def get(self, request, *args, **kwargs):
         self.user = get_user(request)
         projects = self.get_projects()
-        for project in projects:
-            _client = mqtt_client_manager.get_client(project.pk)
-            if not _client:
-                mqtt_client_manager.add_client(
-                    client_id=project.pk,
-                    host=project.host,
-                    port=project.port
-                )
-
-        mqtt_client_manager.refresh_clients()
+        control.refresh()
         self.clear_context()
-        self.add_context_data("project_list", self.get_projects_param_list())
+        self.add_context_data("project_list", self.get_projects_param_list(projects))
         return self.render_template(request)
 
 
@@ -722,18 +1490,18 @@ class CheckConnectionView(View):
     connected_template = "dashboard/partials/ajax/project_connected.html"
     disconnected_template = "dashboard/partials/ajax/project_disconnected.html"
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         try:
             project_id = kwargs["project_id"]
         except KeyError:
             logging.error("Key error")
             return HttpResponse(status=404)
 
-        mqtt_client = mqtt_client_manager.get_client(int(project_id))
-        if not mqtt_client:
+        project = await Project.objects.filter(pk=project_id).only("pk", "connected").afirst()
+        if project is None:
             return HttpResponse(status=404)
 
-        if mqtt_client.connected:
-            return render(request, self.connected_template)
+        if await sync_to_async(control.is_connected)(project):
+            return await sync_to_async(render)(request, self.connected_template)
         else:
-            return render(request, self.disconnected_template)
+            return await sync_to_async(render)(request, self.disconnected_template)
@@ -17,4 +17,8 @@ django.setup()
 
 application = get_asgi_application()
 
+from dashboard import startup
+
+startup.run()
+
 
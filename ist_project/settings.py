@@ -112,6 +112,99 @@ if DEBUG:
 else:
     MONGODB_CONNECTION_URI = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 
+# MongoClient options, the client is created lazily once per process (see dashboard/mongodb)
+# Compressors need the matching optional packages (zstandard, python-snappy), zlib is always available
+MONGODB_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 50)),
+    "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+    "maxIdleTimeMS": int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 60000)),
+    "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+    "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+    "socketTimeoutMS": int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+    "readPreference": os.environ.get("MONGO_READ_PREFERENCE", "primary"),
+}
+if os.environ.get("MONGO_COMPRESSORS"):
+    MONGODB_CLIENT_OPTIONS["compressors"] = os.environ["MONGO_COMPRESSORS"]
+
+# Local disk spool for samples that could not be written to MongoDB, replayed once it is reachable again
+# fsync: always (every sample), interval (at most every MONGO_SPOOL_FSYNC_INTERVAL seconds) or never (OS decides)
+MONGODB_SPOOL = {
+    "enabled": os.environ.get("MONGO_SPOOL_ENABLED", "True") == "True",
+    "directory": os.environ.get("MONGO_SPOOL_DIR", str(BASE_DIR / "spool")),
+    "segment_size": int(os.environ.get("MONGO_SPOOL_SEGMENT_SIZE", 16 * 1024 * 1024)),
+    "fsync": os.environ.get("MONGO_SPOOL_FSYNC", "interval"),
+    "fsync_interval": float(os.environ.get("MONGO_SPOOL_FSYNC_INTERVAL", 1)),
+    "replay_batch_size": int(os.environ.get("MONGO_SPOOL_REPLAY_BATCH_SIZE", 1000)),
+    "retry_interval": float(os.environ.get("MONGO_SPOOL_RETRY_INTERVAL", 5)),
+    "write_timeout": float(os.environ.get("MONGO_SPOOL_WRITE_TIMEOUT", 0.5)),
+}
+
+# Cache (shared object-permission cache, see dashboard/permissions.py)
+REDIS_URL = os.environ.get("REDIS_URL", None)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    # Per process: permission version bumps are not seen by other workers, so with several processes a revoked
+    # permission stays cached until PERMISSION_CACHE_TIMEOUT. Set REDIS_URL for multi-process deployments.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get("PERMISSION_CACHE_TIMEOUT", 3600 if REDIS_URL else 30))
+
+# Restore MQTT clients of all projects when the ASGI application starts, or on first use in WSGI processes
+MQTT_RESTORE_ON_STARTUP = os.environ.get("MQTT_RESTORE_ON_STARTUP", "1") == "1"
+MQTT_RESTORE_WORKERS = int(os.environ.get("MQTT_RESTORE_WORKERS", 8))
+# Only the process holding this lock runs the MQTT clients, reconnect and alert threads
+MQTT_STARTUP_LOCK = os.environ.get("MQTT_STARTUP_LOCK", str(BASE_DIR / "mqtt.lock"))
+# Seconds between the lock holder applying project and topic changes made in other processes, 0 disables
+MQTT_SYNC_INTERVAL = float(os.environ.get("MQTT_SYNC_INTERVAL", 5))
+
+# Topic filters per SUBSCRIBE packet when (re)subscribing a project's topics
+MQTT_SUBSCRIBE_BATCH_SIZE = int(os.environ.get("MQTT_SUBSCRIBE_BATCH_SIZE", 100))
+
+# Broker reconnection: exponential backoff with jitter, capped concurrent attempts
+MQTT_RECONNECT = {
+    "min_delay": float(os.environ.get("MQTT_RECONNECT_MIN_DELAY", 1)),
+    "max_delay": float(os.environ.get("MQTT_RECONNECT_MAX_DELAY", 120)),
+    "max_concurrent": int(os.environ.get("MQTT_RECONNECT_MAX_CONCURRENT", 10)),
+    "check_interval": float(os.environ.get("MQTT_RECONNECT_CHECK_INTERVAL", 5)),
+}
+
+# Per-project queue between received messages and DB writes
+# policy: block (backpressure to the broker), drop_oldest, drop_newest or sample (keep 1 in sample_rate on overflow)
+MQTT_INGEST = {
+    "max_size": int(os.environ.get("MQTT_INGEST_MAX_SIZE", 10000)),
+    "policy": os.environ.get("MQTT_INGEST_POLICY", "block"),
+    "sample_rate": int(os.environ.get("MQTT_INGEST_SAMPLE_RATE", 10)),
+}
+
+# Alert rules: no-data check period, optional forwarding of events to the channel layer group "<prefix>_<project id>"
+MQTT_ALERTS = {
+    "check_interval": float(os.environ.get("MQTT_ALERTS_CHECK_INTERVAL", 10)),
+    "channel_layer": os.environ.get("MQTT_ALERTS_CHANNEL_LAYER", "False") == "True",
+    "group_prefix": os.environ.get("MQTT_ALERTS_GROUP_PREFIX", "alerts"),
+}
+
+# Duplicate suppression of QoS 1/2 redeliveries, the window is set per topic (Topic.dedup_window)
+MQTT_DEDUP = {
+    "max_entries": int(os.environ.get("MQTT_DEDUP_MAX_ENTRIES", 10000)),
+}
+
+# Per process ingest plans (topics, data objects, alert rules): changes made in other processes are seen through
+# a version in the shared cache checked every check_interval seconds, plans older than max_age are rebuilt anyway
+MQTT_PLAN_CACHE = {
+    "check_interval": float(os.environ.get("MQTT_PLAN_CHECK_INTERVAL", 1)),
+    "max_age": float(os.environ.get("MQTT_PLAN_MAX_AGE", 3600 if REDIS_URL else 30)),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
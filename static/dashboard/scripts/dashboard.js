@@ -44,6 +44,9 @@ function afterSwapEvtListener(e) {
             case "edit-dataobject-dialog":
             	showModal("edit-dataobject-dialog");
             	return;
+            case "new-alertrule-dialog":
+            	showModal("new-alertrule-dialog");
+            	return;
             default:
                 break;
         }
@@ -77,6 +80,10 @@ function beforeSwapEvtListener(e) {
             	hideModal("edit-dataobject-dialog");
             	window.location.reload();
             	break;
+            case "new-alertrule-dialog":
+            	hideModal("new-alertrule-dialog");
+            	window.location.reload();
+            	break;
             default:
                 // statements_def
                 break;